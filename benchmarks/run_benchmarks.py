@@ -0,0 +1,625 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the build and check scripts
+Runs each case on synthetic inputs in its own process and compares
+wall time, peak RSS, probe rate and output sizes with a stored baseline
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import struct
+import argparse
+import tempfile
+import ipaddress
+import threading
+import subprocess
+import importlib.util
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+SCRIPTS_DIR = REPO_ROOT / 'scripts'
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+
+CASES = ['parse_dat', 'fetch_cache', 'build_dat', 'build_dat_cached', 'import_filters', 'check_domains',
+         'check_ips_cidr', 'dns_probe']
+
+# Allowed growth over baseline before a metric counts as a regression
+TOLERANCE = {
+    'wall_sec': 0.25,
+    'warm_sec': 0.25,
+    'peak_rss_kb': 0.20,
+    'output_bytes': 0.02,
+    'probes_per_sec': 0.25,  # lower is worse for the rates
+    'lines_per_sec': 0.25,
+}
+RATE_METRICS = {'probes_per_sec', 'lines_per_sec'}
+
+
+def load_module(name, path):
+    """Import a script by path (check-domains.py is not a valid module name)"""
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# --- Synthetic inputs ---
+
+def synthetic_domains(count, seed=1):
+    rng = random.Random(seed)
+    tlds = ['ru', 'com', 'net', 'org', 'su', 'xn--p1ai']
+    alphabet = 'abcdefghijklmnopqrstuvwxyz0123456789'
+    for i in range(count):
+        label = ''.join(rng.choice(alphabet) for _ in range(rng.randint(4, 12)))
+        if i % 4 == 0:
+            yield f"{rng.choice(['www', 'cdn', 'api', 'static'])}.{label}{i}.{rng.choice(tlds)}"
+        else:
+            yield f"{label}{i}.{rng.choice(tlds)}"
+
+
+def synthetic_cidrs(count, seed=2):
+    rng = random.Random(seed)
+    for _ in range(count):
+        prefix = rng.choice([16, 20, 22, 24, 24, 24, 28, 32])
+        address = rng.randrange(1 << 24, 223 << 24)
+        network = ipaddress.IPv4Network((address, prefix), strict=False)
+        yield str(network)
+
+
+def prepare_inputs(workdir, domain_count, cidr_count):
+    """Write whitelist sources and synthetic upstream .dat files into workdir"""
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    import build_dat
+
+    domains_dir = workdir / 'domains'
+    ips_dir = workdir / 'IPs'
+    upstream_dir = workdir / 'upstream'
+    for directory in (domains_dir, ips_dir, upstream_dir):
+        directory.mkdir(parents=True, exist_ok=True)
+
+    half = domain_count // 2
+    domains = list(synthetic_domains(domain_count))
+    with open(domains_dir / 'synthetic', 'w', encoding='utf-8') as f:
+        for domain in domains[half:]:
+            f.write(domain + '\n')
+
+    cidrs = list(synthetic_cidrs(cidr_count))
+    with open(ips_dir / 'synthetic.txt', 'w', encoding='utf-8') as f:
+        for cidr in cidrs[cidr_count // 2:]:
+            f.write(cidr + '\n')
+
+    with redirect_stdout(open(os.devnull, 'w')):
+        geosite = build_dat.common_pb2.GeoSiteList()
+        geosite.entry.append(build_dat.create_geosite_entry(
+            'category-ru', [('domain', d) for d in domains[:half]]))
+        geosite.entry.append(build_dat.create_geosite_entry('unused', [('full', 'example.com')]))
+        geoip = build_dat.common_pb2.GeoIPList()
+        geoip.entry.append(build_dat.create_geoip_entry('ru', cidrs[:cidr_count // 2]))
+        geoip.entry.append(build_dat.create_geoip_entry('private', ['10.0.0.0/8', '192.168.0.0/16']))
+
+    (upstream_dir / 'geosite.dat').write_bytes(geosite.SerializeToString())
+    (upstream_dir / 'geoip.dat').write_bytes(geoip.SerializeToString())
+
+
+# --- Local stand-in targets ---
+
+class StandInListener:
+    """Loopback TCP listener that accepts and immediately closes connections"""
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1024)
+        self.port = self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+class StandInDNSServer:
+    """
+    Loopback UDP resolver for synthetic names: nx* -> NXDOMAIN, empty* -> NODATA,
+    anything else -> one A record; the first query for lost* names is dropped
+    """
+
+    def __init__(self):
+        sys.path.insert(0, str(SCRIPTS_DIR))
+        import dns_probe
+        self.dns_probe = dns_probe
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        self.sock.bind(('127.0.0.1', 0))
+        self.address = self.sock.getsockname()
+        self.dropped = set()
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        header = self.dns_probe.HEADER
+        while True:
+            try:
+                query, peer = self.sock.recvfrom(512)
+            except OSError:
+                return
+            query_id, _, _, _, _, _ = header.unpack_from(query)
+            name, end = self.dns_probe.read_name(query, header.size)
+            question = query[header.size:end + 4]
+            if name.startswith('lost') and name not in self.dropped:
+                self.dropped.add(name)
+                continue
+            if name.startswith('nx'):
+                reply = header.pack(query_id, 0x8183, 1, 0, 0, 0) + question
+            elif name.startswith('empty'):
+                reply = header.pack(query_id, 0x8180, 1, 0, 0, 0) + question
+            else:
+                answer = b'\xc0\x0c' + struct.pack('>HHIH', 1, 1, 300, 4) + socket.inet_aton('127.0.0.1')
+                reply = header.pack(query_id, 0x8180, 1, 1, 0, 0) + question + answer
+            self.sock.sendto(reply, peer)
+
+    def close(self):
+        self.sock.close()
+
+
+class StandInReleaseServer:
+    """
+    Loopback HTTP stand-in for the GitHub releases API and asset downloads:
+    serves files of a directory with ETag, 304 Not Modified and byte ranges,
+    and counts requests by (method, path, status)
+    """
+
+    def __init__(self, repo, files_dir):
+        # Imported here: together they add ~10 MB to the RSS of every case process otherwise
+        import hashlib
+        import http.server
+        self.sha256 = hashlib.sha256
+        self.repo = repo
+        self.files = {path.name: path.read_bytes() for path in files_dir.iterdir() if path.suffix == '.dat'}
+        self.requests = []
+        stand_in = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                stand_in.handle(self, body=False)
+
+            def do_GET(self):
+                stand_in.handle(self, body=True)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def release(self):
+        assets = []
+        for index, (name, data) in enumerate(sorted(self.files.items())):
+            assets.append({'id': 1000 + index, 'name': name, 'size': len(data),
+                           'digest': 'sha256:' + self.sha256(data).hexdigest(),
+                           'browser_download_url': f"{self.url}/download/{name}"})
+        return json.dumps({'tag_name': 'bench', 'assets': assets}).encode()
+
+    def handle(self, request, body):
+        if request.path == f"/repos/{self.repo}/releases/latest":
+            data = self.release()
+        elif request.path.startswith('/download/') and request.path[10:] in self.files:
+            data = self.files[request.path[10:]]
+        else:
+            return self.reply(request, 404, b'', {}, body)
+
+        etag = f'"{self.sha256(data).hexdigest()[:16]}"'
+        headers = {'ETag': etag, 'Accept-Ranges': 'bytes'}
+        if request.headers.get('If-None-Match') == etag:
+            return self.reply(request, 304, b'', headers, body)
+        ranges = request.headers.get('Range')
+        if ranges and request.headers.get('If-Range', etag) == etag:
+            start, end = (int(value) for value in ranges.split('=')[1].split('-'))
+            headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+            return self.reply(request, 206, data[start:end + 1], headers, body)
+        return self.reply(request, 200, data, headers, body)
+
+    def reply(self, request, status, data, headers, body):
+        self.requests.append((request.command, request.path, status))
+        request.send_response(status)
+        for name, value in headers.items():
+            request.send_header(name, value)
+        request.send_header('Content-Length', str(len(data)))
+        request.end_headers()
+        if body:
+            request.wfile.write(data)
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def install_fake_resolver(mapping):
+    """Resolve synthetic names to loopback addresses without touching DNS
+
+    check-domains.py resolves through socket.getaddrinfo, which always asks the
+    system resolver, so the names are answered by patching getaddrinfo rather
+    than by StandInDNSServer (that one serves the batched UDP client)
+    """
+    real_getaddrinfo = socket.getaddrinfo
+
+    def fake_getaddrinfo(host, port, *args, **kwargs):
+        if host in mapping:
+            address = mapping[host]
+            if address is None:
+                raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (address, port))]
+        return real_getaddrinfo(host, port, *args, **kwargs)
+
+    socket.getaddrinfo = fake_getaddrinfo
+
+
+# --- Cases (each runs in a fresh child process) ---
+
+def case_parse_dat(workdir, args):
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    import parse_dat
+
+    output_dir = workdir / 'output'
+    output_dir.mkdir(exist_ok=True)
+    with redirect_stdout(open(os.devnull, 'w')):
+        geosite_data = parse_dat.parse_geosite_dat(workdir / 'upstream' / 'geosite.dat', ['category-ru'])
+        geoip_data = parse_dat.parse_geoip_dat(workdir / 'upstream' / 'geoip.dat', ['ru', 'private'])
+
+    geosite_extracted = parse_dat.common_pb2.GeoSiteList()
+    geosite_extracted.entry.extend(geosite_data.values())
+    geoip_extracted = parse_dat.common_pb2.GeoIPList()
+    geoip_extracted.entry.extend(geoip_data.values())
+
+    outputs = {
+        'extracted_geosite.dat': geosite_extracted.SerializeToString(),
+        'extracted_geoip.dat': geoip_extracted.SerializeToString(),
+    }
+    for name, data in outputs.items():
+        (output_dir / name).write_bytes(data)
+    return {'output_bytes': sum(len(data) for data in outputs.values())}
+
+
+def case_fetch_cache(workdir, args):
+    """
+    Run parse_dat twice against a local release stand-in via --api-url:
+    the cold run downloads in ranges and extracts, the warm run must get a
+    304 for the release and reuse the downloads and the extraction
+    """
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    import parse_dat
+
+    repo = 'bench/rules-dat'
+    server = StandInReleaseServer(repo, workdir / 'upstream')
+    output_dir = workdir / 'fetch-output'
+    shutil.rmtree(output_dir, ignore_errors=True)
+    argv = ['parse_dat.py', '--source-repo', repo, '--api-url', server.url, '--output-dir', str(output_dir),
+            '--geosite-categories', 'category-ru', '--geoip-categories', 'ru', 'private']
+
+    timings = []
+    requests_seen = []
+    for _ in range(2):
+        sys.argv = argv
+        start = time.perf_counter()
+        with redirect_stdout(open(os.devnull, 'w')):
+            parse_dat.main()
+        timings.append(time.perf_counter() - start)
+        requests_seen.append(server.requests)
+        server.requests = []
+    server.close()
+
+    cold, warm = requests_seen
+    if not any(status == 206 for _, _, status in cold):
+        raise SystemExit("fetch_cache: cold run did not use ranged downloads")
+    if [status for _, _, status in warm] != [304]:
+        raise SystemExit(f"fetch_cache: warm run made unexpected requests {warm}")
+    return {'cold_sec': round(timings[0], 3), 'warm_sec': round(timings[1], 3),
+            'requests': len(cold) + len(warm),
+            'output_bytes': (output_dir / 'extracted_geosite.dat').stat().st_size
+            + (output_dir / 'extracted_geoip.dat').stat().st_size}
+
+
+def case_build_dat(workdir, args):
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    import build_dat
+
+    output_dir = workdir / 'output'
+    if not (output_dir / 'extracted_geosite.dat').exists():
+        case_parse_dat(workdir, args)
+
+    with redirect_stdout(open(os.devnull, 'w')):
+        build_dat.build_geosite_dat(output_dir / 'extracted_geosite.dat', workdir / 'domains',
+                                    workdir / 'no-ads', output_dir / 'geosite.dat')
+        build_dat.build_geoip_dat(output_dir / 'extracted_geoip.dat', workdir / 'IPs',
+                                  output_dir / 'geoip.dat')
+
+    return {'output_bytes': (output_dir / 'geosite.dat').stat().st_size
+            + (output_dir / 'geoip.dat').stat().st_size}
+
+
+def case_build_dat_cached(workdir, args):
+    """Build twice with a serialization cache: cold fills it, warm reuses every category"""
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    import build_dat
+
+    output_dir = workdir / 'output'
+    if not (output_dir / 'extracted_geosite.dat').exists():
+        case_parse_dat(workdir, args)
+    cache_dir = workdir / 'cache'
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        with redirect_stdout(open(os.devnull, 'w')):
+            build_dat.build_geosite_dat(output_dir / 'extracted_geosite.dat', workdir / 'domains',
+                                        workdir / 'no-ads', output_dir / 'geosite.dat', cache_dir / 'geosite')
+            build_dat.build_geoip_dat(output_dir / 'extracted_geoip.dat', workdir / 'IPs',
+                                      output_dir / 'geoip.dat', cache_dir / 'geoip')
+        timings.append(time.perf_counter() - start)
+
+    return {'cold_sec': round(timings[0], 3), 'warm_sec': round(timings[1], 3),
+            'output_bytes': (output_dir / 'geosite.dat').stat().st_size
+            + (output_dir / 'geoip.dat').stat().st_size}
+
+
+def case_import_filters(workdir, args):
+    """
+    Import a synthetic filter mixing AdGuard, hosts and prefixed domain list
+    lines (with @attributes), then the repo's own domains/ads lists, which
+    must import without a single invalid line
+    """
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    import import_filters
+
+    formats = ['||{}^', '0.0.0.0 {}', ':: {}', 'full:{} @ads', 'domain:{} @ads', '{}', '@@||{}^']
+    filter_path = workdir / 'filter.txt'
+    count = args.domains // 10
+    with open(filter_path, 'w', encoding='utf-8') as f:
+        f.write('! synthetic filter\n')
+        for i, domain in enumerate(synthetic_domains(count, seed=3)):
+            f.write(formats[i % len(formats)].format(domain) + '\n')
+
+    stats = {'lines': 0, 'rules': 0, 'exceptions': 0, 'skipped': {}}
+    start = time.perf_counter()
+    suffixes, fulls, important, exceptions = import_filters.read_filters([filter_path], stats)
+    suffixes, fulls, _ = import_filters.apply_exceptions(suffixes, fulls, important, exceptions)
+    suffixes, fulls = import_filters.minimize(suffixes, fulls)
+    elapsed = time.perf_counter() - start
+
+    expected_exceptions = sum(1 for i in range(count) if i % len(formats) == len(formats) - 1)
+    if stats['skipped'] or stats['exceptions'] != expected_exceptions \
+            or stats['rules'] != count - expected_exceptions:
+        raise SystemExit(f"import_filters: synthetic lines misparsed {stats}")
+
+    repo_stats = {'lines': 0, 'rules': 0, 'exceptions': 0, 'skipped': {}}
+    import_filters.read_filters(sorted((REPO_ROOT / 'domains' / 'ads').iterdir()), repo_stats)
+    if repo_stats['skipped'].get('invalid'):
+        raise SystemExit(f"import_filters: domains/ads lines rejected {repo_stats['skipped']}")
+
+    return {'rules': len(suffixes) + len(fulls), 'lines_per_sec': stats['lines'] / elapsed}
+
+
+def case_check_domains(workdir, args):
+    checker = load_module('check_domains', REPO_ROOT / 'check-domains.py')
+    listener = StandInListener()
+
+    # Three quarters of targets are alive, the rest resolve to nothing
+    targets = [f"host{i}.bench.test" for i in range(args.probes)]
+    install_fake_resolver({
+        target: '127.0.0.1' if i % 4 else None for i, target in enumerate(targets)
+    })
+    checker.DEFAULT_PORTS = [listener.port]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=checker.MAX_WORKERS) as executor:
+        alive = sum(executor.map(lambda target: checker.check_domain(target)[1], targets))
+    elapsed = time.perf_counter() - start
+    listener.close()
+
+    expected = sum(1 for i in range(len(targets)) if i % 4)
+    if alive != expected:
+        raise SystemExit(f"check_domains: {alive} targets alive, expected {expected}")
+
+    return {'probes': len(targets), 'alive': alive, 'probes_per_sec': len(targets) / elapsed}
+
+
+def install_stand_in_ping(workdir):
+    """
+    Put a stand-in ping first on PATH: replies at once for every address
+    except those ending in .0/.4/.8..., which fail at once, so the case
+    measures the checker rather than the network or the local ping binary
+    """
+    bin_dir = workdir / 'bin'
+    bin_dir.mkdir(exist_ok=True)
+    ping = bin_dir / 'ping'
+    ping.write_text(
+        '#!/bin/sh\n'
+        'for a; do last=$a; done\n'
+        'case $(( ${last##*.} % 4 )) in\n'
+        '  0) exit 1;;\n'
+        'esac\n'
+        'echo "64 bytes from $last: icmp_seq=1 ttl=64 time=0.05 ms"\n'
+    )
+    ping.chmod(0o755)
+    os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+
+
+def case_check_ips_cidr(workdir, args):
+    install_stand_in_ping(workdir)
+    checker = load_module('check_ips_cidr', REPO_ROOT / 'check_ips_cidr.py')
+    results_dir = workdir / 'IPchecked'
+    results_dir.mkdir(exist_ok=True)
+
+    network = ipaddress.ip_network('127.0.0.0/16')
+    ips = [str(ip) for _, ip in zip(range(args.probes), network.hosts())]
+
+    start = time.perf_counter()
+    with redirect_stdout(open(os.devnull, 'w')):
+        checker.ping_ip_list(ips, 'bench.txt', 300, str(results_dir))
+    elapsed = time.perf_counter() - start
+
+    output = results_dir / 'available_ips_from_bench.txt'
+    return {'probes': len(ips), 'probes_per_sec': len(ips) / elapsed,
+            'output_bytes': output.stat().st_size if output.exists() else 0}
+
+
+def case_dns_probe(workdir, args):
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    import dns_probe
+
+    server = StandInDNSServer()
+    # Batches are cheap, so resolve ten times the probe count
+    prefixes = ['host', 'host', 'nx', 'empty', 'host', 'nx', 'host', 'lost']
+    names = [f"{prefixes[i % len(prefixes)]}{i}.bench.test" for i in range(args.probes * 10)]
+
+    start = time.perf_counter()
+    with dns_probe.BatchResolver(server.address, timeout=0.2) as resolver:
+        results = resolver.resolve(names)
+    elapsed = time.perf_counter() - start
+    server.close()
+
+    expected = {'host': 'NOERROR', 'nx': 'NXDOMAIN', 'empty': 'NODATA', 'lost': 'NOERROR'}
+    wrong = sum(1 for i, name in enumerate(names)
+                if results.get(name) != expected[prefixes[i % len(prefixes)]])
+    if wrong:
+        raise SystemExit(f"dns_probe: {wrong} names misclassified")
+    return {'probes': len(names), 'probes_per_sec': len(names) / elapsed}
+
+
+def run_case(name, workdir, args):
+    """Run one case in a child process and attach wall time and peak RSS"""
+    command = [sys.executable, __file__, '--run-case', name, '--workdir', str(workdir),
+               '--domains', str(args.domains), '--cidrs', str(args.cidrs),
+               '--probes', str(args.probes)]
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE)
+    stdout = proc.stdout.read()
+    _, status, rusage = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    if proc.returncode != 0:
+        return {'error': f"exit code {proc.returncode}"}
+
+    result = json.loads(stdout.decode().strip().splitlines()[-1])
+    if 'skipped' not in result:
+        result['wall_sec'] = round(wall, 3)
+        result['peak_rss_kb'] = rusage.ru_maxrss
+    return result
+
+
+def compare(results, baseline):
+    """Return a list of human-readable regressions against baseline"""
+    regressions = []
+    for case, metrics in results.items():
+        base = baseline.get(case, {})
+        for metric, tolerance in TOLERANCE.items():
+            if metric not in metrics or metric not in base or not base[metric]:
+                continue
+            current, previous = metrics[metric], base[metric]
+            if metric in RATE_METRICS:
+                change = (previous - current) / previous
+            else:
+                change = (current - previous) / previous
+            if change > tolerance:
+                regressions.append(f"{case}.{metric}: {previous} → {round(current, 3)} "
+                                   f"({change:+.0%}, limit {tolerance:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark build and check scripts')
+    parser.add_argument('--cases', nargs='+', default=CASES, choices=CASES,
+                        help='Cases to run')
+    parser.add_argument('--domains', type=int, default=1_000_000,
+                        help='Number of synthetic domains')
+    parser.add_argument('--cidrs', type=int, default=500_000,
+                        help='Number of synthetic CIDR blocks')
+    parser.add_argument('--probes', type=int, default=2000,
+                        help='Number of probes for check script cases')
+    parser.add_argument('--baseline', default=str(BASELINE_PATH),
+                        help='Baseline JSON to compare against')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Store this run as the new baseline')
+    parser.add_argument('--output', help='Write results JSON to this path')
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    parser.add_argument('--run-case', help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.run_case == 'prepare':
+        prepare_inputs(Path(args.workdir), args.domains, args.cidrs)
+        return 0
+    if args.run_case:
+        result = globals()[f"case_{args.run_case}"](Path(args.workdir), args)
+        print(json.dumps(result))
+        return 0
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='dat-bench-') as tmp:
+        workdir = Path(tmp)
+        print(f"Generating {args.domains} domains and {args.cidrs} CIDR blocks...")
+        # Generate in a child too: ru_maxrss survives fork+exec, so a large
+        # parent would inflate every case's peak RSS
+        subprocess.run([sys.executable, __file__, '--run-case', 'prepare', '--workdir', str(workdir),
+                        '--domains', str(args.domains), '--cidrs', str(args.cidrs)], check=True)
+
+        for case in args.cases:
+            print(f"\n=== {case} ===")
+            result = run_case(case, workdir, args)
+            results[case] = result
+            for metric, value in result.items():
+                print(f"  {metric}: {round(value, 3) if isinstance(value, float) else value}")
+
+    results['_params'] = {'domains': args.domains, 'cidrs': args.cidrs, 'probes': args.probes}
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + '\n')
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline_path.write_text(json.dumps(results, indent=2) + '\n')
+        print(f"\n✓ Baseline saved to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"\n⚠ No baseline at {baseline_path}, run with --update-baseline")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline.get('_params') != results['_params']:
+        print(f"\n⚠ Baseline was recorded with {baseline.get('_params')}, sizes are not comparable")
+        return 0
+
+    regressions = compare(results, baseline)
+    if regressions:
+        print("\n❌ Regressions against baseline:")
+        for line in regressions:
+            print(f"  - {line}")
+        return 1
+
+    print("\n✅ No regressions against baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,76 +1,106 @@
 #!/usr/bin/env python3
 import sys
+import re
+import ssl
+import errno
+import math
+import time
+import argparse
 import subprocess
 import socket
+import threading
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Tuple, Dict, List
 
+# Общие модули лежат в scripts/
+sys.path.insert(0, str(Path(__file__).parent / "scripts"))
+from profiling import add_profile_arguments, start_from_args, stage
+from sharding import add_shard_arguments, select_shard, write_shard_results, merge_shard_results
+from watch_mode import add_watch_arguments, run_watch
+from adaptive_timeout import RttEstimator, add_timeout_arguments, start_history
+from result_log import add_result_log_arguments, open_result_log
+from dns_probe import DNS_PORT, BatchResolver, parse_resolver
+
 # === НАСТРОЙКИ ===
 SRC_DIR = Path("./domains/ru")
 PING_COUNT = 4
-PING_TIMEOUT_SEC = 5
+PING_TIMEOUT_SEC = 5  # верхняя граница ожидания ответа на ping; обычно берётся по истории RTT
 MAX_WORKERS = 10
-TCP_TIMEOUT = 6  # секунд на попытку подключиться к порту
+TCP_TIMEOUT = 6  # верхняя граница на попытку подключиться к порту; обычно берётся по истории RTT
+TCP_TIMEOUT_MIN = 0.3  # нижняя граница адаптивного таймаута
 DEFAULT_PORTS = [443, 80, 8080, 8443]  # Порты, которые проверяем по TCP
 EXCLUDE_FILES = {"category-ru", "private", "category-whitelist-ru"}
+TLS_PORT = 443
+TLS_TIMEOUT = 6  # секунд на TCP-подключение и TLS-рукопожатие
+TLS_MAX_INFLIGHT = 8  # одновременных TLS-рукопожатий (остальные потоки ждут)
+WATCH_RECHECK_INTERVAL = 6 * 3600  # в режиме --watch каждый домен перепроверяется раз в столько секунд
+DNS_ALIVE_STATUSES = {"NOERROR", "NODATA"}  # имя существует (NODATA — нет A-записи, но домен есть)
 # =================
 
+# Общий TLS-контекст: проверяем цепочку сертификатов, имя сверяем сами,
+# чтобы отличать «чужой» сертификат от ошибки соединения
+TLS_CONTEXT = ssl.create_default_context()
+TLS_CONTEXT.check_hostname = False
+# (IP, SNI) -> последняя TLS-сессия. Сессия другого имени на том же IP не годится:
+# при возобновлении getpeercert() вернёт сертификат того имени.
+TLS_SESSIONS: Dict[Tuple[str, str], ssl.SSLSession] = {}
+TLS_SESSIONS_LOCK = threading.Lock()
+TLS_INFLIGHT = threading.BoundedSemaphore(TLS_MAX_INFLIGHT)
 
-def load_domains_from_file(filepath: Path) -> Tuple[List[str], List[str]]:
-    """
-    Читает файл и возвращает два списка:
-    1. Список ASCII-доменов для проверки (включая из закомментированных строк)
-    2. Все исходные строки файла (для последующей записи)
-    """
-    original_lines = []
-    domains_to_check = []
-
-    def extract_domain_from_line(line: str) -> str | None:
-        """Извлекает домен из строки, даже если она закомментирована."""
-        stripped = line.strip()
-        # Убираем начальный '#', если есть
-        if stripped.startswith('#'):
-            content = stripped[1:].strip()
-        else:
-            content = stripped
+# SRTT/RTTVAR по IP и по /24: таймаут = SRTT + 4·RTTVAR в пределах [мин, TCP_TIMEOUT]
+TCP_RTT = RttEstimator(TCP_TIMEOUT_MIN, TCP_TIMEOUT)
+PING_RTT = RttEstimator(1, PING_TIMEOUT_SEC)
+RESULT_LOG = None  # --results-jsonl: по записи на домен сразу после вердикта
+PING_RTT_PATTERN = re.compile(r"[=<]\s*([\d.]+)\s*ms")
 
-        # Убираем inline-комментарии
-        content = content.split('#')[0].strip()
 
-        if not content:
-            return None
+DomainLocations = Dict[str, List[Tuple[Path, int]]]
 
-        # Извлекаем чистый домен
-        temp_domain = content.split("://")[-1].split("/")[0].split(":")[0].strip().lower()
-        if temp_domain and '.' in temp_domain:
-            try:
-                return temp_domain.encode('idna').decode('ascii')
-            except (UnicodeError, UnicodeDecodeError):
-                print(f"   ⚠️  Пропущена строка '{line.strip()}': '{temp_domain}' (ошибка преобразования IDN)")
-                return None
+
+def extract_domain_from_line(line: str, warn: bool = True) -> str | None:
+    """Извлекает ASCII-домен из строки, даже если она закомментирована."""
+    stripped = line.strip()
+    # Убираем начальный '#', если есть
+    if stripped.startswith('#'):
+        content = stripped[1:].strip()
+    else:
+        content = stripped
+
+    # Убираем inline-комментарии и атрибуты вроде '@ads' после домена
+    content = content.split('#')[0].strip()
+
+    if not content:
         return None
+    content = content.split()[0]
+
+    # Извлекаем чистый домен
+    temp_domain = content.split("://")[-1].split("/")[0].split(":")[0].strip().lower()
+    if temp_domain and '.' in temp_domain:
+        try:
+            return temp_domain.encode('idna').decode('ascii')
+        except (UnicodeError, UnicodeDecodeError):
+            if warn:
+                print(f"   ⚠️  Пропущена строка '{line.strip()}': '{temp_domain}' (ошибка преобразования IDN)")
+            return None
+    return None
 
+
+def scan_domain_file(filepath: Path) -> Tuple[List[Tuple[str, int]], List[str]]:
+    """
+    Читает файл и возвращает:
+    1. Пары (ASCII-домен, номер строки с нуля), включая закомментированные строки
+    2. Все исходные строки файла (для последующей записи)
+    """
+    all_lines = None
     try:
         with open(filepath, "r", encoding="utf-8") as file:
             all_lines = file.readlines()
-        for line in all_lines:
-            original_lines.append(line)
-            domain = extract_domain_from_line(line)
-            if domain:
-                domains_to_check.append(domain)
     except UnicodeDecodeError:
         print(f"   ⚠️  Ошибка кодировки в файле {filepath.name}, пробую cp1251...")
         try:
             with open(filepath, "r", encoding="cp1251") as file:
                 all_lines = file.readlines()
-            original_lines.clear()
-            domains_to_check.clear()
-            for line in all_lines:
-                original_lines.append(line)
-                domain = extract_domain_from_line(line)
-                if domain:
-                    domains_to_check.append(domain)
         except Exception as e:
             print(f"   ❌ Не удалось прочитать файл {filepath.name} ни с utf-8, ни с cp1251: {e}")
             return [], []
@@ -78,12 +108,26 @@ def load_domains_from_file(filepath: Path) -> Tuple[List[str], List[str]]:
         print(f"   ❌ Ошибка чтения {filepath.name}: {e}")
         return [], []
 
-    return domains_to_check, original_lines
+    found = []
+    for line_no, line in enumerate(all_lines):
+        domain = extract_domain_from_line(line)
+        if domain:
+            found.append((domain, line_no))
+    return found, all_lines
+
+
+def load_domains_from_file(filepath: Path) -> Tuple[List[str], List[str]]:
+    """Список доменов файла (включая закомментированные) и все его строки."""
+    found, original_lines = scan_domain_file(filepath)
+    return [domain for domain, _ in found], original_lines
 
 
-def load_domains() -> Tuple[Dict[str, Path], List[str]]:
-    domain_to_file_map = {}
-    unique_domains = set()
+def load_domains() -> Tuple[DomainLocations, List[str]]:
+    """
+    Один проход по SRC_DIR (по умолчанию domains/ru): домен -> все его вхождения [(файл, строка)].
+    Каждый уникальный домен проверяется один раз, вердикт пишется во все вхождения.
+    """
+    domain_locations: DomainLocations = {}
 
     if not SRC_DIR.exists():
         print(f"❌ Папка '{SRC_DIR}' не найдена.")
@@ -101,230 +145,454 @@ def load_domains() -> Tuple[Dict[str, Path], List[str]]:
     print(f"📂 Найдено {len(domain_files)} файл(ов) для проверки: {[f.name for f in domain_files]}")
     print(f"   (исключены: {list(EXCLUDE_FILES)})")
 
-    for f in domain_files:
+    for f in sorted(domain_files):
         print(f"   Обработка файла: {f.name}")
-        domains_in_file, _ = load_domains_from_file(f)
-        for domain in domains_in_file:
-            if domain not in domain_to_file_map:
-                domain_to_file_map[domain] = f
-            unique_domains.add(domain)
+        found, _ = scan_domain_file(f)
+        for domain, line_no in found:
+            domain_locations.setdefault(domain, []).append((f, line_no))
 
-    if not unique_domains:
+    if not domain_locations:
         print("笼罩 Нет валидных доменов для проверки.")
         sys.exit(0)
 
-    print(f"✅ Всего уникальных доменов: {len(unique_domains)}")
-    return domain_to_file_map, list(unique_domains)
+    duplicated = sum(1 for locations in domain_locations.values() if len(locations) > 1)
+    print(f"✅ Всего уникальных доменов: {len(domain_locations)}")
+    if duplicated:
+        print(f"🔁 {duplicated} домен(ов) встречаются в нескольких местах — проверяются один раз, "
+              f"статус меняется во всех вхождениях")
+    return domain_locations, list(domain_locations)
 
 
-def check_tcp_port(domain: str, port: int) -> bool:
+def resolve_addresses(domain: str) -> List[str]:
+    """IP-адреса домена: IPv4 первыми, как и раньше перебираются по очереди."""
     try:
-        with socket.create_connection((domain, port), timeout=TCP_TIMEOUT):
-            return True
-    except (socket.timeout, socket.gaierror, ConnectionRefusedError, OSError):
-        return False
-
-
-def check_domain(domain: str) -> Tuple[str, bool]:
-    for port in DEFAULT_PORTS:
-        if check_tcp_port(domain, port):
-            return domain, True
-
+        infos = socket.getaddrinfo(domain, None, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError, OSError):
+        return []
+    addresses = []
+    for family, _, _, _, sockaddr in sorted(infos, key=lambda info: info[0] != socket.AF_INET):
+        if sockaddr[0] not in addresses:
+            addresses.append(sockaddr[0])
+    return addresses
+
+
+def connect_error_class(error: OSError) -> str:
+    """Класс ошибки подключения для журнала результатов."""
+    if isinstance(error, ConnectionRefusedError):
+        return "refused"
+    if error.errno in (errno.ENETUNREACH, errno.EHOSTUNREACH):
+        return "unreachable"
+    return "error"
+
+
+def connect_once(ip: str, port: int, timeout: float) -> Tuple[str, float | None]:
+    """Одна попытка TCP-подключения: ('ok', RTT) или (класс ошибки, None)."""
+    start = time.perf_counter()
     try:
-        cmd = ["ping", "-c", str(PING_COUNT), "-W", str(PING_TIMEOUT_SEC), domain]
-        result = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=PING_TIMEOUT_SEC * PING_COUNT + 2)
-        if result.returncode == 0:
-            return domain, True
-    except (subprocess.TimeoutExpired, subprocess.SubprocessError, OSError):
-        pass
+        with socket.create_connection((ip, port), timeout=timeout):
+            rtt = time.perf_counter() - start
+            TCP_RTT.observe(ip, rtt)
+            return "ok", rtt
+    except socket.timeout:
+        return "timeout", None
+    except OSError as e:
+        return connect_error_class(e), None
 
-    return domain, False
 
-
-def comment_out_domain_in_file(filepath: Path, domain_to_comment: str):
-    """Комментирует домен, если он ещё не закомментирован."""
+def check_tcp_port(addresses: List[str], port: int) -> Tuple[bool, float | None, str | None]:
+    """
+    Подключение к порту с таймаутом по истории RTT адреса (или его /24).
+    Пограничный случай — истёк адаптивный таймаут — повторяется один раз
+    с удвоенным таймаутом (не дольше TCP_TIMEOUT), а для адреса без своей
+    истории, взявшего таймаут у /24, — сразу с TCP_TIMEOUT.
+    Возвращает (доступен, RTT, класс последней ошибки).
+    """
+    error = None
+    for ip in addresses:
+        timeout = TCP_RTT.timeout(ip)
+        result, rtt = connect_once(ip, port, timeout)
+        if result == "timeout":
+            retry_timeout = TCP_RTT.retry_timeout(ip, timeout)
+            if retry_timeout:
+                result, rtt = connect_once(ip, port, retry_timeout)
+        if result == "ok":
+            return True, rtt, None
+        error = result
+    return False, None, error
+
+
+def ping_host(ip: str) -> Tuple[bool, float | None]:
+    """ping с -W по истории RTT; время ответа пополняет историю. Возвращает (ответил, RTT первого ответа)."""
+    timeout = PING_RTT.timeout(ip)
+    wait_sec = max(1, math.ceil(timeout))
+    cmd = ["ping", "-c", str(PING_COUNT), "-W", str(wait_sec), ip]
     try:
-        with open(filepath, "r", encoding="utf-8") as file:
-            original_lines = file.readlines()
-    except Exception as e:
-        print(f"⚠️ Не удалось прочитать {filepath} для комментирования: {e}")
-        return
-
-    updated_lines = []
-    found = False
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+                                timeout=wait_sec * PING_COUNT + 2)
+    except (subprocess.TimeoutExpired, subprocess.SubprocessError, OSError):
+        return False, None
+    rtts = [float(match.group(1)) / 1000 for match in PING_RTT_PATTERN.finditer(result.stdout)]
+    for rtt in rtts:
+        PING_RTT.observe(ip, rtt)
+    return result.returncode == 0, rtts[0] if rtts else None
 
-    for line in original_lines:
-        if found:
-            updated_lines.append(line)
-            continue
 
-        stripped = line.strip()
-        if not stripped:
-            updated_lines.append(line)
-            continue
+def probe_details(method: str | None, port: int | None = None, rtt: float | None = None,
+                  error: str | None = None) -> Dict[str, object]:
+    """Подробности проверки для --results-jsonl."""
+    return {"method": method, "port": port, "rtt": rtt, "error": error}
 
-        # Извлекаем домен из строки (игнорируя комментарии)
-        content = stripped
-        if content.startswith('#'):
-            real_content = content[1:].strip()
-        else:
-            real_content = content
 
-        real_content = real_content.split('#')[0].strip()
-        if not real_content:
-            updated_lines.append(line)
-            continue
+def check_domain(domain: str) -> Tuple[str, bool, str, Dict[str, object]]:
+    addresses = resolve_addresses(domain)
+    if not addresses:
+        return domain, False, "DNS", probe_details("dns", error="dns")
 
-        temp_domain = real_content.split("://")[-1].split("/")[0].split(":")[0].strip().lower()
-        if temp_domain and '.' in temp_domain:
-            try:
-                ascii_line_domain = temp_domain.encode('idna').decode('ascii')
-                if ascii_line_domain == domain_to_comment:
-                    if not stripped.startswith('#'):
-                        # Комментируем
-                        leading = line[:len(line) - len(line.lstrip())]
-                        updated_lines.append(leading + "# " + line.lstrip())
-                    else:
-                        updated_lines.append(line)  # уже закомментировано
-                    found = True
-                    continue
-            except (UnicodeError, UnicodeDecodeError):
-                pass
-
-        updated_lines.append(line)
-
-    if found:
-        try:
-            with open(filepath, "w", encoding="utf-8") as file:
-                file.writelines(updated_lines)
-        except Exception as e:
-            print(f"   ❌ Ошибка записи в {filepath.name}: {e}")
+    error = None
+    for port in DEFAULT_PORTS:
+        is_open, rtt, port_error = check_tcp_port(addresses, port)
+        if is_open:
+            return domain, True, f"TCP {port}", probe_details("tcp", port, rtt)
+        error = error or port_error
+
+    for ip in addresses:
+        replied, rtt = ping_host(ip)
+        if replied:
+            return domain, True, "ping", probe_details("ping", rtt=rtt)
+
+    return domain, False, "", probe_details("tcp+ping", error=error or "no_reply")
+
+
+def resolve_dns_statuses(domains: List[str], resolver: str | None) -> Dict[str, str]:
+    """Пакетные A-запросы по UDP: домен -> NOERROR, NODATA, NXDOMAIN, SERVFAIL, TIMEOUT..."""
+    server = parse_resolver(resolver)
+    print(f"🔎 DNS-запросы для {len(domains)} доменов через {server[0]}:{server[1]}...")
+    started = time.perf_counter()
+    with BatchResolver(server) as batch:
+        statuses = batch.resolve(domains)
+    elapsed = time.perf_counter() - started
+
+    counts: Dict[str, int] = {}
+    for status in statuses.values():
+        counts[status] = counts.get(status, 0) + 1
+    summary = ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+    print(f"   {len(statuses)} ответов за {elapsed:.2f} с ({len(statuses) / max(elapsed, 1e-9):.0f}/с) — {summary}\n")
+    return statuses
+
+
+def dns_verdict(domain: str, status: str) -> Tuple[str, bool | None, str, Dict[str, object]]:
+    """Вердикт по DNS: None — ответа нет или он неокончательный, статус домена не меняется."""
+    if status in DNS_ALIVE_STATUSES:
+        return domain, True, f"DNS {status}", probe_details("dns", DNS_PORT)
+    details = probe_details("dns", DNS_PORT, error=status.lower())
+    if status == "NXDOMAIN":
+        return domain, False, "DNS NXDOMAIN", details
+    return domain, None, f"DNS {status}, статус не меняется", details
+
+
+def cert_matches_hostname(cert: dict, hostname: str) -> bool:
+    """Сверяет имя с subjectAltName (или CN) сертификата, с учётом wildcard в левой метке."""
+    names = [value for key, value in cert.get("subjectAltName", ()) if key == "DNS"]
+    if not names:
+        names = [value for rdn in cert.get("subject", ()) for key, value in rdn if key == "commonName"]
+
+    hostname = hostname.lower().rstrip(".")
+    for name in names:
+        name = name.lower().rstrip(".")
+        if name == hostname:
+            return True
+        if name.startswith("*.") and "." in hostname:
+            if hostname.split(".", 1)[1] == name[2:]:
+                return True
+    return False
 
 
-def uncomment_domain_in_file(filepath: Path, domain_to_uncomment: str):
-    """Раскомментирует домен, если он закомментирован."""
+def check_domain_tls(domain: str) -> Tuple[str, bool, str, Dict[str, object]]:
+    """
+    Доступность по TLS: рукопожатие с SNI на TLS_PORT, проверка цепочки и имени
+    в сертификате. Заглушки и middlebox'ы, принимающие TCP, так не проходят.
+    """
     try:
-        with open(filepath, "r", encoding="utf-8") as file:
-            original_lines = file.readlines()
-    except Exception as e:
-        print(f"⚠️ Не удалось прочитать {filepath} для раскомментирования: {e}")
-        return
-
-    updated_lines = []
-    found = False
+        ip = socket.getaddrinfo(domain, TLS_PORT, type=socket.SOCK_STREAM)[0][4][0]
+    except (socket.gaierror, OSError):
+        return domain, False, "DNS", probe_details("dns", error="dns")
+
+    with TLS_INFLIGHT:
+        with TLS_SESSIONS_LOCK:
+            session = TLS_SESSIONS.get((ip, domain))
+        start = time.perf_counter()
+        try:
+            with socket.create_connection((ip, TLS_PORT), timeout=TLS_TIMEOUT) as sock:
+                with TLS_CONTEXT.wrap_socket(sock, server_hostname=domain, session=session) as tls:
+                    latency_ms = (time.perf_counter() - start) * 1000
+                    cert = tls.getpeercert()
+                    resumed = tls.session_reused
+                    if tls.session is not None:
+                        with TLS_SESSIONS_LOCK:
+                            TLS_SESSIONS[(ip, domain)] = tls.session
+        except ssl.SSLCertVerificationError:
+            return domain, False, "TLS: недоверенный сертификат", probe_details("tls", TLS_PORT, error="tls_untrusted")
+        except socket.timeout:
+            return domain, False, "TLS: нет рукопожатия", probe_details("tls", TLS_PORT, error="timeout")
+        except ssl.SSLError:
+            return domain, False, "TLS: нет рукопожатия", probe_details("tls", TLS_PORT, error="tls_handshake")
+        except OSError as e:
+            return domain, False, "TLS: нет рукопожатия", probe_details("tls", TLS_PORT, error=connect_error_class(e))
+
+    details = probe_details("tls", TLS_PORT, latency_ms / 1000)
+    if not cert_matches_hostname(cert, domain):
+        details["error"] = "tls_name_mismatch"
+        return domain, False, f"TLS {latency_ms:.0f} мс, сертификат на другое имя", details
+    return domain, True, f"TLS {latency_ms:.0f} мс" + (", сессия возобновлена" if resumed else ""), details
+
+
+def log_result(domain: str, is_alive: bool, details: Dict[str, object], source_files) -> None:
+    if RESULT_LOG is not None:
+        RESULT_LOG.record(domain, is_alive, source_files, details["method"], details["port"],
+                          details["rtt"], details["error"])
+
+
+def set_line_commented(line: str, commented: bool) -> str:
+    """Комментирует или раскомментирует строку, сохраняя отступ."""
+    stripped = line.strip()
+    if commented == stripped.startswith('#'):
+        return line
+    leading = line[:len(line) - len(line.lstrip())]
+    if commented:
+        return leading + "# " + line.lstrip()
+    rest = stripped[1:]
+    if rest.startswith(' '):
+        rest = rest[1:]
+    return leading + rest + '\n'
+
+
+def apply_verdicts(verdicts: Dict[str, bool], domain_locations: DomainLocations):
+    """
+    Пишет вердикты во все вхождения доменов: доступные раскомментирует,
+    недоступные комментирует. Каждый файл читается и записывается один раз.
+    Номер строки None (или устаревший номер, если файл успели поправить)
+    означает поиск домена по всему файлу.
+    """
+    by_file: Dict[Path, Dict[str, Tuple[bool, List[int | None]]]] = {}
+    for domain, is_alive in verdicts.items():
+        for source_file, line_no in domain_locations.get(domain, ()):
+            entry = by_file.setdefault(source_file, {}).setdefault(domain, (is_alive, []))
+            entry[1].append(line_no)
+
+    with stage("write"):
+        for source_file, file_verdicts in by_file.items():
+            try:
+                with open(source_file, "r", encoding="utf-8") as file:
+                    lines = file.readlines()
+            except Exception as e:
+                print(f"⚠️ Не удалось прочитать {source_file} для обновления: {e}")
+                continue
 
-    for line in original_lines:
-        if found:
-            updated_lines.append(line)
+            changed = False
+            search = set()
+            for domain, (is_alive, line_numbers) in file_verdicts.items():
+                for line_no in line_numbers:
+                    if line_no is None or line_no >= len(lines) \
+                            or extract_domain_from_line(lines[line_no], warn=False) != domain:
+                        search.add(domain)
+                        continue
+                    updated = set_line_commented(lines[line_no], not is_alive)
+                    if updated != lines[line_no]:
+                        lines[line_no] = updated
+                        changed = True
+
+            if search:
+                for line_no, line in enumerate(lines):
+                    domain = extract_domain_from_line(line, warn=False)
+                    if domain in search:
+                        updated = set_line_commented(line, not file_verdicts[domain][0])
+                        if updated != line:
+                            lines[line_no] = updated
+                            changed = True
+
+            if changed:
+                try:
+                    with open(source_file, "w", encoding="utf-8") as file:
+                        file.writelines(lines)
+                except Exception as e:
+                    print(f"   ❌ Ошибка записи в {source_file.name}: {e}")
+
+
+def merge_and_apply(result_files: List[str], quorum: str | int):
+    """Сводит результаты шардов/узлов по правилу кворума и правит исходные файлы."""
+    with stage("load"):
+        domain_locations, _ = load_domains()
+        merged = merge_shard_results(result_files, quorum)
+
+    print(f"🔀 Объединено {len(result_files)} файл(ов) результатов, {len(merged)} доменов, кворум: {quorum}")
+    available_count = 0
+    unavailable_count = 0
+    verdicts = {}
+    for domain, verdict in sorted(merged.items()):
+        if domain not in domain_locations:
             continue
+        if verdict["alive"]:
+            available_count += 1
+        else:
+            unavailable_count += 1
+            print(f"❌ {domain} (доступен с {verdict['votes']} из {verdict['voters']} точек)")
+        verdicts[domain] = verdict["alive"]
+    apply_verdicts(verdicts, domain_locations)
 
-        stripped = line.strip()
-        if not stripped or not stripped.startswith('#'):
-            updated_lines.append(line)
-            continue
+    print("\n" + "═" * 50)
+    print(f"✅ Доступны по кворуму:   {available_count}")
+    print(f"❌ Недоступны по кворуму: {unavailable_count} (обновлены в исходных файлах)")
 
-        content_after_hash = stripped[1:].strip()
-        if not content_after_hash:
-            updated_lines.append(line)
-            continue
 
-        real_content = content_after_hash.split('#')[0].strip()
-        if not real_content:
-            updated_lines.append(line)
-            continue
+def watch_domains(probe, args):
+    """Режим --watch: следит за domains/ru и проверяет домены непрерывно."""
+    def load_file(filepath: Path) -> List[str]:
+        if filepath.suffix != '' or filepath.name in EXCLUDE_FILES:
+            return []
+        domains, _ = load_domains_from_file(filepath)
+        return domains
 
-        temp_domain = real_content.split("://")[-1].split("/")[0].split(":")[0].strip().lower()
-        if temp_domain and '.' in temp_domain:
-            try:
-                ascii_line_domain = temp_domain.encode('idna').decode('ascii')
-                if ascii_line_domain == domain_to_uncomment:
-                    # Раскомментируем
-                    leading = line[:len(line) - len(line.lstrip())]
-                    rest = stripped[1:]
-                    if rest.startswith(' '):
-                        rest = rest[1:]
-                    updated_lines.append(leading + rest + '\n')
-                    found = True
-                    continue
-            except (UnicodeError, UnicodeDecodeError):
-                pass
-
-        updated_lines.append(line)
-
-    if found:
-        try:
-            with open(filepath, "w", encoding="utf-8") as file:
-                file.writelines(updated_lines)
-        except Exception as e:
-            print(f"   ❌ Ошибка записи при раскомментировании {filepath.name}: {e}")
+    last_details: Dict[str, Dict[str, object]] = {}
 
+    def watch_probe(domain: str) -> Tuple[bool, str]:
+        _, is_alive, note, details = probe(domain)
+        last_details[domain] = details
+        return is_alive, note
 
-def is_domain_commented_in_file(filepath: Path, domain: str) -> bool:
-    """Проверяет, закомментирован ли домен в файле."""
-    try:
-        with open(filepath, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-    except:
-        return False
-
-    for line in lines:
-        stripped = line.strip()
-        if not stripped.startswith('#'):
-            continue
-        content = stripped[1:].split('#')[0].strip()
-        if not content:
-            continue
-        temp_domain = content.split("://")[-1].split("/")[0].split(":")[0].strip().lower()
-        if temp_domain and '.' in temp_domain:
-            try:
-                ascii_cand = temp_domain.encode('idna').decode('ascii')
-                if ascii_cand == domain:
-                    return True
-            except:
-                pass
-    return False
+    def on_verdict(domain: str, is_alive: bool, note: str, source_files):
+        log_result(domain, is_alive, last_details.pop(domain, probe_details(None)), sorted(source_files))
+        apply_verdicts({domain: is_alive}, {domain: [(source_file, None) for source_file in source_files]})
+
+    if not SRC_DIR.exists():
+        print(f"❌ Папка '{SRC_DIR}' не найдена.")
+        sys.exit(1)
+    run_watch("check-domains", [SRC_DIR], load_file, watch_probe, on_verdict,
+              args.recheck_interval, MAX_WORKERS, args.status_addr)
 
 
 def main():
-    domain_to_file_map, all_domains = load_domains()
+    global SRC_DIR, RESULT_LOG
+    parser = argparse.ArgumentParser(description="Проверка доступности доменов из domains/ru")
+    parser.add_argument("--probe", choices=["tcp", "tls", "dns"], default="tcp",
+                        help="tcp: подключение к портам, затем ping; "
+                             "tls: рукопожатие с SNI и проверкой сертификата на порту 443; "
+                             "dns: только пакетные DNS-запросы (NXDOMAIN — недоступен, без ответа — не меняется)")
+    parser.add_argument("--dns-prefilter", action="store_true",
+                        help="Перед TCP/TLS-проверкой отсеять NXDOMAIN пакетными DNS-запросами")
+    parser.add_argument("--resolver", metavar="HOST[:PORT]",
+                        help="DNS-сервер для --probe dns и --dns-prefilter (по умолчанию из /etc/resolv.conf)")
+    parser.add_argument("--src-dir", type=Path, default=SRC_DIR,
+                        help=f"Папка со списками доменов (по умолчанию {SRC_DIR})")
+    add_shard_arguments(parser)
+    add_watch_arguments(parser, WATCH_RECHECK_INTERVAL)
+    add_timeout_arguments(parser)
+    add_result_log_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    SRC_DIR = args.src_dir
+    start_from_args(args)
+    start_history(args.rtt_history, {"tcp": TCP_RTT, "ping": PING_RTT})
+    RESULT_LOG = open_result_log(args.results_jsonl, "check-domains")
+
+    if args.merge:
+        merge_and_apply(args.merge, args.quorum)
+        return
+    if args.watch:
+        if args.probe == "dns" or args.dns_prefilter:
+            parser.error("--watch работает только с --probe tcp или tls без --dns-prefilter")
+        watch_domains(check_domain_tls if args.probe == "tls" else check_domain, args)
+        return
+    if args.shard and not args.results_out:
+        parser.error("--shard требует --results-out")
+
+    with stage("load"):
+        domain_locations, all_domains = load_domains()
+    if args.shard:
+        all_domains = select_shard(sorted(all_domains), args.shard)
+        print(f"🧩 Шард {args.shard[0]}/{args.shard[1]}: {len(all_domains)} доменов, исходные файлы не изменяются")
     total = len(all_domains)
 
-    ping_available = subprocess.run(["which", "ping"], stdout=subprocess.DEVNULL).returncode == 0
-    if not ping_available:
-        print("⚠️  'ping' не найден. Проверки будут только по TCP-портам.")
-        print(f"⚡ Проверка {total} доменов (только TCP {DEFAULT_PORTS}, до {MAX_WORKERS} параллельно)...\n")
-    else:
-        print(f"⚡ Проверка {total} доменов (TCP {DEFAULT_PORTS}, затем ping, до {MAX_WORKERS} параллельно)...\n")
+    dns_statuses: Dict[str, str] = {}
+    if args.probe == "dns" or args.dns_prefilter:
+        with stage("dns"):
+            dns_statuses = resolve_dns_statuses(all_domains, args.resolver)
 
-    available_count = 0
-    unavailable_count = 0
+    probe = check_domain_tls if args.probe == "tls" else check_domain
+    if args.probe == "dns":
+        to_probe = []
+        print(f"⚡ Проверка {total} доменов только по DNS...\n")
+    else:
+        # При --dns-prefilter NXDOMAIN сразу считаются недоступными, остальные проверяются как обычно
+        to_probe = [domain for domain in all_domains if dns_statuses.get(domain) != "NXDOMAIN"]
+        if args.dns_prefilter:
+            print(f"🔎 NXDOMAIN: {total - len(to_probe)}, дальше проверяются {len(to_probe)} доменов")
+        ping_available = subprocess.run(["which", "ping"], stdout=subprocess.DEVNULL).returncode == 0
+        if args.probe == "tls":
+            print(f"⚡ Проверка {len(to_probe)} доменов (TLS с SNI на порту {TLS_PORT}, "
+                  f"до {MAX_WORKERS} параллельно, не более {TLS_MAX_INFLIGHT} рукопожатий одновременно)...\n")
+        elif not ping_available:
+            print("⚠️  'ping' не найден. Проверки будут только по TCP-портам.")
+            print(f"⚡ Проверка {len(to_probe)} доменов (только TCP {DEFAULT_PORTS}, до {MAX_WORKERS} параллельно)...\n")
+        else:
+            print(f"⚡ Проверка {len(to_probe)} доменов (TCP {DEFAULT_PORTS}, затем ping, до {MAX_WORKERS} параллельно)...\n")
 
-    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(check_domain, domain) for domain in all_domains]
-        for i, future in enumerate(as_completed(futures), 1):
-            domain, is_alive = future.result()
-            status = "✅" if is_alive else "❌"
-            try:
-                original_domain = domain.encode('ascii').decode('idna')
-            except (UnicodeError, UnicodeDecodeError):
-                original_domain = domain
-            print(f"[{i:>{len(str(total))}}/{total}] {status} {original_domain}")
+    counts = {True: 0, False: 0, None: 0}
+    shard_results = {}
+    verdicts = {}
+    done = 0
 
-            source_file = domain_to_file_map.get(domain)
-            if not source_file:
-                continue
+    def report(domain: str, is_alive: bool | None, note: str, details: Dict[str, object]) -> None:
+        nonlocal done
+        done += 1
+        status = {True: "✅", False: "❌", None: "❔"}[is_alive]
+        try:
+            original_domain = domain.encode('ascii').decode('idna')
+        except (UnicodeError, UnicodeDecodeError):
+            original_domain = domain
+        suffix = f" ({note})" if note else ""
+        print(f"[{done:>{len(str(total))}}/{total}] {status} {original_domain}{suffix}")
+
+        locations = domain_locations.get(domain)
+        if not locations:
+            return
+        log_result(domain, is_alive, details, sorted({str(path) for path, _ in locations}))
+        counts[is_alive] += 1
+        if is_alive is None:
+            return
+
+        if args.shard:
+            shard_results[domain] = {"alive": is_alive, "sources": sorted({str(path) for path, _ in locations})}
+        else:
+            verdicts[domain] = is_alive
 
-            if is_alive:
-                available_count += 1
-                if is_domain_commented_in_file(source_file, domain):
-                    uncomment_domain_in_file(source_file, domain)
-            else:
-                unavailable_count += 1
-                comment_out_domain_in_file(source_file, domain)
+    try:
+        probed = set(to_probe)
+        for domain in all_domains:
+            if domain not in probed:
+                report(*dns_verdict(domain, dns_statuses.get(domain, "TIMEOUT")))
+        if to_probe:
+            with stage("probe"), ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                futures = [executor.submit(probe, domain) for domain in to_probe]
+                for future in as_completed(futures):
+                    report(*future.result())
+    finally:
+        # Вердикты пишутся пачкой (и при прерывании — уже полученные)
+        if verdicts:
+            apply_verdicts(verdicts, domain_locations)
 
     print("\n" + "═" * 50)
-    print(f"✅ Доступны (TCP/ping):   {available_count}")
-    print(f"❌ Недоступны (TCP/ping): {unavailable_count} (обновлены в исходных файлах)")
+    method = {"tls": "TLS", "dns": "DNS"}.get(args.probe, "TCP/ping")
+    if args.dns_prefilter and args.probe != "dns":
+        method = "DNS+" + method
+    print(f"✅ Доступны ({method}):   {counts[True]}")
+    if counts[None]:
+        print(f"❔ Без окончательного ответа DNS: {counts[None]} (статус не изменён)")
+    if args.shard:
+        write_shard_results(args.results_out, "check-domains", args.shard, args.vantage, shard_results)
+        print(f"❌ Недоступны ({method}): {counts[False]}")
+        print(f"💾 Результаты шарда записаны в {args.results_out}")
+    else:
+        print(f"❌ Недоступны ({method}): {counts[False]} (обновлены в исходных файлах)")
 
 
 if __name__ == "__main__":
@@ -2,9 +2,30 @@ import subprocess
 import sys
 import os
 import re
+import math
+import time
+import argparse
 import ipaddress
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
+# Общие модули лежат в scripts/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "scripts"))
+from profiling import add_profile_arguments, start_from_args, stage
+from sharding import add_shard_arguments, select_shard, write_shard_results, merge_shard_results
+from watch_mode import add_watch_arguments, run_watch
+from adaptive_timeout import RttEstimator, add_timeout_arguments, start_history
+from result_log import add_result_log_arguments, open_result_log
+
+WATCH_RECHECK_INTERVAL = 3600  # в режиме --watch каждый IP перепроверяется раз в столько секунд
+WATCH_FLUSH_INTERVAL = 30  # как часто переписывать файлы результатов в режиме --watch
+PING_TIMEOUT_MAX = 3  # верхняя граница ожидания ответа (секунд); обычно берётся по истории RTT
+PING_TIMEOUT_MIN = 0.5  # нижняя граница: с запасом на запуск ping под нагрузкой в 300 потоков
+
+# SRTT/RTTVAR по IP и по /24: соседние адреса подсети быстро дают историю для остальных
+PING_RTT = RttEstimator(PING_TIMEOUT_MIN, PING_TIMEOUT_MAX)
+RESULT_LOG = None  # --results-jsonl: по записи на IP сразу после вердикта
+PING_RTT_PATTERN = re.compile(r"[=<]\s*([\d.]+)\s*(?:ms|мс)")
+
 # --- Функции для обработки CIDR ---
 
 def generate_ips_from_cidr(cidr_str):
@@ -30,11 +51,11 @@ def parse_cidrs_from_content(content):
             continue # Пропускаем невалидные
     return valid_cidrs
 
-def process_cidr_file(input_filename, num_threads, results_dir):
+def process_cidr_file(input_filename, num_threads, results_dir, shard=None, shard_results=None):
     """Обрабатывает файл, содержащий CIDR-диапазоны."""
     print(f"--- Обнаружен формат CIDR в файле: {input_filename} ---")
     try:
-        with open(input_filename, 'r') as f:
+        with stage("load"), open(input_filename, 'r') as f:
             content = f.read()
     except FileNotFoundError:
         print(f"Ошибка: Файл '{input_filename}' не найден.")
@@ -43,7 +64,8 @@ def process_cidr_file(input_filename, num_threads, results_dir):
         print(f"Ошибка при чтении файла '{input_filename}': {e}")
         return
 
-    cidr_ranges = parse_cidrs_from_content(content)
+    with stage("parse"):
+        cidr_ranges = parse_cidrs_from_content(content)
     if not cidr_ranges:
         print(f"В файле '{input_filename}' не найдено валидных CIDR-диапазонов.")
         return
@@ -51,15 +73,16 @@ def process_cidr_file(input_filename, num_threads, results_dir):
     print(f"Найдено {len(cidr_ranges)} валидных CIDR-диапазонов в '{input_filename}'.")
 
     all_ips = []
-    for cidr_str in cidr_ranges:
-        ips = generate_ips_from_cidr(cidr_str)
-        all_ips.extend(ips)
+    with stage("expand"):
+        for cidr_str in cidr_ranges:
+            ips = generate_ips_from_cidr(cidr_str)
+            all_ips.extend(ips)
 
     print(f"Сгенерировано {len(all_ips)} IP-адресов для проверки из '{input_filename}'.")
     if len(all_ips) > 100000: # Предупреждение для очень больших списков (реально это может убить комп)
         print(f"ВНИМАНИЕ: Список IP-адресов из '{input_filename}' очень большой ({len(all_ips)}). Проверка может занять значительное время или убить ваш комп.")
 
-    ping_ip_list(all_ips, input_filename, num_threads, results_dir)
+    ping_ip_list(all_ips, input_filename, num_threads, results_dir, shard, shard_results)
 
 
 # --- Функции для обработки списка отдельных IP-адресов ---
@@ -81,11 +104,11 @@ def parse_ips_from_list_content(content):
             continue
     return ips
 
-def process_ip_list_file(input_filename, num_threads, results_dir):
+def process_ip_list_file(input_filename, num_threads, results_dir, shard=None, shard_results=None):
     """Обрабатывает файл, содержащий список отдельных IP-адресов."""
     print(f"--- Обнаружен формат списка IP-адресов в файле: {input_filename} ---")
     try:
-        with open(input_filename, 'r') as f:
+        with stage("load"), open(input_filename, 'r') as f:
             content = f.read()
     except FileNotFoundError:
         print(f"Ошибка: Файл '{input_filename}' не найден.")
@@ -94,7 +117,8 @@ def process_ip_list_file(input_filename, num_threads, results_dir):
         print(f"Ошибка при чтении файла '{input_filename}': {e}")
         return
 
-    all_ips = parse_ips_from_list_content(content)
+    with stage("parse"):
+        all_ips = parse_ips_from_list_content(content)
     if not all_ips:
         print(f"В файле '{input_filename}' не найдено валидных IP-адресов.")
         return
@@ -106,49 +130,115 @@ def process_ip_list_file(input_filename, num_threads, results_dir):
         print(f"В файле '{input_filename}' не осталось валидных IP-адресов после фильтрации.")
         return
 
-    ping_ip_list(all_ips, input_filename, num_threads, results_dir)
+    ping_ip_list(all_ips, input_filename, num_threads, results_dir, shard, shard_results)
 
 
 # --- Общая функция для пинга списка IP ---
 
-def ping_ip(ip):
-    """Проверяет доступность IP-адреса."""
+def ping_once(ip, timeout):
+    """
+    Один ping с заданным таймаутом; время ответа пополняет историю RTT.
+    Возвращает (ответил, RTT, класс ошибки).
+    """
     if sys.platform.startswith("win"):
-        command = ["ping", "-n", "1", "-w", "3000", ip]  # Тут можно подшаманить Ping для Windows
+        command = ["ping", "-n", "1", "-w", str(int(timeout * 1000)), ip]  # Тут можно подшаманить Ping для Windows
     else:
-        command = ["ping", "-c", "1", "-W", "3", ip]  # А тут можно подшаманить Ping для Linux
+        # -W у старых iputils и busybox только целый; точную границу держит timeout ниже
+        command = ["ping", "-c", "1", "-W", str(math.ceil(timeout)), ip]  # А тут можно подшаманить Ping для Linux
 
     try:
         result = subprocess.run(
             command,
-            stdout=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
             stderr=subprocess.DEVNULL,
-            timeout=3
+            text=True,
+            errors="replace",
+            timeout=timeout + 0.5  # запас на запуск процесса
         )
-        return ip, result.returncode == 0
     except subprocess.TimeoutExpired:
-        return ip, False
+        return False, None, "timeout"
     except Exception:
-        return ip, False
+        return False, None, "error"
+    if result.returncode != 0:
+        return False, None, "no_reply"
+    match = PING_RTT_PATTERN.search(result.stdout)
+    rtt = float(match.group(1)) / 1000 if match else None
+    if rtt is not None:
+        PING_RTT.observe(ip, rtt)
+    return True, rtt, None
 
-def ping_ip_list(all_ips, original_filename, num_threads, results_dir):
-    """Выполняет пинг списка IP-адресов и записывает результаты."""
+def ping_ip(ip):
+    """
+    Проверяет доступность IP-адреса. Таймаут — по истории RTT адреса или его /24;
+    если ответа нет, один повтор с удвоенным таймаутом (не больше PING_TIMEOUT_MAX),
+    а для адреса без своей истории — сразу с PING_TIMEOUT_MAX.
+    Возвращает (ip, доступен, RTT, класс ошибки).
+    """
+    timeout = PING_RTT.timeout(ip)
+    replied, rtt, error = ping_once(ip, timeout)
+    if not replied:
+        retry_timeout = PING_RTT.retry_timeout(ip, timeout)
+        if retry_timeout:
+            replied, rtt, error = ping_once(ip, retry_timeout)
+    return ip, replied, rtt, error
+
+def ping_ip_list(all_ips, original_filename, num_threads, results_dir, shard=None, shard_results=None):
+    """
+    Выполняет пинг списка IP-адресов и записывает результаты.
+    В режиме шарда проверяются только IP своего шарда, а вердикты складываются
+    в shard_results вместо файла в results_dir.
+    """
     available_ips = []
 
+    if shard:
+        all_ips = select_shard(all_ips, shard)
+        print(f"Шард {shard[0]}/{shard[1]}: {len(all_ips)} IP-адресов из '{original_filename}'.")
+
     print(f"Используется {num_threads} потоков для проверки из '{original_filename}'...")
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+    with stage("probe"), ThreadPoolExecutor(max_workers=num_threads) as executor:
         future_to_ip = {executor.submit(ping_ip, ip): ip for ip in all_ips}
         for future in as_completed(future_to_ip):
-            ip, is_reachable = future.result()
+            ip, is_reachable, rtt, error = future.result()
+            if RESULT_LOG is not None:
+                RESULT_LOG.record(ip, is_reachable, [original_filename], "ping", None, rtt, error)
+            if shard_results is not None:
+                # IP может встречаться в нескольких файлах: он попадёт в итог каждого из них
+                entry = shard_results.setdefault(ip, {"alive": False, "sources": []})
+                entry["alive"] = entry["alive"] or is_reachable
+                entry["sources"].append(os.path.basename(original_filename))
             if is_reachable:
                 available_ips.append(ip)
                 print(f"✅ PING OK: {ip} (из {original_filename})")
 
+    if shard:
+        print(f"--- Шард файла '{original_filename}' проверен ({len(available_ips)} доступно). ---\n")
+        return
+
+    write_available_ips(available_ips, original_filename, results_dir)
+    print(f"--- Обработка файла '{original_filename}' завершена. ---\n")
+
+
+def available_ips_path(original_filename, results_dir):
+    """Путь к файлу итогов results_dir/available_ips_from_<файл>."""
     available_filename = f"available_ips_from_{os.path.basename(original_filename)}"  # Ну если уж прям очень хочется, то тут можно поменять маску названия файлов с итогами проверки
-    result_filepath = os.path.join(results_dir, available_filename)
+    return os.path.join(results_dir, available_filename)
+
+
+def read_available_ips(original_filename, results_dir):
+    """Доступные IP-адреса из уже записанного файла итогов (пустое множество, если его нет)."""
+    try:
+        with open(available_ips_path(original_filename, results_dir), 'r') as f:
+            return {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def write_available_ips(available_ips, original_filename, results_dir):
+    """Записывает доступные IP-адреса в results_dir/available_ips_from_<файл>."""
+    result_filepath = available_ips_path(original_filename, results_dir)
 
     try:
-        with open(result_filepath, 'w') as f:
+        with stage("write"), open(result_filepath, 'w') as f:
             # Сортируем как IP-адреса IPv4. Чет впадлу заморачиваться с IPv6...
             for ip in sorted(available_ips, key=ipaddress.IPv4Address):
                 f.write(ip + '\n')
@@ -156,7 +246,22 @@ def ping_ip_list(all_ips, original_filename, num_threads, results_dir):
     except Exception as e:
         print(f"Ошибка при записи в файл '{result_filepath}': {e}")
 
-    print(f"--- Обработка файла '{original_filename}' завершена. ---\n")
+
+def merge_and_write(result_files, quorum, results_dir):
+    """Сводит результаты шардов/узлов по правилу кворума и пишет файлы с доступными IP."""
+    with stage("load"):
+        merged = merge_shard_results(result_files, quorum)
+    print(f"Объединено {len(result_files)} файл(ов) результатов, {len(merged)} IP-адресов, кворум: {quorum}")
+
+    by_source = {}
+    for ip, verdict in merged.items():
+        for source in verdict["sources"]:
+            available = by_source.setdefault(source, [])
+            if verdict["alive"]:
+                available.append(ip)
+
+    for source, available_ips in sorted(by_source.items()):
+        write_available_ips(available_ips, source, results_dir)
 
 
 # --- Определение типа файла и вызов соответствующей функции ---
@@ -201,7 +306,86 @@ def determine_file_type(filename):
     return "unknown"
 
 
+def load_ips_from_file(path):
+    """IP-адреса для проверки из одного файла (CIDR разворачиваются), без вывода."""
+    path = str(path)
+    if not path.lower().endswith('.txt'):
+        return []
+    file_type = determine_file_type(path)
+    try:
+        with open(path, 'r') as f:
+            content = f.read()
+    except Exception:
+        return []
+    if file_type == "cidr":
+        ips = []
+        for cidr_str in parse_cidrs_from_content(content):
+            ips.extend(generate_ips_from_cidr(cidr_str))
+        return ips
+    if file_type == "ip_list":
+        return parse_ips_from_list_content(content)
+    return []
+
+
+def watch_ips(input_directory, num_threads, results_dir, args):
+    """
+    Режим --watch: следит за IPs/ и переписывает файлы результатов по мере проверок.
+    Итоги источника начинаются с его текущего файла в results_dir, иначе первая
+    запись оставила бы только IP, проверенные в этом сеансе.
+    """
+    available_by_source = {}
+    dirty = set()
+    last_flush = [time.time()]
+
+    def source_available(source):
+        if source not in available_by_source:
+            listed = set(load_ips_from_file(source))
+            available_by_source[source] = read_available_ips(source, results_dir) & listed
+        return available_by_source[source]
+
+    def on_verdict(ip, is_reachable, note, sources):
+        rtt, error = last_results.pop(ip, (None, None))
+        if RESULT_LOG is not None:
+            RESULT_LOG.record(ip, is_reachable, sorted(sources), "ping", None, rtt, error)
+        for source in sources:
+            available = source_available(str(source))
+            if is_reachable != (ip in available):
+                (available.add if is_reachable else available.discard)(ip)
+                dirty.add(str(source))
+
+    def flush():
+        if not dirty or time.time() - last_flush[0] < WATCH_FLUSH_INTERVAL:
+            return
+        for source in sorted(dirty):
+            write_available_ips(list(available_by_source[source]), source, results_dir)
+        dirty.clear()
+        last_flush[0] = time.time()
+
+    last_results = {}
+
+    def watch_probe(ip):
+        _, is_reachable, rtt, error = ping_ip(ip)
+        last_results[ip] = (rtt, error)
+        return is_reachable, ""
+
+    run_watch("check_ips_cidr", [input_directory], load_ips_from_file, watch_probe,
+              on_verdict, args.recheck_interval, num_threads, args.status_addr, on_idle=flush)
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Проверка доступности IP-адресов из IPs/*.txt")
+    add_shard_arguments(parser)
+    add_watch_arguments(parser, WATCH_RECHECK_INTERVAL)
+    add_timeout_arguments(parser)
+    add_result_log_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    start_from_args(args)
+    start_history(args.rtt_history, {"ping": PING_RTT})
+    global RESULT_LOG
+    RESULT_LOG = open_result_log(args.results_jsonl, "check_ips_cidr")
+    if args.shard and not args.results_out:
+        parser.error("--shard требует --results-out")
 
     # --- Основные настройки скрипта ---
 
@@ -219,6 +403,15 @@ def main():
     
     os.makedirs(RESULTS_DIR, exist_ok=True)
     print(f"Проверяем/создаём директорию для результатов: {RESULTS_DIR}")
+
+    if args.merge:
+        merge_and_write(args.merge, args.quorum, RESULTS_DIR)
+        return
+    if args.watch:
+        watch_ips(INPUT_DIRECTORY, NUM_THREADS, RESULTS_DIR, args)
+        return
+
+    shard_results = {} if args.shard else None
     print(f"Поиск файлов .txt в директории: {INPUT_DIRECTORY}")
 
     txt_files = [f for f in os.listdir(INPUT_DIRECTORY) if f.lower().endswith('.txt')]
@@ -234,12 +427,16 @@ def main():
         print(f"Анализ файла '{full_path}': тип - {file_type}")
 
         if file_type == "cidr":
-            process_cidr_file(full_path, NUM_THREADS, RESULTS_DIR)
+            process_cidr_file(full_path, NUM_THREADS, RESULTS_DIR, args.shard, shard_results)
         elif file_type == "ip_list":
-            process_ip_list_file(full_path, NUM_THREADS, RESULTS_DIR)
+            process_ip_list_file(full_path, NUM_THREADS, RESULTS_DIR, args.shard, shard_results)
         else:
             print(f"Тип файла '{full_path}' не распознан. Пропускаю.\n")
 
+    if args.shard:
+        write_shard_results(args.results_out, "check_ips_cidr", args.shard, args.vantage, shard_results)
+        print(f"Результаты шарда записаны в '{args.results_out}'.")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,120 @@
+"""
+RTT-adaptive probe timeouts for check-domains.py and check_ips_cidr.py
+Keeps a smoothed RTT and RTT variance per target and per prefix (RFC 6298
+style) and derives the timeout as SRTT + 4 * RTTVAR within fixed bounds;
+targets without history use their prefix, then the configured ceiling
+"""
+
+import os
+import json
+import atexit
+import threading
+import ipaddress
+
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+# Prefix that shares RTT history with its neighbours
+PREFIXLEN = {4: 24, 6: 48}
+
+
+def prefix_key(target):
+    """Aggregation key for an IP address target; None for host names"""
+    try:
+        address = ipaddress.ip_address(target)
+    except ValueError:
+        return None
+    return str(ipaddress.ip_network((address, PREFIXLEN[address.version]), strict=False))
+
+
+class RttEstimator:
+    """Thread-safe SRTT/RTTVAR table; timeouts are in seconds"""
+
+    def __init__(self, minimum, maximum):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.lock = threading.Lock()
+        self.table = {}
+
+    def _update(self, key, rtt):
+        entry = self.table.get(key)
+        if entry is None:
+            self.table[key] = (rtt, rtt / 2)
+            return
+        srtt, rttvar = entry
+        rttvar = (1 - BETA) * rttvar + BETA * abs(srtt - rtt)
+        srtt = (1 - ALPHA) * srtt + ALPHA * rtt
+        self.table[key] = (srtt, rttvar)
+
+    def observe(self, target, rtt):
+        """Record a successful probe's round-trip time"""
+        with self.lock:
+            self._update(target, rtt)
+            prefix = prefix_key(target)
+            if prefix:
+                self._update(prefix, rtt)
+
+    def timeout(self, target):
+        """Timeout for the next probe of target"""
+        with self.lock:
+            entry = self.table.get(target) or self.table.get(prefix_key(target))
+        if entry is None:
+            return self.maximum
+        srtt, rttvar = entry
+        return min(self.maximum, max(self.minimum, srtt + K * rttvar))
+
+    def retry_timeout(self, target, timeout):
+        """Timeout for the single retry after a probe of target timed out.
+
+        Doubled (capped) when target has its own history; the full ceiling when
+        the first timeout was borrowed from its prefix, so a slow host among
+        fast neighbours is not declared dead on their RTT.
+        """
+        if timeout >= self.maximum:
+            return None
+        with self.lock:
+            own_history = target in self.table
+        if not own_history:
+            return self.maximum
+        return min(self.maximum, timeout * 2)
+
+    def export(self):
+        with self.lock:
+            return {key: [round(srtt, 4), round(rttvar, 4)] for key, (srtt, rttvar) in self.table.items()}
+
+    def restore(self, table):
+        with self.lock:
+            self.table.update((key, tuple(value)) for key, value in table.items())
+
+
+def load_history(path, estimators):
+    """Fill named estimators ({'tcp': RttEstimator, ...}) from a history file"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            history = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return
+    for name, estimator in estimators.items():
+        estimator.restore(history.get(name, {}))
+
+
+def save_history(path, estimators):
+    history = {name: estimator.export() for name, estimator in estimators.items()}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(history, f, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def start_history(path, estimators):
+    """Load RTT history now and save it at exit (no-op without a path)"""
+    if not path:
+        return
+    load_history(path, estimators)
+    atexit.register(save_history, path, estimators)
+
+
+def add_timeout_arguments(parser):
+    """Add the common --rtt-history option"""
+    parser.add_argument('--rtt-history', metavar='FILE.json',
+                        help='Keep RTT history between runs so per-target timeouts start adapted')
@@ -7,6 +7,11 @@ Creates geosite.dat and geoip.dat with all required categories
 import os
 import sys
 import re
+import gzip
+import json
+import lzma
+import time
+import hashlib
 import ipaddress
 import argparse
 from pathlib import Path
@@ -14,10 +19,61 @@ from pathlib import Path
 # Add scripts directory to path for importing proto files
 sys.path.insert(0, str(Path(__file__).parent))
 import common_pb2
+from dat_delta import write_delta
+from rule_sets import write_rule_sets
+from whitelist_delta import (DELTA_CATEGORY, find_entry, subtract_cidrs, subtract_domains,
+                             print_overlap, write_overlap_report)
+from profiling import add_profile_arguments, start_from_args, stage
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Xray matches regexp rules with RE2 syntax; with google-re2 installed the
+# check below is exact, otherwise Python's re is only a hint
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+
+DOMAIN_RULE_TYPES = ('full', 'domain', 'regexp', 'keyword')
+
+
+def parse_domain_rule(line):
+    """Parse a v2ray domain list rule into (type, value, attributes), or None
+
+    Formats: domain.com, full:domain.com, domain:domain.com, regexp:pattern,
+    keyword:word, each optionally followed by attributes such as @ads
+    """
+    rule_type = 'domain'
+    for prefix in DOMAIN_RULE_TYPES:
+        if line.startswith(prefix + ':'):
+            rule_type = prefix
+            line = line[len(prefix) + 1:]
+            break
+
+    parts = line.split()
+    if not parts:
+        return None
+    value = parts[0]
+    if rule_type == 'domain':
+        value = value.split('#')[0]
+        if '.' not in value:
+            return None
+
+    attributes = []
+    for part in parts[1:]:
+        if part.startswith('#'):
+            break
+        if part.startswith('@') and len(part) > 1:
+            attributes.append(part[1:])
+    return rule_type, value, tuple(attributes)
 
 
 def load_domains_from_file(filepath):
-    """Load domains from a file, supporting v2ray domain list format"""
+    """Load (type, value, attributes) rules from a file in v2ray domain list format"""
     domains = []
     
     if not filepath.exists():
@@ -32,37 +88,13 @@ def load_domains_from_file(filepath):
                 if not line or line.startswith('#'):
                     continue
                 
-                # Parse v2ray domain list format
-                # Formats: domain.com, include:category, full:domain.com, regexp:pattern, keyword:word
+                # Skip include directives - they should be in separate files
                 if line.startswith('include:'):
-                    # Skip include directives - they should be in separate files
                     continue
-                elif line.startswith('full:'):
-                    # Full domain match
-                    domain = line[5:].strip().split()[0]
-                    domains.append(('full', domain))
-                elif line.startswith('domain:'):
-                    # Domain and subdomains
-                    domain = line[7:].strip().split()[0]
-                    domains.append(('domain', domain))
-                elif line.startswith('regexp:'):
-                    # Regular expression
-                    pattern = line[7:].strip().split()[0]
-                    domains.append(('regexp', pattern))
-                elif line.startswith('keyword:'):
-                    # Keyword match
-                    keyword = line[8:].strip().split()[0]
-                    domains.append(('keyword', keyword))
-                else:
-                    # Default: treat as domain
-                    domain = line.split()[0].split('#')[0].strip()
-                    if domain and '.' in domain:
-                        # Check if it has attributes (e.g., @ads)
-                        parts = line.split()
-                        if len(parts) > 1 and parts[1].startswith('@'):
-                            domains.append(('domain', domain))
-                        else:
-                            domains.append(('domain', domain))
+                
+                rule = parse_domain_rule(line)
+                if rule:
+                    domains.append(rule)
     except Exception as e:
         print(f"  ⚠ Error reading {filepath}: {e}")
     
@@ -98,23 +130,9 @@ def load_domains_from_directory(directory):
                         include_path = filepath.parent / include_name
                         domains.extend(process_file(include_path))
                     else:
-                        # Parse domain entry
-                        if line.startswith('full:'):
-                            domain = line[5:].strip().split()[0]
-                            domains.append(('full', domain))
-                        elif line.startswith('domain:'):
-                            domain = line[7:].strip().split()[0]
-                            domains.append(('domain', domain))
-                        elif line.startswith('regexp:'):
-                            pattern = line[7:].strip().split()[0]
-                            domains.append(('regexp', pattern))
-                        elif line.startswith('keyword:'):
-                            keyword = line[8:].strip().split()[0]
-                            domains.append(('keyword', keyword))
-                        else:
-                            domain = line.split()[0].split('#')[0].strip()
-                            if domain and '.' in domain:
-                                domains.append(('domain', domain))
+                        rule = parse_domain_rule(line)
+                        if rule:
+                            domains.append(rule)
         except Exception as e:
             print(f"  ⚠ Error processing {filepath}: {e}")
         
@@ -171,14 +189,406 @@ def load_ips_from_directory(directory):
     return cidrs
 
 
+# Regex prefixes that mean "the domain itself or any of its subdomains"
+ROOT_DOMAIN_REGEX_PREFIXES = ('(^|\\.)', '(?:^|\\.)', '^(.*\\.)?', '^(?:.*\\.)?', '^(.+\\.)?', '^(?:.+\\.)?')
+# Upper bound on literals produced from a single regexp by alternation expansion
+MAX_REGEX_EXPANSION = 64
+# Characters allowed in a lowered literal (Xray matches lowercased domains)
+DOMAIN_LITERAL_CHARS = set('abcdefghijklmnopqrstuvwxyz0123456789.-_')
+# Constructs Python accepts but Go's RE2 engine (used by Xray/v2ray) rejects
+RE2_UNSUPPORTED = re.compile(r'\(\?[=!]|\(\?<[=!]|\\[1-9]|\(\?P=')
+
+
+def has_top_level_alternation(pattern):
+    """Check whether '|' appears outside of any group in pattern"""
+    depth = 0
+    escaped = False
+    for char in pattern:
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == '|' and depth == 0:
+            return True
+    return False
+
+
+def expand_literal_regex(pattern):
+    """Expand a regex built only from literals, groups, '|' and '?' on groups.
+
+    Returns the list of strings the pattern matches exactly, or None when the
+    pattern uses any other construct.
+    """
+    pos = 0
+
+    def parse_alternation():
+        nonlocal pos
+        options = parse_sequence()
+        if options is None:
+            return None
+        while pos < len(pattern) and pattern[pos] == '|':
+            pos += 1
+            branch = parse_sequence()
+            if branch is None:
+                return None
+            options = options + branch
+        return options
+
+    def parse_sequence():
+        nonlocal pos
+        results = ['']
+        while pos < len(pattern) and pattern[pos] not in '|)':
+            char = pattern[pos]
+            if char == '(':
+                pos += 1
+                if pattern.startswith('?:', pos):
+                    pos += 2
+                options = parse_alternation()
+                if options is None or pos >= len(pattern) or pattern[pos] != ')':
+                    return None
+                pos += 1
+                if pos < len(pattern) and pattern[pos] == '?':
+                    pos += 1
+                    options = options + ['']
+            elif char == '\\':
+                if pos + 1 >= len(pattern) or pattern[pos + 1].isalnum():
+                    return None
+                options = [pattern[pos + 1]]
+                pos += 2
+            elif char in '.[]{}*+?^$':
+                return None
+            else:
+                options = [char]
+                pos += 1
+
+            if pos < len(pattern) and pattern[pos] in '*+{':
+                return None
+            if pos < len(pattern) and pattern[pos] == '?':
+                # Optional single literal, e.g. "com?"
+                if len(options) != 1 or len(options[0]) != 1:
+                    return None
+                pos += 1
+                options = options + ['']
+
+            results = [prefix + option for prefix in results for option in options]
+            if len(results) > MAX_REGEX_EXPANSION:
+                return None
+        return results
+
+    expanded = parse_alternation()
+    if expanded is None or pos != len(pattern):
+        return None
+    return expanded
+
+
+def lower_regexp(pattern):
+    """Rewrite a regexp into cheaper (type, value) matchers when equivalent.
+
+    Handles ^literal$ (full), (^|\\.)literal$ (domain) and unanchored literals
+    (keyword). Returns None if the pattern has to stay a regexp.
+    """
+    domain_type = None
+    body = pattern
+
+    for prefix in ROOT_DOMAIN_REGEX_PREFIXES:
+        if body.startswith(prefix) and body.endswith('$') and not body.endswith('\\$'):
+            domain_type = 'domain'
+            body = body[len(prefix):-1]
+            break
+    else:
+        anchored_start = body.startswith('^')
+        anchored_end = body.endswith('$') and not body.endswith('\\$')
+        if anchored_start and anchored_end:
+            domain_type = 'full'
+            body = body[1:-1]
+        elif not anchored_start and not anchored_end:
+            domain_type = 'keyword'
+        else:
+            return None
+
+    # "^a|b$" binds as "(^a)|(b$)", so anchors only cover grouped alternations
+    if domain_type != 'keyword' and has_top_level_alternation(body):
+        return None
+
+    literals = expand_literal_regex(body)
+    if not literals:
+        return None
+
+    for literal in literals:
+        if not literal or not set(literal) <= DOMAIN_LITERAL_CHARS:
+            return None
+        if domain_type == 'domain' and literal.startswith('.'):
+            return None
+
+    return [(domain_type, literal) for literal in literals]
+
+
+def validate_regexp(pattern):
+    """Check a regexp against RE2 syntax.
+
+    Returns (error, definite): error is None when the pattern compiles, and
+    definite is True only when RE2 itself rejects it. Without google-re2 a
+    failure in Python's re may be a syntax difference (e.g. \\pL, \\z) and is
+    not definite.
+    """
+    if RE2_UNSUPPORTED.search(pattern):
+        return 'construct not supported by RE2', True
+    if re2 is not None:
+        try:
+            re2.compile(pattern)
+        except re2.error as e:
+            message = e.args[0] if e.args else e
+            return (message.decode('utf-8', 'replace') if isinstance(message, bytes) else str(message)), True
+        return None, False
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        return str(e), False
+    return None, False
+
+
+def lower_regex_domains(entry):
+    """Lower Regex rules of a GeoSite entry in place and drop invalid ones.
+
+    Returns a (lowered, invalid, remaining) tuple of regex rule counts.
+    """
+    lowered = invalid = remaining = 0
+    type_map = {
+        'full': common_pb2.Domain.Full,
+        'domain': common_pb2.Domain.RootDomain,
+        'keyword': common_pb2.Domain.Plain,
+    }
+
+    if not any(d.type == common_pb2.Domain.Regex for d in entry.domain):
+        return lowered, invalid, remaining
+
+    category = entry.country_code or entry.code
+    new_domains = []
+    for domain_entry in entry.domain:
+        if domain_entry.type != common_pb2.Domain.Regex:
+            new_domains.append(domain_entry)
+            continue
+
+        replacement = lower_regexp(domain_entry.value)
+        if replacement is not None:
+            lowered += 1
+            for domain_type, value in replacement:
+                lowered_entry = common_pb2.Domain()
+                lowered_entry.CopyFrom(domain_entry)
+                lowered_entry.type = type_map[domain_type]
+                lowered_entry.value = value
+                new_domains.append(lowered_entry)
+            continue
+
+        error, definite = validate_regexp(domain_entry.value)
+        if error and definite:
+            invalid += 1
+            print(f"  ⚠ Dropping invalid regexp in {category}: {domain_entry.value} ({error})")
+            continue
+        if error:
+            print(f"  ⚠ Keeping regexp in {category} that Python's re rejects, "
+                  f"RE2 may accept it: {domain_entry.value} ({error})")
+
+        remaining += 1
+        new_domains.append(domain_entry)
+
+    del entry.domain[:]
+    entry.domain.extend(new_domains)
+    if lowered or invalid:
+        entry.resource_hash = geosite_resource_hash(entry)
+    return lowered, invalid, remaining
+
+
+def report_regex_lowering(geosite_list):
+    """Lower regex rules in all categories and print per-category counts"""
+    print("\nLowering regexp rules:")
+    for entry in geosite_list.entry:
+        category = entry.country_code or entry.code
+        lowered, invalid, remaining = lower_regex_domains(entry)
+        if lowered or invalid or remaining:
+            print(f"  - {category}: {lowered} lowered, {invalid} invalid dropped, "
+                  f"{remaining} regexp rules remain")
+
+
+def category_header(entry):
+    """Category names, hashed too: cached bytes are returned verbatim and carry them"""
+    return f"{entry.country_code}\t{entry.code}\n".encode('utf-8')
+
+
+def geosite_resource_hash(entry):
+    """SHA-256 of a GeoSite category's names and canonically sorted domain rules"""
+    records = []
+    for domain in entry.domain:
+        record = f"{domain.type}\t{domain.value}".encode('utf-8')
+        if domain.attribute:
+            attributes = sorted(attr.SerializeToString() for attr in domain.attribute)
+            record += b'\t' + b','.join(attributes).hex().encode('ascii')
+        records.append(record)
+    records.sort()
+
+    digest = hashlib.sha256(category_header(entry))
+    for record in records:
+        digest.update(record)
+        digest.update(b'\n')
+    return digest.digest()
+
+
+def geoip_resource_hash(entry):
+    """SHA-256 of a GeoIP category's names and canonically sorted CIDR blocks"""
+    records = sorted(bytes([len(cidr.ip)]) + cidr.ip + bytes([cidr.prefix]) for cidr in entry.cidr)
+
+    digest = hashlib.sha256(category_header(entry) + (b'inverse\n' if entry.inverse_match else b''))
+    for record in records:
+        digest.update(record)
+    return digest.digest()
+
+
+def encode_varint(value):
+    """Encode an unsigned protobuf varint"""
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+# Bumped whenever the serialized layout of cached categories changes
+CACHE_FORMAT = b'sorted-v1:'
+
+
+def domain_sort_key(domain):
+    """Order domain rules by reversed labels so shared suffixes sit together"""
+    return '.'.join(reversed(domain.value.split('.'))), domain.type, domain.value
+
+
+def cidr_sort_key(cidr):
+    return len(cidr.ip), cidr.ip, cidr.prefix
+
+
+def canonicalize_entry(entry):
+    """Sort a category's rules into content-defined order (compresses better)"""
+    if isinstance(entry, common_pb2.GeoSite):
+        records, key = entry.domain, domain_sort_key
+    else:
+        records, key = entry.cidr, cidr_sort_key
+
+    ordered = sorted(records, key=key)
+    del records[:]
+    records.extend(ordered)
+
+
+def serialize_entry_cached(entry, cache_dir):
+    """Serialize a category, reusing cached bytes when its resource_hash is unchanged"""
+    if cache_dir is None or not entry.resource_hash:
+        canonicalize_entry(entry)
+        return entry.SerializeToString(), False
+
+    category = entry.country_code or entry.code
+    cache_key = CACHE_FORMAT + entry.resource_hash
+    cache_file = Path(cache_dir) / f"{category}.bin"
+    if cache_file.exists():
+        with open(cache_file, 'rb') as f:
+            if f.read(len(cache_key)) == cache_key:
+                return f.read(), True
+
+    canonicalize_entry(entry)
+    data = entry.SerializeToString()
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    with open(cache_file, 'wb') as f:
+        f.write(cache_key)
+        f.write(data)
+    return data, False
+
+
+def write_dat_file(output_path, entries, cache_dir=None):
+    """Write a GeoSiteList/GeoIPList from its entries (field 1, length-delimited)"""
+    reused = 0
+    with open(output_path, 'wb') as f:
+        for entry in entries:
+            data, from_cache = serialize_entry_cached(entry, cache_dir)
+            reused += from_cache
+            f.write(b'\x0a')
+            f.write(encode_varint(len(data)))
+            f.write(data)
+    if cache_dir is not None:
+        print(f"  Reused {reused}/{len(entries)} unchanged categories from cache")
+
+
+def available_codecs():
+    """Compression codecs as name -> (extension, compress, decompress)"""
+    codecs = {
+        'gzip': ('gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0), gzip.decompress),
+        'xz': ('xz', lambda data: lzma.compress(data, preset=9 | lzma.PRESET_EXTREME), lzma.decompress),
+    }
+    if zstandard is not None:
+        codecs['zstd'] = (
+            'zst',
+            lambda data: zstandard.ZstdCompressor(level=19).compress(data),
+            lambda data: zstandard.ZstdDecompressor().decompress(data),
+        )
+    return codecs
+
+
+def compress_artifacts(paths, codec_names, report_path):
+    """Write compressed variants next to each file and a size/speed report"""
+    print("\n=== Compressing artifacts ===")
+    codecs = available_codecs()
+    report = {}
+
+    for path in paths:
+        path = Path(path)
+        data = path.read_bytes()
+        results = {'uncompressed': len(data)}
+
+        for name in codec_names:
+            if name not in codecs:
+                print(f"  ⚠ Codec {name} is not available, skipping")
+                continue
+            extension, compress, decompress = codecs[name]
+            compressed = compress(data)
+            compressed_path = path.with_name(f"{path.name}.{extension}")
+            compressed_path.write_bytes(compressed)
+
+            # Best of three runs to smooth out scheduler noise
+            timings = []
+            for _ in range(3):
+                start = time.perf_counter()
+                decompress(compressed)
+                timings.append(time.perf_counter() - start)
+
+            results[name] = {
+                'size': len(compressed),
+                'ratio': round(len(compressed) / len(data), 4) if data else 0,
+                'decompress_ms': round(min(timings) * 1000, 2),
+            }
+            print(f"  - {compressed_path.name}: {len(compressed)} bytes "
+                  f"({results[name]['ratio']:.1%}), decompress {results[name]['decompress_ms']} ms")
+
+        report[path.name] = results
+
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+    print(f"  Report saved to: {report_path}")
+
+
 def create_geosite_entry(category_name, domains):
-    """Create a GeoSite entry from domain list"""
+    """Create a GeoSite entry from (type, value[, attributes]) rules"""
     entry = common_pb2.GeoSite()
     entry.country_code = category_name
     entry.code = category_name
     
-    for domain_type, domain_value in domains:
+    for domain_type, domain_value, *rest in domains:
         domain_entry = entry.domain.add()
+        for attribute in (rest[0] if rest else ()):
+            domain_attribute = domain_entry.attribute.add()
+            domain_attribute.key = attribute
+            domain_attribute.bool_value = True
         
         if domain_type == 'full':
             domain_entry.type = common_pb2.Domain.Full
@@ -193,6 +603,7 @@ def create_geosite_entry(category_name, domains):
             domain_entry.type = common_pb2.Domain.RootDomain
             domain_entry.value = domain_value
     
+    entry.resource_hash = geosite_resource_hash(entry)
     return entry
 
 
@@ -211,94 +622,188 @@ def create_geoip_entry(category_name, cidrs):
         except ValueError as e:
             print(f"  ⚠ Invalid CIDR {cidr_str}: {e}")
     
+    entry.resource_hash = geoip_resource_hash(entry)
     return entry
 
 
-def build_geosite_dat(extracted_path, whitelist_domains_path, whitelist_ads_path, output_path):
-    """Build final geosite.dat combining extracted categories and whitelist"""
+def append_whitelist_delta(kind, entries, whitelist_entry, delta_against, output_path):
+    """Append WHITELIST-ONLY (whitelist minus the delta_against category) and write the overlap report"""
+    print(f"\nSubtracting {delta_against} from {whitelist_entry.country_code}...")
+    upstream = find_entry(entries, delta_against)
+    if upstream is None:
+        print(f"  ⚠ Category {delta_against} not found, skipping {DELTA_CATEGORY}")
+        return
+    
+    if kind == 'geosite':
+        kept, report = subtract_domains(whitelist_entry, upstream)
+        delta_entry = common_pb2.GeoSite(country_code=DELTA_CATEGORY, code=DELTA_CATEGORY)
+        delta_entry.domain.extend(kept)
+        delta_entry.resource_hash = geosite_resource_hash(delta_entry)
+    else:
+        cidrs, report = subtract_cidrs(whitelist_entry, upstream)
+        delta_entry = create_geoip_entry(DELTA_CATEGORY, cidrs)
+    entries.append(delta_entry)
+    
+    print_overlap(kind, whitelist_entry.country_code, delta_against, report)
+    report_path = Path(output_path).with_name(f'{kind}-whitelist-overlap.json')
+    write_overlap_report(report_path, kind, whitelist_entry.country_code, delta_against, report)
+    print(f"  Report saved to: {report_path}")
+
+
+def build_geosite_dat(extracted, whitelist_domains_path, whitelist_ads_path, output_path, cache_dir=None,
+                      delta_against=None):
+    """Build final geosite.dat combining extracted categories and whitelist
+
+    extracted is a path to a serialized GeoSiteList or an iterable of GeoSite entries.
+    With delta_against (e.g. 'category-ru'), also adds WHITELIST-ONLY with the
+    whitelist rules that category does not already match.
+    Returns the written entries.
+    """
     print("\n=== Building geosite.dat ===")
     
-    # Load extracted categories
+    # Load extracted categories (a file path, or entries handed over in memory)
     geosite_list = common_pb2.GeoSiteList()
     
-    if Path(extracted_path).exists():
-        with open(extracted_path, 'rb') as f:
-            data = f.read()
-        extracted_list = common_pb2.GeoSiteList()
-        extracted_list.ParseFromString(data)
-        
-        print(f"Loaded {len(extracted_list.entry)} categories from extracted data:")
-        for entry in extracted_list.entry:
+    extracted_entries = None
+    if isinstance(extracted, (str, os.PathLike)):
+        if Path(extracted).exists():
+            with stage('load'), open(extracted, 'rb') as f:
+                data = f.read()
+            with stage('parse'):
+                extracted_list = common_pb2.GeoSiteList()
+                extracted_list.ParseFromString(data)
+                extracted_entries = list(extracted_list.entry)
+    elif extracted is not None:
+        extracted_entries = list(extracted)
+    
+    if extracted_entries is not None:
+        print(f"Loaded {len(extracted_entries)} categories from extracted data:")
+        for entry in extracted_entries:
             category = entry.country_code or entry.code
             print(f"  - {category}: {len(entry.domain)} domains")
+            entry.resource_hash = geosite_resource_hash(entry)
             geosite_list.entry.append(entry)
     
     # Load whitelist domains
     print(f"\nLoading whitelist domains from {whitelist_domains_path}...")
-    whitelist_domains = load_domains_from_directory(whitelist_domains_path)
+    with stage('include_resolution'):
+        whitelist_domains = load_domains_from_directory(whitelist_domains_path)
     
     if whitelist_domains:
         print(f"  ✓ Loaded {len(whitelist_domains)} whitelist domains")
-        whitelist_entry = create_geosite_entry('WHITELIST', whitelist_domains)
+        with stage('create_entries'):
+            whitelist_entry = create_geosite_entry('WHITELIST', whitelist_domains)
         geosite_list.entry.append(whitelist_entry)
+        if delta_against:
+            with stage('whitelist_delta'):
+                append_whitelist_delta('geosite', geosite_list.entry, whitelist_entry, delta_against, output_path)
     else:
         print("  ⚠ No whitelist domains found")
     
     # Load whitelist-ads domains
     print(f"\nLoading whitelist-ads domains from {whitelist_ads_path}...")
-    whitelist_ads_domains = load_domains_from_directory(whitelist_ads_path)
+    with stage('include_resolution'):
+        whitelist_ads_domains = load_domains_from_directory(whitelist_ads_path)
     
     if whitelist_ads_domains:
         print(f"  ✓ Loaded {len(whitelist_ads_domains)} whitelist-ads domains")
-        whitelist_ads_entry = create_geosite_entry('WHITELIST-ADS', whitelist_ads_domains)
+        with stage('create_entries'):
+            whitelist_ads_entry = create_geosite_entry('WHITELIST-ADS', whitelist_ads_domains)
         geosite_list.entry.append(whitelist_ads_entry)
     else:
         print("  ⚠ No whitelist-ads domains found")
     
+    # Rewrite regexps into cheaper matchers and validate the rest
+    with stage('lower_regexp'):
+        report_regex_lowering(geosite_list)
+    
     # Save final geosite.dat
-    with open(output_path, 'wb') as f:
-        f.write(geosite_list.SerializeToString())
+    with stage('serialize_write'):
+        write_dat_file(output_path, geosite_list.entry, cache_dir)
     
     print(f"\n✓ Built geosite.dat with {len(geosite_list.entry)} categories")
     print(f"  Saved to: {output_path}")
+    return list(geosite_list.entry)
+
 
+def build_geoip_dat(extracted, whitelist_ips_path, output_path, cache_dir=None, delta_against=None):
+    """Build final geoip.dat combining extracted categories and whitelist
 
-def build_geoip_dat(extracted_path, whitelist_ips_path, output_path):
-    """Build final geoip.dat combining extracted categories and whitelist"""
+    extracted is a path to a serialized GeoIPList or an iterable of GeoIP entries.
+    With delta_against (e.g. 'ru'), also adds WHITELIST-ONLY with the whitelist
+    address ranges that category does not already contain.
+    Returns the written entries.
+    """
     print("\n=== Building geoip.dat ===")
     
-    # Load extracted categories
+    # Load extracted categories (a file path, or entries handed over in memory)
     geoip_list = common_pb2.GeoIPList()
     
-    if Path(extracted_path).exists():
-        with open(extracted_path, 'rb') as f:
-            data = f.read()
-        extracted_list = common_pb2.GeoIPList()
-        extracted_list.ParseFromString(data)
-        
-        print(f"Loaded {len(extracted_list.entry)} categories from extracted data:")
-        for entry in extracted_list.entry:
+    extracted_entries = None
+    if isinstance(extracted, (str, os.PathLike)):
+        if Path(extracted).exists():
+            with stage('load'), open(extracted, 'rb') as f:
+                data = f.read()
+            with stage('parse'):
+                extracted_list = common_pb2.GeoIPList()
+                extracted_list.ParseFromString(data)
+                extracted_entries = list(extracted_list.entry)
+    elif extracted is not None:
+        extracted_entries = list(extracted)
+    
+    if extracted_entries is not None:
+        print(f"Loaded {len(extracted_entries)} categories from extracted data:")
+        for entry in extracted_entries:
             category = entry.country_code or entry.code
             print(f"  - {category}: {len(entry.cidr)} CIDR blocks")
+            entry.resource_hash = geoip_resource_hash(entry)
             geoip_list.entry.append(entry)
     
     # Load whitelist IPs
     print(f"\nLoading whitelist IPs from {whitelist_ips_path}...")
-    whitelist_cidrs = load_ips_from_directory(whitelist_ips_path)
+    with stage('load'):
+        whitelist_cidrs = load_ips_from_directory(whitelist_ips_path)
     
     if whitelist_cidrs:
         print(f"  ✓ Loaded {len(whitelist_cidrs)} whitelist CIDR blocks")
-        whitelist_entry = create_geoip_entry('WHITELIST', whitelist_cidrs)
+        with stage('create_entries'):
+            whitelist_entry = create_geoip_entry('WHITELIST', whitelist_cidrs)
         geoip_list.entry.append(whitelist_entry)
+        if delta_against:
+            with stage('whitelist_delta'):
+                append_whitelist_delta('geoip', geoip_list.entry, whitelist_entry, delta_against, output_path)
     else:
         print("  ⚠ No whitelist IPs found")
     
     # Save final geoip.dat
-    with open(output_path, 'wb') as f:
-        f.write(geoip_list.SerializeToString())
+    with stage('serialize_write'):
+        write_dat_file(output_path, geoip_list.entry, cache_dir)
     
     print(f"\n✓ Built geoip.dat with {len(geoip_list.entry)} categories")
     print(f"  Saved to: {output_path}")
+    return list(geoip_list.entry)
+
+
+def write_release_extras(output_dir, codecs, previous_geosite=None, previous_geoip=None):
+    """Write compressed variants and deltas for the built .dat files"""
+    output_dir = Path(output_dir)
+    
+    # Write compressed variants and the size/speed report
+    if codecs:
+        with stage('compress'):
+            compress_artifacts([output_dir / 'geosite.dat', output_dir / 'geoip.dat'],
+                               codecs, output_dir / 'compression-report.json')
+    
+    # Write deltas against the previous release
+    for kind, previous in (('geosite', previous_geosite), ('geoip', previous_geoip)):
+        if not previous:
+            continue
+        if not Path(previous).exists():
+            print(f"\n⚠ Previous {kind}.dat not found: {previous}, skipping delta")
+            continue
+        print(f"\n=== Building {kind}.dat.delta ===")
+        with stage('delta'):
+            write_delta(previous, output_dir / f'{kind}.dat', kind, output_dir / f'{kind}.dat.delta')
 
 
 def main():
@@ -315,28 +820,63 @@ def main():
                         help='Path to whitelist IPs directory')
     parser.add_argument('--output-dir', default='output',
                         help='Output directory for final .dat files')
+    parser.add_argument('--cache-dir',
+                        help='Directory for serialized categories keyed by resource_hash '
+                             '(default: <output-dir>/.cache)')
+    parser.add_argument('--compress', nargs='*', default=['gzip', 'xz', 'zstd'],
+                        help='Codecs for compressed copies of the .dat files (zstd needs zstandard)')
+    parser.add_argument('--previous-geosite',
+                        help='geosite.dat of the previous release, to write geosite.dat.delta')
+    parser.add_argument('--previous-geoip',
+                        help='geoip.dat of the previous release, to write geoip.dat.delta')
+    parser.add_argument('--rule-set-dir',
+                        help='Directory for sing-box/mihomo rule-sets and plain-text sets '
+                             '(default: <output-dir>/rule-set)')
+    parser.add_argument('--no-rule-sets', action='store_true',
+                        help='Do not write rule-sets')
+    parser.add_argument('--whitelist-delta', action='store_true',
+                        help=f'Add {DELTA_CATEGORY} categories with whitelist rules not covered upstream '
+                             'and write *-whitelist-overlap.json reports')
+    parser.add_argument('--delta-geosite-category', default='category-ru',
+                        help='Upstream geosite category subtracted for --whitelist-delta')
+    parser.add_argument('--delta-geoip-category', default='ru',
+                        help='Upstream geoip category subtracted for --whitelist-delta')
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
+    start_from_args(args)
     
     # Create output directory
     output_dir = Path(args.output_dir)
     output_dir.mkdir(exist_ok=True)
+    cache_dir = Path(args.cache_dir) if args.cache_dir else output_dir / '.cache'
     
     # Build geosite.dat
-    build_geosite_dat(
+    geosite_entries = build_geosite_dat(
         args.extracted_geosite,
         args.whitelist_domains,
         args.whitelist_ads,
-        output_dir / 'geosite.dat'
+        output_dir / 'geosite.dat',
+        cache_dir / 'geosite',
+        args.delta_geosite_category if args.whitelist_delta else None
     )
     
     # Build geoip.dat
-    build_geoip_dat(
+    geoip_entries = build_geoip_dat(
         args.extracted_geoip,
         args.whitelist_ips,
-        output_dir / 'geoip.dat'
+        output_dir / 'geoip.dat',
+        cache_dir / 'geoip',
+        args.delta_geoip_category if args.whitelist_delta else None
     )
     
+    write_release_extras(output_dir, args.compress, args.previous_geosite, args.previous_geoip)
+    
+    # Write sing-box/mihomo rule-sets from the same entries
+    if not args.no_rule_sets:
+        with stage('rule_sets'):
+            write_rule_sets(args.rule_set_dir or output_dir / 'rule-set', geosite_entries, geoip_entries)
+    
     print("\n✅ Build complete!")
     return 0
 
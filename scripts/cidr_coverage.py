@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Coverage of whitelisted domains by whitelisted IP ranges
+Resolves every domain under domains/ru and reports, per domain file, which
+addresses fall inside an IPs/*.txt prefix and which do not (those break
+IPIfNonMatch routing), with a suggested prefix to add for the uncovered ones
+"""
+
+import sys
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+import ipaddress
+from pathlib import Path
+
+# Add scripts directory to path for importing shared modules
+sys.path.insert(0, str(Path(__file__).parent))
+from build_dat import load_domains_from_file
+
+RESOLVE_WORKERS = 64
+RESOLVE_TIMEOUT = 5
+# Prefix suggested for an uncovered address when no routing table is given
+FALLBACK_PREFIXLEN = {4: 24, 6: 48}
+EXCLUDE_FILES = {'category-ru', 'private', 'category-whitelist-ru'}
+
+
+class PrefixIndex:
+    """Longest-prefix match over a set of CIDRs: one hash table per prefix length"""
+
+    def __init__(self):
+        self.tables = {4: {}, 6: {}}
+        self.lengths = {4: [], 6: []}
+
+    def add(self, network, value):
+        table = self.tables[network.version].setdefault(network.prefixlen, {})
+        key = int(network.network_address) >> (network.max_prefixlen - network.prefixlen)
+        # Keep the first owner of a prefix listed in several files
+        table.setdefault(key, (network, value))
+
+    def build(self):
+        for version, tables in self.tables.items():
+            self.lengths[version] = sorted(tables, reverse=True)
+
+    def lookup(self, address):
+        """(network, value) of the most specific prefix containing address, or None"""
+        bits = address.max_prefixlen
+        number = int(address)
+        tables = self.tables[address.version]
+        for prefixlen in self.lengths[address.version]:
+            hit = tables[prefixlen].get(number >> (bits - prefixlen))
+            if hit is not None:
+                return hit
+        return None
+
+    def __len__(self):
+        return sum(len(table) for tables in self.tables.values() for table in tables.values())
+
+
+def load_ip_index(ips_dir):
+    """Index every prefix in IPs/*.txt, tagged with its file name"""
+    index = PrefixIndex()
+    for filepath in sorted(Path(ips_dir).glob('*.txt')):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#')[0].strip()
+                if not line:
+                    continue
+                try:
+                    index.add(ipaddress.ip_network(line, strict=False), filepath.stem)
+                except ValueError:
+                    continue
+    index.build()
+    return index
+
+
+def load_route_index(rib_file):
+    """Index a routing table dump: one 'prefix [origin]' per line"""
+    index = PrefixIndex()
+    with open(rib_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            parts = line.split('#')[0].split()
+            if not parts:
+                continue
+            try:
+                network = ipaddress.ip_network(parts[0], strict=False)
+            except ValueError:
+                continue
+            index.add(network, ' '.join(parts[1:]) or None)
+    index.build()
+    return index
+
+
+def load_domain_files(domains_dir):
+    """Map domain file name -> plain/full domains (regexp and keyword rules cannot be resolved)"""
+    files = {}
+    for filepath in sorted(Path(domains_dir).iterdir()):
+        if not filepath.is_file() or filepath.name in EXCLUDE_FILES:
+            continue
+        domains = [value for rule_type, value, _ in load_domains_from_file(filepath)
+                   if rule_type in ('domain', 'full')]
+        if domains:
+            files[filepath.name] = domains
+    return files
+
+
+def resolve(domain):
+    try:
+        infos = socket.getaddrinfo(domain, None, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError, OSError):
+        return domain, []
+    return domain, sorted({info[4][0] for info in infos})
+
+
+def resolve_all(domains, workers=RESOLVE_WORKERS, timeout=RESOLVE_TIMEOUT):
+    """Resolve unique domains concurrently: domain -> [address strings]
+
+    getaddrinfo ignores socket timeouts and cannot be cancelled, so lookups
+    run on daemon threads: one still running timeout seconds after it started
+    counts as unresolved, a fresh worker takes over the queue, and the stuck
+    thread does not hold up the script's exit.
+    """
+    pending = queue.Queue()
+    for domain in sorted(set(domains)):
+        pending.put(domain)
+    total = pending.qsize()
+    started = {}
+    resolved = {}
+    condition = threading.Condition()
+
+    def worker():
+        while True:
+            try:
+                domain = pending.get_nowait()
+            except queue.Empty:
+                return
+            with condition:
+                started[domain] = time.monotonic()
+            addresses = resolve(domain)[1]
+            with condition:
+                resolved.setdefault(domain, addresses)
+                condition.notify()
+
+    def start_worker():
+        threading.Thread(target=worker, daemon=True).start()
+
+    for _ in range(min(workers, total)):
+        start_worker()
+
+    timed_out = 0
+    with condition:
+        while len(resolved) < total:
+            now = time.monotonic()
+            running = [(begun, domain) for domain, begun in started.items() if domain not in resolved]
+            for begun, domain in running:
+                if now - begun >= timeout:
+                    resolved[domain] = []
+                    timed_out += 1
+                    start_worker()
+            deadlines = [begun + timeout for begun, domain in running if domain not in resolved]
+            condition.wait(max(0.0, min(deadlines) - now) if deadlines else timeout)
+    if timed_out:
+        print(f"  ⚠ {timed_out} lookups did not finish in {timeout}s, counted as unresolved")
+    return resolved
+
+
+def suggest_prefix(address, routes):
+    if routes is not None:
+        hit = routes.lookup(address)
+        if hit is not None:
+            network, origin = hit
+            return str(network), origin
+    fallback = ipaddress.ip_network((address, FALLBACK_PREFIXLEN[address.version]), strict=False)
+    return str(fallback), None
+
+
+def analyze(domain_files, resolved, ip_index, routes=None):
+    """Per domain file: covered/uncovered addresses and suggested prefixes"""
+    report = {}
+    for name, domains in domain_files.items():
+        covered = []
+        uncovered = []
+        unresolved = []
+        suggestions = {}
+        for domain in domains:
+            addresses = resolved.get(domain, [])
+            if not addresses:
+                unresolved.append(domain)
+                continue
+            for text in addresses:
+                address = ipaddress.ip_address(text)
+                hit = ip_index.lookup(address)
+                if hit is not None:
+                    network, ip_file = hit
+                    covered.append({'domain': domain, 'address': text,
+                                    'prefix': str(network), 'ip_file': ip_file})
+                    continue
+                prefix, origin = suggest_prefix(address, routes)
+                uncovered.append({'domain': domain, 'address': text, 'suggest': prefix})
+                suggestion = suggestions.setdefault(prefix, {'prefix': prefix, 'origin': origin, 'domains': []})
+                if domain not in suggestion['domains']:
+                    suggestion['domains'].append(domain)
+        report[name] = {
+            'covered': covered,
+            'uncovered': uncovered,
+            'unresolved': unresolved,
+            'suggestions': list(suggestions.values()),
+        }
+    return report
+
+
+def print_report(report, verbose=False):
+    total_covered = total_uncovered = 0
+    for name, result in report.items():
+        covered = len(result['covered'])
+        uncovered = len(result['uncovered'])
+        total_covered += covered
+        total_uncovered += uncovered
+        mark = '✓' if not uncovered else '⚠'
+        print(f"{mark} {name}: {covered} covered, {uncovered} uncovered, "
+              f"{len(result['unresolved'])} unresolved")
+        if verbose:
+            for item in result['covered']:
+                print(f"    {item['domain']} {item['address']} in {item['prefix']} ({item['ip_file']}.txt)")
+        for item in result['uncovered']:
+            print(f"    {item['domain']} {item['address']} not covered")
+        for suggestion in result['suggestions']:
+            origin = f" [{suggestion['origin']}]" if suggestion['origin'] else ''
+            print(f"    → add {suggestion['prefix']}{origin} for {', '.join(suggestion['domains'])}")
+    print(f"\nTotal: {total_covered} covered, {total_uncovered} uncovered addresses")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check which whitelisted domains resolve outside IPs/*.txt')
+    parser.add_argument('--domains-dir', default='domains/ru', help='Directory with domain lists')
+    parser.add_argument('--ips-dir', default='IPs', help='Directory with IP prefix lists')
+    parser.add_argument('--rib', help="Routing table dump ('prefix [origin]' per line) "
+                                      "used to suggest the provider prefix of uncovered addresses")
+    parser.add_argument('--workers', type=int, default=RESOLVE_WORKERS, help='Concurrent DNS lookups')
+    parser.add_argument('--json', dest='json_out', help='Also write the full report as JSON')
+    parser.add_argument('--verbose', action='store_true', help='List covered addresses too')
+    args = parser.parse_args()
+
+    ip_index = load_ip_index(args.ips_dir)
+    routes = load_route_index(args.rib) if args.rib else None
+    domain_files = load_domain_files(args.domains_dir)
+    domains = [domain for domains in domain_files.values() for domain in domains]
+    print(f"=== Resolving {len(set(domains))} domains from {len(domain_files)} files "
+          f"against {len(ip_index)} prefixes ===")
+
+    resolved = resolve_all(domains, args.workers)
+    report = analyze(domain_files, resolved, ip_index, routes)
+    print_report(report, args.verbose)
+
+    if args.json_out:
+        with open(args.json_out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"✓ Report saved to {args.json_out}")
+
+    return 1 if any(result['uncovered'] for result in report.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
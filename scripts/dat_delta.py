@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Compact per-category deltas between two releases of geosite.dat/geoip.dat
+A delta lists removed and added Domain/CIDR records for each category and
+rebuilds the new file byte-for-byte from the old one
+"""
+
+import sys
+import zlib
+import json
+import struct
+import hashlib
+import argparse
+from collections import Counter
+from pathlib import Path
+
+# Add scripts directory to path for importing proto files
+sys.path.insert(0, str(Path(__file__).parent))
+import common_pb2
+
+DELTA_MAGIC = b'DATDELTA1'
+
+# list message, record field name and record message for each .dat kind
+DAT_KINDS = {
+    'geosite': (common_pb2.GeoSiteList, 'domain', common_pb2.Domain),
+    'geoip': (common_pb2.GeoIPList, 'cidr', common_pb2.CIDR),
+}
+
+
+def category_key(entry):
+    return entry.country_code or entry.code
+
+
+def encode_indices(indices):
+    """Gap-encode a sorted index list so long runs compress well"""
+    previous = 0
+    gaps = []
+    for index in indices:
+        gaps.append(index - previous)
+        previous = index
+    return gaps
+
+
+def decode_indices(gaps):
+    indices = []
+    position = 0
+    for gap in gaps:
+        position += gap
+        indices.append(position)
+    return indices
+
+
+def diff_records(old_records, new_records):
+    """Compute removed old indices and added (new index, record) pairs.
+
+    Returns None when the records kept from the old list changed their
+    relative order, in which case the category has to be shipped whole.
+    """
+    wanted = Counter(new_records)
+    removed = []
+    kept = []
+    for index, record in enumerate(old_records):
+        if wanted[record]:
+            wanted[record] -= 1
+            kept.append(record)
+        else:
+            removed.append(index)
+
+    available = Counter(kept)
+    added = []
+    kept_in_new = []
+    for index, record in enumerate(new_records):
+        if available[record]:
+            available[record] -= 1
+            kept_in_new.append(record)
+        else:
+            added.append((index, record))
+
+    if kept_in_new != kept:
+        return None
+    return removed, added
+
+
+def make_delta(old_data, new_data, kind):
+    """Build a delta that turns old_data into new_data"""
+    list_cls, field, _ = DAT_KINDS[kind]
+    old_list = list_cls()
+    old_list.ParseFromString(old_data)
+    new_list = list_cls()
+    new_list.ParseFromString(new_data)
+
+    old_entries = {category_key(entry): entry for entry in old_list.entry}
+    categories = []
+    blobs = []
+    stats = {'added': 0, 'removed': 0, 'full': 0}
+
+    def add_blob(data):
+        blobs.append(data)
+        return len(data)
+
+    for entry in new_list.entry:
+        name = category_key(entry)
+        old_entry = old_entries.get(name)
+
+        header = type(entry)()
+        header.CopyFrom(entry)
+        header.ClearField(field)
+
+        diff = None
+        if old_entry is not None:
+            old_records = [r.SerializeToString() for r in getattr(old_entry, field)]
+            new_records = [r.SerializeToString() for r in getattr(entry, field)]
+            diff = diff_records(old_records, new_records)
+
+        if diff is None:
+            categories.append({'name': name, 'mode': 'full',
+                               'size': add_blob(entry.SerializeToString())})
+            stats['full'] += 1
+            continue
+
+        removed, added = diff
+        categories.append({
+            'name': name,
+            'mode': 'patch',
+            'header': add_blob(header.SerializeToString()),
+            'removed': encode_indices(removed),
+            'added': encode_indices([index for index, _ in added]),
+            'sizes': [add_blob(record) for _, record in added],
+        })
+        stats['added'] += len(added)
+        stats['removed'] += len(removed)
+
+    meta = {
+        'kind': kind,
+        'old_sha256': hashlib.sha256(old_data).hexdigest(),
+        'new_sha256': hashlib.sha256(new_data).hexdigest(),
+        'new_size': len(new_data),
+        'categories': categories,
+    }
+    meta_bytes = json.dumps(meta, separators=(',', ':')).encode('utf-8')
+    payload = struct.pack('>I', len(meta_bytes)) + meta_bytes + b''.join(blobs)
+    return DELTA_MAGIC + zlib.compress(payload, 9), stats
+
+
+def apply_delta(old_data, delta_data):
+    """Rebuild the new .dat from old_data and a delta; verifies both checksums"""
+    if not delta_data.startswith(DELTA_MAGIC):
+        raise ValueError('not a .dat delta file')
+    payload = zlib.decompress(delta_data[len(DELTA_MAGIC):])
+    meta_len = struct.unpack('>I', payload[:4])[0]
+    meta = json.loads(payload[4:4 + meta_len])
+    offset = 4 + meta_len
+
+    if hashlib.sha256(old_data).hexdigest() != meta['old_sha256']:
+        raise ValueError('delta was made against a different base file')
+
+    list_cls, field, record_cls = DAT_KINDS[meta['kind']]
+    old_list = list_cls()
+    old_list.ParseFromString(old_data)
+    old_entries = {category_key(entry): entry for entry in old_list.entry}
+
+    def take(size):
+        nonlocal offset
+        data = payload[offset:offset + size]
+        offset += size
+        return data
+
+    new_list = list_cls()
+    for category in meta['categories']:
+        entry = new_list.entry.add()
+        if category['mode'] == 'full':
+            entry.ParseFromString(take(category['size']))
+            continue
+
+        entry.ParseFromString(take(category['header']))
+        old_records = list(getattr(old_entries[category['name']], field))
+        removed = set(decode_indices(category['removed']))
+        kept = iter([record for index, record in enumerate(old_records) if index not in removed])
+        added = dict(zip(decode_indices(category['added']),
+                         (record_cls.FromString(take(size)) for size in category['sizes'])))
+
+        records = getattr(entry, field)
+        total = len(old_records) - len(removed) + len(added)
+        for index in range(total):
+            records.append(added[index] if index in added else next(kept))
+
+    new_data = new_list.SerializeToString()
+    if len(new_data) != meta['new_size'] or hashlib.sha256(new_data).hexdigest() != meta['new_sha256']:
+        raise ValueError('rebuilt file does not match the delta checksum')
+    return new_data
+
+
+def write_delta(old_path, new_path, kind, delta_path):
+    """Write a delta between two .dat files and print its size"""
+    old_data = Path(old_path).read_bytes()
+    new_data = Path(new_path).read_bytes()
+    delta, stats = make_delta(old_data, new_data, kind)
+    Path(delta_path).write_bytes(delta)
+    print(f"  ✓ Delta {delta_path}: {len(delta)} bytes "
+          f"(+{stats['added']}/-{stats['removed']} records, {stats['full']} full categories, "
+          f"{len(new_data)} bytes uncompressed)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Create or apply .dat release deltas')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    create = subparsers.add_parser('create', help='Create a delta between two releases')
+    create.add_argument('--kind', choices=sorted(DAT_KINDS), required=True)
+    create.add_argument('--old', required=True, help='Previous .dat file')
+    create.add_argument('--new', required=True, help='New .dat file')
+    create.add_argument('--output', required=True, help='Delta output path')
+
+    apply = subparsers.add_parser('apply', help='Rebuild the new .dat from the old one')
+    apply.add_argument('--old', required=True, help='Previous .dat file')
+    apply.add_argument('--delta', required=True, help='Delta file')
+    apply.add_argument('--output', required=True, help='Output .dat path')
+
+    args = parser.parse_args()
+
+    if args.command == 'create':
+        write_delta(args.old, args.new, args.kind, args.output)
+        return 0
+
+    try:
+        new_data = apply_delta(Path(args.old).read_bytes(), Path(args.delta).read_bytes())
+    except (ValueError, KeyError, zlib.error) as e:
+        print(f"Error: {e}")
+        return 1
+
+    output = Path(args.output)
+    tmp_path = output.with_name(output.name + '.tmp')
+    tmp_path.write_bytes(new_data)
+    tmp_path.replace(output)
+    print(f"✓ Rebuilt {output} ({len(new_data)} bytes, checksum OK)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
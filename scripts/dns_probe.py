@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Batched DNS liveness checks over raw UDP
+Sends A queries for many names over a few non-blocking sockets to one
+resolver, matches replies by query ID and question name, retries lost
+queries and classifies each name as NOERROR, NODATA, NXDOMAIN, SERVFAIL,
+REFUSED or TIMEOUT (no answer)
+"""
+
+import sys
+import time
+import random
+import select
+import socket
+import struct
+import argparse
+
+DNS_PORT = 53
+DNS_SOCKETS = 4
+DNS_TIMEOUT = 1.0
+DNS_RETRIES = 2
+# Queries in flight per socket; resolvers start dropping well above this
+DNS_WINDOW = 256
+RESOLV_CONF = '/etc/resolv.conf'
+FALLBACK_RESOLVER = '77.88.8.8'
+
+QTYPE_A = 1
+QCLASS_IN = 1
+HEADER = struct.Struct('>HHHHHH')
+RCODES = {0: 'NOERROR', 1: 'FORMERR', 2: 'SERVFAIL', 3: 'NXDOMAIN', 4: 'NOTIMP', 5: 'REFUSED'}
+
+
+def encode_name(name):
+    labels = name.rstrip('.').encode('idna').split(b'.')
+    return b''.join(bytes([len(label)]) + label for label in labels) + b'\0'
+
+
+def build_query(query_id, name, qtype=QTYPE_A):
+    """DNS query with recursion desired"""
+    return HEADER.pack(query_id, 0x0100, 1, 0, 0, 0) + encode_name(name) + struct.pack('>HH', qtype, QCLASS_IN)
+
+
+def read_name(data, offset):
+    """Read an uncompressed question name; returns (name, offset after it)"""
+    labels = []
+    while True:
+        length = data[offset]
+        offset += 1
+        if length == 0:
+            return '.'.join(labels), offset
+        if length & 0xC0:
+            raise ValueError('compressed name in question')
+        labels.append(data[offset:offset + length].decode('ascii', 'replace'))
+        offset += length
+
+
+def parse_response(data):
+    """(query ID, question name, status) of a reply; raises ValueError if malformed"""
+    if len(data) < HEADER.size:
+        raise ValueError('short reply')
+    query_id, flags, qdcount, ancount, _, _ = HEADER.unpack_from(data)
+    if not flags & 0x8000 or qdcount != 1:
+        raise ValueError('not a reply to a single question')
+    name, _ = read_name(data, HEADER.size)
+    rcode = flags & 0x000F
+    status = RCODES.get(rcode, f'RCODE{rcode}')
+    if status == 'NOERROR' and ancount == 0:
+        status = 'NODATA'
+    return query_id, name.lower(), status
+
+
+def system_resolver():
+    """First nameserver from /etc/resolv.conf"""
+    try:
+        with open(RESOLV_CONF, 'r', encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == 'nameserver':
+                    return parts[1]
+    except OSError:
+        pass
+    return FALLBACK_RESOLVER
+
+
+def parse_resolver(value):
+    """'host', 'host:port' or '[v6]:port' -> (host, port)"""
+    if not value:
+        return system_resolver(), DNS_PORT
+    if value.startswith('['):
+        host, _, port = value[1:].partition(']:')
+        return host, int(port or DNS_PORT)
+    if value.count(':') == 1:
+        host, port = value.split(':')
+        return host, int(port)
+    return value, DNS_PORT
+
+
+class BatchResolver:
+    """Resolve many names at once against one resolver over a few UDP sockets"""
+
+    def __init__(self, server, sockets=DNS_SOCKETS, timeout=DNS_TIMEOUT, retries=DNS_RETRIES,
+                 window=DNS_WINDOW):
+        self.server = server
+        self.timeout = timeout
+        self.retries = retries
+        self.window = window
+        family = socket.AF_INET6 if ':' in server[0] else socket.AF_INET
+        self.sockets = []
+        for _ in range(sockets):
+            sock = socket.socket(family, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            sock.connect(server)
+            self.sockets.append(sock)
+
+    def close(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def resolve(self, names, on_result=None):
+        """Classify names: {name: status}; on_result(name, status) is called as answers arrive"""
+        queue = list(dict.fromkeys(name.lower().rstrip('.') for name in names))
+        queue.reverse()
+        results = {}
+        # Per socket: query ID -> [name, packet, sent_at, attempts]
+        pending = [{} for _ in self.sockets]
+        by_fd = {sock.fileno(): index for index, sock in enumerate(self.sockets)}
+        next_id = [random.randrange(1 << 16) for _ in self.sockets]
+
+        def finish(name, status):
+            results[name] = status
+            if on_result:
+                on_result(name, status)
+
+        def send(index, query_id, entry):
+            try:
+                self.sockets[index].send(entry[1])
+            except BlockingIOError:
+                pass  # treated as lost; the retry timer resends it
+            except OSError:
+                entry[3] = self.retries  # e.g. ICMP port unreachable: no further attempts
+            entry[2] = time.monotonic()
+            entry[3] += 1
+
+        while queue or any(pending):
+            # Fill every socket's window with new queries
+            for index in range(len(self.sockets)):
+                while queue and len(pending[index]) < self.window:
+                    name = queue.pop()
+                    query_id = next_id[index]
+                    while query_id in pending[index]:
+                        query_id = (query_id + 1) & 0xFFFF
+                    next_id[index] = (query_id + 1) & 0xFFFF
+                    try:
+                        packet = build_query(query_id, name)
+                    except UnicodeError:
+                        finish(name, 'FORMERR')
+                        continue
+                    entry = [name, packet, 0.0, 0]
+                    pending[index][query_id] = entry
+                    send(index, query_id, entry)
+
+            ready, _, _ = select.select(self.sockets, [], [], min(self.timeout / 4, 0.05))
+            for sock in ready:
+                index = by_fd[sock.fileno()]
+                while True:
+                    try:
+                        data = sock.recv(4096)
+                    except BlockingIOError:
+                        break
+                    except OSError:
+                        break
+                    try:
+                        query_id, name, status = parse_response(data)
+                    except (ValueError, IndexError):
+                        continue
+                    entry = pending[index].get(query_id)
+                    # A late reply to a reused ID must also match the question
+                    if entry is None or entry[0] != name:
+                        continue
+                    del pending[index][query_id]
+                    finish(name, status)
+
+            # Resend or give up on queries whose timer ran out
+            now = time.monotonic()
+            for index, waiting in enumerate(pending):
+                for query_id, entry in list(waiting.items()):
+                    if now - entry[2] < self.timeout:
+                        continue
+                    if entry[3] > self.retries:
+                        del waiting[query_id]
+                        finish(entry[0], 'TIMEOUT')
+                    else:
+                        send(index, query_id, entry)
+
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Classify domains by DNS status in batches')
+    parser.add_argument('names', nargs='*', help='Names to resolve (default: one per line from stdin)')
+    parser.add_argument('--resolver', help='Resolver host[:port] (default: first nameserver in /etc/resolv.conf)')
+    parser.add_argument('--sockets', type=int, default=DNS_SOCKETS, help='UDP sockets to spread queries over')
+    parser.add_argument('--timeout', type=float, default=DNS_TIMEOUT, help='Seconds before a query is resent')
+    parser.add_argument('--retries', type=int, default=DNS_RETRIES, help='Resends before a name is TIMEOUT')
+    args = parser.parse_args()
+
+    names = args.names or [line.split()[0] for line in sys.stdin if line.strip() and not line.startswith('#')]
+    start = time.perf_counter()
+    with BatchResolver(parse_resolver(args.resolver), args.sockets, args.timeout, args.retries) as resolver:
+        results = resolver.resolve(names, lambda name, status: print(f"{name}\t{status}", flush=True))
+    elapsed = time.perf_counter() - start
+
+    counts = {}
+    for status in results.values():
+        counts[status] = counts.get(status, 0) + 1
+    summary = ', '.join(f"{status}: {count}" for status, count in sorted(counts.items()))
+    print(f"✓ {len(results)} names in {elapsed:.2f}s ({len(results) / max(elapsed, 1e-9):.0f}/s) — {summary}",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Import AdGuard DNS and hosts-format filter lists into the domain list format
+Streams the filter files once, normalizes every rule to a punycode hostname,
+drops blocking rules unblocked by @@ exceptions, deduplicates rules and drops
+the ones already covered by a parent domain rule, and writes the smallest
+equivalent list with optional @attributes
+"""
+
+import re
+import sys
+import argparse
+import ipaddress
+from pathlib import Path
+
+# Add scripts directory to path for importing shared modules
+sys.path.insert(0, str(Path(__file__).parent))
+from build_dat import parse_domain_rule
+
+# $modifiers that do not narrow a DNS blocking rule; anything else is skipped
+NEUTRAL_MODIFIERS = {'important', 'all', 'document', 'doc', 'popup', 'third-party', '3p'}
+# Hostnames that hosts files map to loopback addresses for the system itself
+HOSTS_RESERVED = {'localhost', 'localhost.localdomain', 'local', 'broadcasthost',
+                  'ip6-localhost', 'ip6-loopback', 'ip6-localnet', 'ip6-mcastprefix',
+                  'ip6-allnodes', 'ip6-allrouters', 'ip6-allhosts', '0.0.0.0'}
+HOSTNAME_PATTERN = re.compile(r'^(?!-)[a-z0-9_-]{1,63}(?<!-)(\.(?!-)[a-z0-9_-]{1,63}(?<!-))+$')
+IPV4_PATTERN = re.compile(r'^\d{1,3}(\.\d{1,3}){3}$')
+# Most DNS filter lines are a bare "||host^"; they skip the general parser
+BASIC_RULE_PATTERN = re.compile(r'\|\|([a-z0-9_.-]+)\^\|?')
+UNSUPPORTED_PATTERN = re.compile(r'[*^/|:]')
+# Exceptions listed by name in the "cannot be expressed" warning
+UNEXPRESSED_SHOWN = 10
+
+
+def normalize_hostname(name):
+    """Lowercase punycode hostname, or None if it is not a valid domain name"""
+    name = name.strip().rstrip('.').lower()
+    if not name or len(name) > 253:
+        return None
+    if not name.isascii():
+        try:
+            name = name.encode('idna').decode('ascii')
+        except UnicodeError:
+            return None
+    if IPV4_PATTERN.match(name) or not HOSTNAME_PATTERN.match(name):
+        return None
+    return name
+
+
+def is_ip_address(text):
+    try:
+        ipaddress.ip_address(text)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_adguard_rule(line):
+    """(type, hostname, exception, important) for a DNS rule, or a skip reason string
+
+    type is 'domain' or 'full'; exception is True for @@ rules and important
+    for rules with the $important modifier.
+    """
+    exception = line.startswith('@@')
+    if exception:
+        line = line[2:]
+    if '##' in line or '#@#' in line or '#?#' in line or '#$#' in line:
+        return 'cosmetic'
+    if line.startswith('/') and line.endswith('/'):
+        return 'regexp'
+
+    rule, _, modifiers = line.partition('$')
+    modifiers = set(modifiers.split(',')) if modifiers else set()
+    if not modifiers <= NEUTRAL_MODIFIERS:
+        return 'modifier'
+
+    if rule.startswith('||'):
+        rule_type, rule = 'domain', rule[2:]
+    elif rule.startswith('|'):
+        rule_type, rule = 'full', rule[1:]
+    else:
+        rule_type = 'domain'
+    rule = rule.rstrip('|')
+    if rule.endswith('^'):
+        rule = rule[:-1]
+    if UNSUPPORTED_PATTERN.search(rule):
+        return 'wildcard'
+    if IPV4_PATTERN.match(rule):
+        return 'ip'
+
+    hostname = normalize_hostname(rule)
+    return (rule_type, hostname, exception, 'important' in modifiers) if hostname else 'invalid'
+
+
+def parse_filter_line(line):
+    """Rules of one filter line: a list of (type, hostname, exception, important), or a skip reason string"""
+    line = line.strip()
+    if not line or line[0] in '!#[':
+        return 'comment'
+    basic = BASIC_RULE_PATTERN.fullmatch(line)
+    if basic and HOSTNAME_PATTERN.match(basic.group(1)):
+        return [('domain', basic.group(1), False, False)]
+
+    parts = line.split()
+    # hosts format: "0.0.0.0 ads.example.com tracker.example.com # comment"
+    if len(parts) > 1 and is_ip_address(parts[0]):
+        rules = []
+        for name in parts[1:]:
+            if name.startswith('#'):
+                break
+            hostname = normalize_hostname(name)
+            if hostname and hostname not in HOSTS_RESERVED:
+                rules.append(('full', hostname, False, False))
+        return rules or 'invalid'
+
+    # Plain domain list lines ("example.com", "full:example.com @ads") pass through
+    if ':' in parts[0] and not parts[0].startswith('|'):
+        if parts[0].startswith('include:'):
+            return 'include'
+        rule = parse_domain_rule(line)
+        if not rule:
+            return 'invalid'
+        if rule[0] not in ('domain', 'full'):
+            return rule[0]
+        hostname = normalize_hostname(rule[1])
+        return [(rule[0], hostname, False, False)] if hostname else 'invalid'
+
+    rule = parse_adguard_rule(parts[0])
+    return [rule] if isinstance(rule, tuple) else rule
+
+
+def open_filter(path):
+    if str(path) == '-':
+        return sys.stdin
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+
+def read_filters(paths, stats):
+    """Stream filter files into (suffix rules, full-match rules, important rules, exceptions)
+
+    important is a set of (type, hostname) blocking rules with $important;
+    exceptions maps 'domain' and 'full' to {hostname: important}.
+    """
+    suffixes = set()
+    fulls = set()
+    important = set()
+    exceptions = {'domain': {}, 'full': {}}
+    for path in paths:
+        with open_filter(path) as f:
+            for line in f:
+                stats['lines'] += 1
+                rules = parse_filter_line(line)
+                if isinstance(rules, str):
+                    if rules != 'comment':
+                        stats['skipped'][rules] = stats['skipped'].get(rules, 0) + 1
+                    continue
+                for rule_type, hostname, exception, is_important in rules:
+                    if exception:
+                        stats['exceptions'] += 1
+                        allowed = exceptions[rule_type]
+                        allowed[hostname] = allowed.get(hostname, False) or is_important
+                        continue
+                    stats['rules'] += 1
+                    (suffixes if rule_type == 'domain' else fulls).add(hostname)
+                    if is_important:
+                        important.add((rule_type, hostname))
+    return suffixes, fulls, important, exceptions
+
+
+def covered_by_suffix(hostname, suffixes, include_self):
+    """True if hostname (or, with include_self, hostname itself) is under a suffix rule"""
+    position = -1 if include_self else hostname.find('.')
+    while True:
+        candidate = hostname[position + 1:]
+        if candidate in suffixes:
+            return True
+        position = hostname.find('.', position + 1)
+        if position < 0:
+            return False
+
+
+def apply_exceptions(suffixes, fulls, important, exceptions):
+    """Drop blocking rules unblocked by @@ exceptions.
+
+    A domain exception unblocks the name and its subdomains, a full exception
+    only the name; $important blocking rules give way only to $important
+    exceptions. Returns (suffixes, fulls, unexpressed), where unexpressed
+    lists exceptions that a kept domain rule still blocks: the domain list
+    format has no way to carve them out.
+    """
+    allow_domains = set(exceptions['domain'])
+    allow_fulls = set(exceptions['full'])
+    strong_domains = {name for name, strong in exceptions['domain'].items() if strong}
+    strong_fulls = {name for name, strong in exceptions['full'].items() if strong}
+
+    def unblocked(rule_type, name):
+        if (rule_type, name) in important:
+            domains, names = strong_domains, strong_fulls
+        else:
+            domains, names = allow_domains, allow_fulls
+        return covered_by_suffix(name, domains, True) or (rule_type == 'full' and name in names)
+
+    kept_suffixes = {name for name in suffixes if not unblocked('domain', name)}
+    kept_fulls = {name for name in fulls if not unblocked('full', name)}
+
+    unexpressed = []
+    for rule_type, names in exceptions.items():
+        for name, strong in names.items():
+            parents = [name] + [name[i + 1:] for i, char in enumerate(name) if char == '.']
+            if any(parent in kept_suffixes and (strong or ('domain', parent) not in important)
+                   for parent in parents):
+                unexpressed.append(name if rule_type == 'domain' else f'full:{name}')
+    return kept_suffixes, kept_fulls, sorted(unexpressed)
+
+
+def minimize(suffixes, fulls):
+    """Drop suffix rules under another suffix rule and full rules under any suffix rule"""
+    kept_suffixes = {name for name in suffixes if not covered_by_suffix(name, suffixes, False)}
+    kept_fulls = {name for name in fulls if not covered_by_suffix(name, kept_suffixes, True)}
+    return kept_suffixes, kept_fulls
+
+
+def commented_domains(path):
+    """Domains commented out in an existing list (marked unavailable by check-domains.py)"""
+    disabled = set()
+    if not path.exists():
+        return disabled
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.strip()
+            if not line.startswith('#'):
+                continue
+            rule = parse_domain_rule(line[1:].strip())
+            if rule and rule[0] in ('domain', 'full'):
+                disabled.add((rule[0], rule[1]))
+    return disabled
+
+
+def write_domain_list(path, suffixes, fulls, attributes=(), disabled=()):
+    """Write rules sorted by name; entries in disabled stay commented out"""
+    suffix = ''.join(f' @{attribute}' for attribute in attributes)
+    rules = sorted([(name, 'domain') for name in suffixes] + [(name, 'full') for name in fulls])
+
+    commented = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for name, rule_type in rules:
+            text = name if rule_type == 'domain' else f'full:{name}'
+            if (rule_type, name) in disabled:
+                commented += 1
+                f.write(f'# {text}{suffix}\n')
+            else:
+                f.write(f'{text}{suffix}\n')
+    return commented
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Import AdGuard/hosts filter lists into a domain list')
+    parser.add_argument('filters', nargs='+', help="Filter files in AdGuard or hosts format ('-' for stdin)")
+    parser.add_argument('--output', required=True, help='Domain list file to write (e.g. domains/ads/AdguardFilterDNS)')
+    parser.add_argument('--attribute', action='append', default=[],
+                        help='Attribute added to every rule, repeatable (e.g. --attribute ads)')
+    parser.add_argument('--reset-commented', action='store_true',
+                        help='Do not keep domains commented out in the existing output as commented')
+    args = parser.parse_args()
+
+    output_path = Path(args.output)
+    stats = {'lines': 0, 'rules': 0, 'exceptions': 0, 'skipped': {}}
+
+    print(f"=== Importing {len(args.filters)} filter file(s) ===")
+    suffixes, fulls, important, exceptions = read_filters(args.filters, stats)
+    unique = len(suffixes) + len(fulls)
+    suffixes, fulls, unexpressed = apply_exceptions(suffixes, fulls, important, exceptions)
+    allowed = unique - len(suffixes) - len(fulls)
+    suffixes, fulls = minimize(suffixes, fulls)
+    kept = len(suffixes) + len(fulls)
+
+    disabled = set() if args.reset_commented else commented_domains(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    commented = write_domain_list(output_path, suffixes, fulls, args.attribute, disabled)
+
+    print(f"  ✓ {stats['lines']} lines, {stats['rules']} blocking rules, {unique} unique")
+    if stats['exceptions']:
+        print(f"  ✓ {stats['exceptions']} exception rules unblocked {allowed} blocking rules")
+    print(f"  ✓ {unique - allowed - kept} covered by a parent domain rule, {kept} written "
+          f"({len(suffixes)} domain, {len(fulls)} full)")
+    if unexpressed:
+        shown = ', '.join(unexpressed[:UNEXPRESSED_SHOWN])
+        more = f" and {len(unexpressed) - UNEXPRESSED_SHOWN} more" if len(unexpressed) > UNEXPRESSED_SHOWN else ''
+        print(f"  ⚠ {len(unexpressed)} exceptions stay blocked by a kept parent domain rule "
+              f"(not expressible as domain rules): {shown}{more}")
+    if commented:
+        print(f"  ✓ {commented} kept commented out as in the previous {output_path.name}")
+    if stats['skipped']:
+        skipped = ', '.join(f"{reason}: {count}" for reason, count in sorted(stats['skipped'].items()))
+        print(f"  ⚠ Skipped rules that cannot be expressed as domain rules — {skipped}")
+    print(f"  Saved to: {output_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
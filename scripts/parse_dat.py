@@ -4,36 +4,261 @@ Parse .dat files (geosite.dat and geoip.dat) from v2ray/xray
 Extracts specific categories and converts them to intermediate format
 """
 
-import os
 import sys
+import json
+import time
+import hashlib
+import threading
 import requests
+import requests.adapters
 import argparse
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
 # Add scripts directory to path for importing proto files
 sys.path.insert(0, str(Path(__file__).parent))
 import common_pb2
+from profiling import add_profile_arguments, start_from_args, stage
 
+FETCH_CACHE_NAME = '.fetch-cache.json'
+DOWNLOAD_CONNECTIONS = 4
+DOWNLOAD_SEGMENT_SIZE = 4 * 1024 * 1024
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+DOWNLOAD_RETRIES = 4
+
+
+def create_session(pool_size=DOWNLOAD_CONNECTIONS):
+    """Create the pooled HTTP session shared by all requests of a run"""
+    session = requests.Session()
+    session.headers['User-Agent'] = 'RU-domain-list-for-whitelist/parse_dat'
+    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def load_fetch_cache(path):
+    """Load the fetch cache (validators and asset ids keyed by URL)"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_fetch_cache(path, cache):
+    tmp_path = Path(str(path) + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(cache, f, indent=2, sort_keys=True)
+    tmp_path.replace(path)
+
+
+def conditional_headers(entry):
+    """Build If-None-Match/If-Modified-Since headers from a cache entry"""
+    headers = {}
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def remember_validators(cache, url, response, **extra):
+    cache[url] = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        **extra,
+    }
+
+
+class RangeIgnored(Exception):
+    """The server answered a ranged request with the whole file"""
+
+
+def is_retryable(error):
+    """Connection errors, timeouts and 5xx replies are worth retrying; 4xx are not"""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+def with_retries(action, description):
+    """Run action, retrying transient network errors with exponential backoff"""
+    for attempt in range(DOWNLOAD_RETRIES):
+        try:
+            return action()
+        except requests.RequestException as e:
+            if attempt == DOWNLOAD_RETRIES - 1 or not is_retryable(e):
+                raise
+            delay = 2 ** attempt
+            print(f"  ⚠ {description} failed ({e}), retrying in {delay}s...")
+            time.sleep(delay)
+
+
+def fetch_segment(session, url, tmp_path, start, end, etag):
+    """Fetch bytes [start, end] into the preallocated file at the same offset.
+
+    A 200 instead of 206 means the file changed since HEAD (If-Range did not
+    match) or the server ignores ranges; retrying the range would not help.
+    """
+    headers = {'Range': f'bytes={start}-{end}'}
+    if etag:
+        headers['If-Range'] = etag
+    with session.get(url, stream=True, timeout=30, headers=headers) as response:
+        response.raise_for_status()
+        if response.status_code != 206:
+            raise RangeIgnored(f"server ignored range {start}-{end} (status {response.status_code})")
+        offset = start
+        with open(tmp_path, 'r+b') as f:
+            f.seek(start)
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_BUFFER_SIZE):
+                f.write(chunk)
+                offset += len(chunk)
+    if offset != end + 1:
+        raise requests.ConnectionError(f"short read for range {start}-{end}")
+
+
+def fetch_ranges(session, url, tmp_path, size, etag, connections):
+    """Download a file as parallel byte ranges, resuming completed segments.
+
+    Progress is kept in a sidecar next to the partial file, so a rerun after
+    a failure only fetches the segments that are still missing.
+    """
+    state_path = Path(str(tmp_path) + '.json')
+    state = {}
+    if tmp_path.exists() and state_path.exists():
+        try:
+            state = json.loads(state_path.read_text())
+        except ValueError:
+            state = {}
+    if state.get('etag') != etag or state.get('size') != size or tmp_path.stat().st_size != size:
+        state = {'etag': etag, 'size': size, 'done': []}
+        with open(tmp_path, 'wb') as f:
+            f.truncate(size)
+
+    segments = [(start, min(start + DOWNLOAD_SEGMENT_SIZE, size) - 1)
+                for start in range(0, size, DOWNLOAD_SEGMENT_SIZE)]
+    pending = [segment for segment in segments if segment[0] not in state['done']]
+    if len(pending) < len(segments):
+        print(f"  Resuming: {len(segments) - len(pending)}/{len(segments)} segments already downloaded")
+
+    lock = threading.Lock()
+
+    def run(segment):
+        start, end = segment
+        with_retries(lambda: fetch_segment(session, url, tmp_path, start, end, etag),
+                     f"Range {start}-{end}")
+        with lock:
+            state['done'].append(start)
+            state_path.write_text(json.dumps(state))
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, connections)) as executor:
+            list(executor.map(run, pending))
+    finally:
+        if len(state['done']) == len(segments):
+            state_path.unlink(missing_ok=True)
+
+
+def fetch_stream(session, url, tmp_path):
+    """Download a file over a single connection when ranges are not supported"""
+    def run():
+        with session.get(url, stream=True, timeout=30) as response:
+            response.raise_for_status()
+            with open(tmp_path, 'wb', buffering=DOWNLOAD_BUFFER_SIZE) as f:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_BUFFER_SIZE):
+                    f.write(chunk)
+    with_retries(run, f"Download of {url}")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_BUFFER_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def download_file(url, output_path, session=None, cache=None, asset=None, connections=DOWNLOAD_CONNECTIONS):
+    """Download a file from URL to output_path.
+
+    Large files are fetched as parallel byte ranges into a preallocated
+    partial file that survives failures, then checked against the expected
+    size and SHA-256 (from the release asset, when known) and atomically
+    moved into place. With a cache, the download is skipped when the cached
+    copy belongs to the same release asset or the server answers 304 Not
+    Modified. Returns True if output_path was (re)written.
+    """
+    session = session or create_session()
+    asset = asset or {}
+    entry = (cache or {}).get(url, {})
+    output_path = Path(output_path)
+    tmp_path = output_path.with_name(output_path.name + '.part')
+
+    headers = {}
+    if cache is not None and output_path.exists():
+        if asset.get('id') is not None and entry.get('asset_id') == asset['id'] \
+                and entry.get('size') == output_path.stat().st_size:
+            print(f"✓ {output_path.name} is up to date (asset {asset['id']}), skipping download")
+            return False
+        headers = conditional_headers(entry)
+
+    def head():
+        response = session.head(url, timeout=30, headers=headers, allow_redirects=True)
+        response.raise_for_status()
+        return response
 
-def download_file(url, output_path):
-    """Download a file from URL to output_path"""
     print(f"Downloading {url}...")
-    response = requests.get(url, stream=True, timeout=30)
-    response.raise_for_status()
-    
-    with open(output_path, 'wb') as f:
-        for chunk in response.iter_content(chunk_size=8192):
-            f.write(chunk)
-    
-    print(f"✓ Downloaded to {output_path}")
+    response = with_retries(head, f"HEAD {url}")
+    if response.status_code == 304:
+        print(f"✓ {output_path.name} not modified upstream, skipping download")
+        return False
+
+    # Ranged requests go to the final URL to avoid a redirect per segment
+    final_url = response.url
+    size = int(response.headers.get('Content-Length') or 0) or asset.get('size')
+    etag = response.headers.get('ETag')
+    if response.headers.get('Accept-Ranges') == 'bytes' and size:
+        try:
+            fetch_ranges(session, final_url, tmp_path, size, etag, connections)
+        except RangeIgnored as e:
+            # Segments of the old file must not be mixed with the new one
+            print(f"  ⚠ {e}, restarting the download over a single connection")
+            Path(str(tmp_path) + '.json').unlink(missing_ok=True)
+            fetch_stream(session, final_url, tmp_path)
+    else:
+        fetch_stream(session, final_url, tmp_path)
+
+    actual_size = tmp_path.stat().st_size
+    expected_size = asset.get('size') or size
+    if expected_size and actual_size != expected_size:
+        tmp_path.unlink()
+        raise IOError(f"size mismatch for {url}: expected {expected_size}, got {actual_size}")
+    digest = file_sha256(tmp_path)
+    if asset.get('sha256') and digest != asset['sha256']:
+        tmp_path.unlink()
+        raise IOError(f"SHA-256 mismatch for {url}: expected {asset['sha256']}, got {digest}")
+    tmp_path.replace(output_path)
+    
+    if cache is not None:
+        remember_validators(cache, url, response, asset_id=asset.get('id'),
+                            size=actual_size, sha256=digest)
+    print(f"✓ Downloaded to {output_path} ({actual_size} bytes, sha256 {digest[:16]}…)")
+    return True
 
 
-def get_latest_release_assets(repo):
-    """Get download URLs for latest release assets"""
-    api_url = f"https://api.github.com/repos/{repo}/releases/latest"
+def get_latest_release_assets(repo, session=None, cache=None, api_base='https://api.github.com'):
+    """Get download URLs and ids for latest release assets"""
+    session = session or create_session()
+    api_url = f"{api_base.rstrip('/')}/repos/{repo}/releases/latest"
     print(f"Fetching latest release from {repo}...")
     
-    response = requests.get(api_url, timeout=30)
+    entry = (cache or {}).get(api_url, {})
+    headers = conditional_headers(entry) if entry.get('assets') else {}
+    response = session.get(api_url, timeout=30, headers=headers)
+    if response.status_code == 304:
+        print("✓ Latest release not modified since last run")
+        return entry['assets']
     response.raise_for_status()
     
     release_data = response.json()
@@ -42,8 +267,16 @@ def get_latest_release_assets(repo):
     for asset in release_data['assets']:
         name = asset['name']
         if name == 'geosite.dat' or name == 'geoip.dat':
-            assets[name] = asset['browser_download_url']
-    
+            digest = asset.get('digest') or ''
+            assets[name] = {
+                'url': asset['browser_download_url'],
+                'id': asset.get('id'),
+                'size': asset.get('size'),
+                'sha256': digest[7:] if digest.startswith('sha256:') else None,
+            }
+    
+    if cache is not None:
+        remember_validators(cache, api_url, response, assets=assets)
     return assets
 
 
@@ -51,11 +284,12 @@ def parse_geosite_dat(dat_file, categories):
     """Parse geosite.dat and extract specified categories"""
     print(f"\nParsing {dat_file}...")
     
-    with open(dat_file, 'rb') as f:
+    with stage('load'), open(dat_file, 'rb') as f:
         data = f.read()
     
-    geosite_list = common_pb2.GeoSiteList()
-    geosite_list.ParseFromString(data)
+    with stage('parse'):
+        geosite_list = common_pb2.GeoSiteList()
+        geosite_list.ParseFromString(data)
     
     extracted = {}
     found_categories = set()
@@ -93,11 +327,12 @@ def parse_geoip_dat(dat_file, categories):
     """Parse geoip.dat and extract specified categories"""
     print(f"\nParsing {dat_file}...")
     
-    with open(dat_file, 'rb') as f:
+    with stage('load'), open(dat_file, 'rb') as f:
         data = f.read()
     
-    geoip_list = common_pb2.GeoIPList()
-    geoip_list.ParseFromString(data)
+    with stage('parse'):
+        geoip_list = common_pb2.GeoIPList()
+        geoip_list.ParseFromString(data)
     
     extracted = {}
     found_categories = set()
@@ -143,16 +378,27 @@ def main():
                         help='GeoIP categories to extract')
     parser.add_argument('--output-dir', default='output',
                         help='Output directory for extracted data')
+    parser.add_argument('--api-url', default='https://api.github.com',
+                        help='Base URL of the GitHub API (for mirrors and local testing)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignore the fetch cache and always download and re-extract')
+    add_profile_arguments(parser)
     
     args = parser.parse_args()
+    start_from_args(args)
     
     # Create output directory
     output_dir = Path(args.output_dir)
     output_dir.mkdir(exist_ok=True)
     
+    session = create_session()
+    cache_path = output_dir / FETCH_CACHE_NAME
+    cache = None if args.no_cache else load_fetch_cache(cache_path)
+    
     # Download latest release files
     try:
-        assets = get_latest_release_assets(args.source_repo)
+        with stage('fetch'):
+            assets = get_latest_release_assets(args.source_repo, session, cache, args.api_url)
     except Exception as e:
         print(f"Error fetching release: {e}")
         sys.exit(1)
@@ -160,7 +406,9 @@ def main():
     # Download geosite.dat
     geosite_path = output_dir / 'source_geosite.dat'
     if 'geosite.dat' in assets:
-        download_file(assets['geosite.dat'], geosite_path)
+        with stage('download'):
+            geosite_changed = download_file(assets['geosite.dat']['url'], geosite_path,
+                                            session, cache, assets['geosite.dat'])
     else:
         print("Error: geosite.dat not found in release")
         sys.exit(1)
@@ -168,11 +416,33 @@ def main():
     # Download geoip.dat
     geoip_path = output_dir / 'source_geoip.dat'
     if 'geoip.dat' in assets:
-        download_file(assets['geoip.dat'], geoip_path)
+        with stage('download'):
+            geoip_changed = download_file(assets['geoip.dat']['url'], geoip_path,
+                                          session, cache, assets['geoip.dat'])
     else:
         print("Error: geoip.dat not found in release")
         sys.exit(1)
     
+    extracted_geosite_path = output_dir / 'extracted_geosite.dat'
+    extracted_geoip_path = output_dir / 'extracted_geoip.dat'
+    
+    # Reuse previous extraction when neither sources nor categories changed
+    extraction_key = {
+        'geosite': [assets['geosite.dat']['id'], sorted(args.geosite_categories)],
+        'geoip': [assets['geoip.dat']['id'], sorted(args.geoip_categories)],
+    }
+    if cache is not None:
+        if not geosite_changed and not geoip_changed \
+                and cache.get('extraction') == extraction_key \
+                and extracted_geosite_path.exists() and extracted_geoip_path.exists():
+            save_fetch_cache(cache_path, cache)
+            print("\n✓ Upstream unchanged, reusing extracted_geosite.dat and extracted_geoip.dat")
+            print("\n✅ Parsing complete!")
+            return 0
+        # Forget the old key until the new extraction is written
+        cache.pop('extraction', None)
+        save_fetch_cache(cache_path, cache)
+    
     # Parse and extract categories
     geosite_data = parse_geosite_dat(geosite_path, args.geosite_categories)
     geoip_data = parse_geoip_dat(geoip_path, args.geoip_categories)
@@ -182,20 +452,26 @@ def main():
     for category_name, entry in geosite_data.items():
         geosite_extracted.entry.append(entry)
     
-    extracted_geosite_path = output_dir / 'extracted_geosite.dat'
-    with open(extracted_geosite_path, 'wb') as f:
-        f.write(geosite_extracted.SerializeToString())
+    with stage('serialize'):
+        data = geosite_extracted.SerializeToString()
+    with stage('write'), open(extracted_geosite_path, 'wb') as f:
+        f.write(data)
     print(f"\n✓ Saved extracted geosite data to {extracted_geosite_path}")
     
     geoip_extracted = common_pb2.GeoIPList()
     for category_name, entry in geoip_data.items():
         geoip_extracted.entry.append(entry)
     
-    extracted_geoip_path = output_dir / 'extracted_geoip.dat'
-    with open(extracted_geoip_path, 'wb') as f:
-        f.write(geoip_extracted.SerializeToString())
+    with stage('serialize'):
+        data = geoip_extracted.SerializeToString()
+    with stage('write'), open(extracted_geoip_path, 'wb') as f:
+        f.write(data)
     print(f"✓ Saved extracted geoip data to {extracted_geoip_path}")
     
+    if cache is not None:
+        cache['extraction'] = extraction_key
+        save_fetch_cache(cache_path, cache)
+    
     print("\n✅ Parsing complete!")
     return 0
 
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Single-process build pipeline driven by config.yml
+Runs fetch -> extract -> merge -> write without writing and re-parsing
+intermediate extracted_*.dat files, and skips stages whose inputs did not change
+"""
+
+import sys
+import json
+import hashlib
+import argparse
+from pathlib import Path
+
+import yaml
+
+# Add scripts directory to path for importing proto files
+sys.path.insert(0, str(Path(__file__).parent))
+import parse_dat
+import build_dat
+from profiling import add_profile_arguments, start_from_args, stage
+
+SCRIPTS_DIR = Path(__file__).parent
+REPO_ROOT = SCRIPTS_DIR.parent
+PIPELINE_STATE_NAME = '.pipeline-state.json'
+
+DEFAULT_CONFIG = {
+    'geosite_categories': ['category-ru', 'ru-blocked', 'ru-available-only-inside', 'category-ads-all'],
+    'geoip_categories': ['ru', 'ru-blocked', 'private'],
+    'source_repo': 'runetfreedom/russia-v2ray-rules-dat',
+    'whitelist_domains': 'domains/ru/category-ru',
+    'whitelist_ads': 'domains/ads',
+    'whitelist_ips': 'IPs',
+    'output_dir': 'output',
+    'compress': ['gzip', 'xz', 'zstd'],
+    'rule_set_dir': 'output/rule-set',
+    'geosite_whitelist_delta': None,
+    'geoip_whitelist_delta': None,
+}
+
+
+def load_config(path):
+    """Load config.yml on top of the defaults; paths are relative to the repository root"""
+    config = dict(DEFAULT_CONFIG)
+    with open(path, 'r', encoding='utf-8') as f:
+        config.update(yaml.safe_load(f) or {})
+    for key in ('whitelist_domains', 'whitelist_ads', 'whitelist_ips', 'output_dir', 'rule_set_dir'):
+        if config[key]:
+            config[key] = REPO_ROOT / config[key]
+    return config
+
+
+def tree_digest(path):
+    """SHA-256 over file names and contents below path (a file hashes its directory,
+    since include: directives point at siblings)"""
+    path = Path(path)
+    root = path.parent if path.is_file() else path
+    digest = hashlib.sha256()
+    if root.exists():
+        for filepath in sorted(p for p in root.rglob('*') if p.is_file()):
+            digest.update(str(filepath.relative_to(root)).encode('utf-8') + b'\0')
+            digest.update(filepath.read_bytes())
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    if not path or not Path(path).exists():
+        return None
+    return hashlib.sha256(Path(path).read_bytes()).hexdigest()
+
+
+def code_digest():
+    """SHA-256 of the build scripts, so code changes invalidate skipped stages"""
+    digest = hashlib.sha256()
+    for name in ('parse_dat.py', 'build_dat.py', 'pipeline.py', 'dat_delta.py', 'rule_sets.py',
+                 'whitelist_delta.py'):
+        digest.update((SCRIPTS_DIR / name).read_bytes())
+    return digest.hexdigest()
+
+
+def load_state(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch, extract, merge and write .dat files in one process')
+    parser.add_argument('--config', default=str(SCRIPTS_DIR / 'config.yml'),
+                        help='Pipeline configuration file')
+    parser.add_argument('--api-url', default='https://api.github.com',
+                        help='Base URL of the GitHub API (for mirrors and local testing)')
+    parser.add_argument('--previous-geosite',
+                        help='geosite.dat of the previous release, to write geosite.dat.delta')
+    parser.add_argument('--previous-geoip',
+                        help='geoip.dat of the previous release, to write geoip.dat.delta')
+    parser.add_argument('--force', action='store_true',
+                        help='Run every stage even if its inputs did not change')
+    add_profile_arguments(parser)
+
+    args = parser.parse_args()
+    start_from_args(args)
+    config = load_config(args.config)
+
+    output_dir = Path(config['output_dir'])
+    output_dir.mkdir(exist_ok=True)
+    state_path = output_dir / PIPELINE_STATE_NAME
+    cache_path = output_dir / parse_dat.FETCH_CACHE_NAME
+    cache = {} if args.force else parse_dat.load_fetch_cache(cache_path)
+    session = parse_dat.create_session()
+
+    # Stage 1: fetch
+    print("=== Fetch ===")
+    try:
+        with stage('fetch'):
+            assets = parse_dat.get_latest_release_assets(config['source_repo'], session, cache, args.api_url)
+    except Exception as e:
+        print(f"Error fetching release: {e}")
+        return 1
+
+    sources = {}
+    for name in ('geosite.dat', 'geoip.dat'):
+        if name not in assets:
+            print(f"Error: {name} not found in release")
+            return 1
+        sources[name] = output_dir / f'source_{name.replace(".dat", "")}.dat'
+        with stage('download'):
+            parse_dat.download_file(assets[name]['url'], sources[name], session, cache, assets[name])
+    parse_dat.save_fetch_cache(cache_path, cache)
+
+    # Skip extract/merge/write when nothing that feeds them changed
+    inputs = {
+        'assets': {name: assets[name].get('sha256') or assets[name].get('id') for name in sources},
+        'geosite_categories': config['geosite_categories'],
+        'geoip_categories': config['geoip_categories'],
+        'whitelist_domains': tree_digest(config['whitelist_domains']),
+        'whitelist_ads': tree_digest(config['whitelist_ads']),
+        'whitelist_ips': tree_digest(config['whitelist_ips']),
+        'code': code_digest(),
+        'compress': config['compress'],
+        'rule_set_dir': str(config['rule_set_dir']),
+        'whitelist_delta': [config['geosite_whitelist_delta'], config['geoip_whitelist_delta']],
+        'previous': [file_digest(args.previous_geosite), file_digest(args.previous_geoip)],
+    }
+    state = load_state(state_path)
+    outputs_exist = (output_dir / 'geosite.dat').exists() and (output_dir / 'geoip.dat').exists()
+    if not args.force and outputs_exist and state.get('inputs') == inputs:
+        print("\n✓ Sources, whitelists and categories unchanged, keeping existing geosite.dat and geoip.dat")
+        print("\n✅ Pipeline complete!")
+        return 0
+
+    # Stage 2: extract (entries stay in memory)
+    print("\n=== Extract ===")
+    geosite_data = parse_dat.parse_geosite_dat(sources['geosite.dat'], config['geosite_categories'])
+    geoip_data = parse_dat.parse_geoip_dat(sources['geoip.dat'], config['geoip_categories'])
+
+    # Stages 3-4: merge and write
+    cache_dir = output_dir / '.cache'
+    geosite_entries = build_dat.build_geosite_dat(
+        geosite_data.values(),
+        config['whitelist_domains'],
+        config['whitelist_ads'],
+        output_dir / 'geosite.dat',
+        cache_dir / 'geosite',
+        config['geosite_whitelist_delta']
+    )
+    geoip_entries = build_dat.build_geoip_dat(
+        geoip_data.values(),
+        config['whitelist_ips'],
+        output_dir / 'geoip.dat',
+        cache_dir / 'geoip',
+        config['geoip_whitelist_delta']
+    )
+    build_dat.write_release_extras(output_dir, config['compress'], args.previous_geosite, args.previous_geoip)
+    if config['rule_set_dir']:
+        with stage('rule_sets'):
+            build_dat.write_rule_sets(config['rule_set_dir'], geosite_entries, geoip_entries)
+
+    with open(state_path, 'w', encoding='utf-8') as f:
+        json.dump({'inputs': inputs}, f, indent=2)
+
+    print("\n✅ Pipeline complete!")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
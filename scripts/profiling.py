@@ -0,0 +1,147 @@
+"""
+Shared --profile support for the build and check scripts
+Records wall/CPU time per stage, peak RSS, top tracemalloc allocators and,
+optionally, a cProfile dump, and writes one JSON report per run
+"""
+
+import os
+import sys
+import json
+import time
+import atexit
+import cProfile
+import tracemalloc
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+TRACEMALLOC_TOP = 15
+
+_profiler = None
+
+
+class Profiler:
+    """Collects per-stage timings for one run and writes the JSON report"""
+
+    def __init__(self, report_path, cprofile_path=None, trace_memory=True):
+        self.report_path = report_path
+        self.cprofile_path = cprofile_path
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.open_stages = []
+        self.started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        self.cprofile = None
+
+        if trace_memory:
+            tracemalloc.start()
+        if cprofile_path:
+            self.cprofile = cProfile.Profile()
+            self.cprofile.enable()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage; time spent in stages nested inside it is not counted twice"""
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        nested = [0.0, 0.0]
+        self.open_stages.append(nested)
+        try:
+            yield
+        finally:
+            self.open_stages.pop()
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+            if self.open_stages:
+                self.open_stages[-1][0] += wall
+                self.open_stages[-1][1] += cpu
+            record = self.stages.setdefault(name, {'wall_sec': 0.0, 'cpu_sec': 0.0, 'calls': 0})
+            record['wall_sec'] += wall - nested[0]
+            record['cpu_sec'] += cpu - nested[1]
+            record['calls'] += 1
+
+    def peak_rss_kb(self):
+        if resource is None:
+            return None
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == 'darwin' else 1)
+
+    def report(self):
+        report = {
+            'script': os.path.basename(sys.argv[0]),
+            'argv': sys.argv[1:],
+            'started_at': self.started_at,
+            'wall_sec': round(time.perf_counter() - self.wall_start, 4),
+            'cpu_sec': round(time.process_time() - self.cpu_start, 4),
+            'peak_rss_kb': self.peak_rss_kb(),
+            'stages': {
+                name: {key: round(value, 4) if isinstance(value, float) else value
+                       for key, value in record.items()}
+                for name, record in self.stages.items()
+            },
+        }
+
+        if self.trace_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            report['tracemalloc'] = {
+                'current_kb': current // 1024,
+                'peak_kb': peak // 1024,
+                'top': [
+                    {
+                        'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                        'size_kb': stat.size // 1024,
+                        'count': stat.count,
+                    }
+                    for stat in snapshot.statistics('lineno')[:TRACEMALLOC_TOP]
+                ],
+            }
+
+        if self.cprofile is not None:
+            self.cprofile.disable()
+            self.cprofile.dump_stats(self.cprofile_path)
+            report['cprofile'] = self.cprofile_path
+
+        return report
+
+    def finish(self):
+        report = self.report()
+        with open(self.report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+            f.write('\n')
+        print(f"\nProfile report saved to {self.report_path}", file=sys.stderr)
+
+
+def add_profile_arguments(parser):
+    """Add the common --profile options to an argparse parser"""
+    parser.add_argument('--profile', metavar='REPORT.json',
+                        help='Write a JSON report with per-stage time, peak RSS and top allocators')
+    parser.add_argument('--profile-cprofile', metavar='FILE.prof',
+                        help='Also dump cProfile stats to this file (requires --profile)')
+    parser.add_argument('--profile-no-tracemalloc', action='store_true',
+                        help='Skip tracemalloc (it slows allocation-heavy runs)')
+
+
+def start_from_args(args):
+    """Start profiling if --profile was given; the report is written at exit"""
+    global _profiler
+    if not getattr(args, 'profile', None):
+        return None
+    _profiler = Profiler(args.profile, args.profile_cprofile, not args.profile_no_tracemalloc)
+    atexit.register(_profiler.finish)
+    return _profiler
+
+
+@contextmanager
+def stage(name):
+    """Time a named stage of the current run (no-op unless profiling is on)"""
+    if _profiler is None:
+        yield
+    else:
+        with _profiler.stage(name):
+            yield
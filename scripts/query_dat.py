@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+Offline lookup engine for built geosite.dat and geoip.dat files
+Answers "which categories match domain X or IP Y" without running Xray
+"""
+
+import re
+import sys
+import array
+import bisect
+import socket
+import argparse
+import functools
+import itertools
+import operator
+import ipaddress
+from pathlib import Path
+
+# Add scripts directory to path for importing proto files
+sys.path.insert(0, str(Path(__file__).parent))
+import common_pb2
+
+
+class DomainTrie:
+    """Reversed-label suffix trie with per-node masks in flat lists.
+
+    Labels are interned to integers and edges live in a single dict keyed by
+    (node, label_id), so the trie carries no per-node containers (it is not a
+    succinct trie). Each node holds two category bitmasks: one for RootDomain
+    and one for Full rules.
+    """
+
+    def __init__(self):
+        self.label_ids = {}
+        self.edges = {}
+        self.root_mask = [0]
+        self.full_mask = [0]
+
+    def insert(self, domain, bit, full=False):
+        node = 0
+        for label in reversed(domain.split('.')):
+            label_id = self.label_ids.setdefault(label, len(self.label_ids))
+            child = self.edges.get((node, label_id))
+            if child is None:
+                child = len(self.root_mask)
+                self.edges[(node, label_id)] = child
+                self.root_mask.append(0)
+                self.full_mask.append(0)
+            node = child
+        if full:
+            self.full_mask[node] |= bit
+        else:
+            self.root_mask[node] |= bit
+
+    def match(self, domain):
+        mask = 0
+        node = 0
+        label_ids = self.label_ids
+        edges = self.edges
+        for label in reversed(domain.split('.')):
+            label_id = label_ids.get(label)
+            if label_id is None:
+                return mask
+            node = edges.get((node, label_id))
+            if node is None:
+                return mask
+            mask |= self.root_mask[node]
+        return mask | self.full_mask[node]
+
+    def __len__(self):
+        return len(self.root_mask)
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over keyword (Plain) rules"""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [0]
+        self.built = False
+
+    def insert(self, keyword, bit):
+        state = 0
+        for char in keyword:
+            nxt = self.goto[state].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(0)
+            state = nxt
+        self.output[state] |= bit
+        self.built = False
+
+    def build(self):
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                target = self.goto[fallback].get(char, 0)
+                self.fail[nxt] = target if target != nxt else 0
+                self.output[nxt] |= self.output[self.fail[nxt]]
+        self.built = True
+
+    def match(self, text):
+        if not self.built:
+            self.build()
+        mask = 0
+        state = 0
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            mask |= output[state]
+        return mask
+
+    def __len__(self):
+        return len(self.goto) - 1
+
+
+class IntervalIndex:
+    """Disjoint sorted address intervals, each tagged with a category bitmask"""
+
+    # Batch lookups first jump to the intervals of the address's top 16 bits
+    BUCKET_BITS = 16
+
+    def __init__(self, bits=32):
+        self.shift = bits - self.BUCKET_BITS
+        self.ranges = []
+        self.starts = []
+        self.ends = []
+        self.masks = []
+        self.buckets = []
+
+    def add(self, first, last, bit):
+        self.ranges.append((first, last, bit))
+
+    def build(self):
+        # Sweep over range boundaries to split overlapping CIDRs into
+        # elementary intervals with the union of their category bits
+        events = []
+        for first, last, bit in self.ranges:
+            events.append((first, 1, bit))
+            events.append((last + 1, -1, bit))
+        events.sort(key=lambda event: event[0])
+
+        starts, ends, masks = [], [], []
+        counts = {}
+        position = None
+        for point, delta, bit in events:
+            if position is not None and point > position:
+                mask = 0
+                for active_bit, count in counts.items():
+                    if count:
+                        mask |= active_bit
+                if mask:
+                    if masks and masks[-1] == mask and ends[-1] == position - 1:
+                        ends[-1] = point - 1
+                    else:
+                        starts.append(position)
+                        ends.append(point - 1)
+                        masks.append(mask)
+            counts[bit] = counts.get(bit, 0) + delta
+            position = point
+
+        self.starts, self.ends, self.masks = starts, ends, masks
+        self.ranges = []
+        # buckets[b]: first interval starting at or after b << shift
+        self.buckets = [bisect.bisect_left(starts, bucket << self.shift)
+                        for bucket in range((1 << self.BUCKET_BITS) + 1)]
+
+    def match(self, address):
+        i = bisect.bisect_right(self.starts, address) - 1
+        if i >= 0 and address <= self.ends[i]:
+            return self.masks[i]
+        return 0
+
+    def match_many(self, addresses):
+        """match() for a sequence of integers (None entries stay None)"""
+        if None in addresses:
+            return [None if address is None else self.match(address) for address in addresses]
+        # Shifted by one so that "before the first interval" lands on a sentinel
+        ends = [-1] + self.ends
+        masks = [0] + self.masks
+        # An address in bucket b lies after every interval before buckets[b] and
+        # before every interval from buckets[b + 1] on, so only those are bisected
+        keys = list(map(operator.rshift, addresses, itertools.repeat(self.shift)))
+        lows = map(self.buckets.__getitem__, keys)
+        highs = map(self.buckets.__getitem__, map(operator.add, keys, itertools.repeat(1)))
+        found = map(bisect.bisect_right, itertools.repeat(self.starts), addresses, lows, highs)
+        return [masks[i] if address <= ends[i] else 0 for address, i in zip(addresses, found)]
+
+    def __len__(self):
+        return len(self.starts)
+
+
+class GeoSiteIndex:
+    """Matcher over every category of a GeoSiteList"""
+
+    def __init__(self, geosite_list):
+        self.categories = []
+        self.trie = DomainTrie()
+        self.keywords = KeywordAutomaton()
+        self.regexps = []
+
+        for index, entry in enumerate(geosite_list.entry):
+            self.categories.append(entry.country_code or entry.code)
+            bit = 1 << index
+            for domain in entry.domain:
+                value = domain.value.lower()
+                if domain.type == common_pb2.Domain.RootDomain:
+                    self.trie.insert(value, bit)
+                elif domain.type == common_pb2.Domain.Full:
+                    self.trie.insert(value, bit, full=True)
+                elif domain.type == common_pb2.Domain.Plain:
+                    self.keywords.insert(value, bit)
+                else:
+                    try:
+                        self.regexps.append((re.compile(domain.value), bit))
+                    except re.error as e:
+                        print(f"  ⚠ Skipping invalid regexp {domain.value}: {e}", file=sys.stderr)
+        self.keywords.build()
+
+    def match(self, domain):
+        domain = domain.strip().rstrip('.').lower()
+        mask = self.trie.match(domain) | self.keywords.match(domain)
+        for pattern, bit in self.regexps:
+            if not mask & bit and pattern.search(domain):
+                mask |= bit
+        return mask
+
+    def names(self, mask):
+        return [name for index, name in enumerate(self.categories) if mask >> index & 1]
+
+
+class GeoIPIndex:
+    """Matcher over every category of a GeoIPList"""
+
+    def __init__(self, geoip_list):
+        self.categories = []
+        self.inverse_mask = 0
+        self.v4 = IntervalIndex(32)
+        self.v6 = IntervalIndex(128)
+
+        for index, entry in enumerate(geoip_list.entry):
+            self.categories.append(entry.country_code or entry.code)
+            bit = 1 << index
+            if entry.inverse_match:
+                self.inverse_mask |= bit
+            for cidr in entry.cidr:
+                address = int.from_bytes(cidr.ip, 'big')
+                width = len(cidr.ip) * 8
+                if width not in (32, 128) or cidr.prefix > width:
+                    continue
+                host_bits = width - cidr.prefix
+                first = address >> host_bits << host_bits
+                last = first | ((1 << host_bits) - 1)
+                (self.v4 if width == 32 else self.v6).add(first, last, bit)
+
+        self.v4.build()
+        self.v6.build()
+
+    def match(self, ip):
+        address = ipaddress.ip_address(ip.strip())
+        index = self.v4 if address.version == 4 else self.v6
+        return index.match(int(address)) ^ self.inverse_mask
+
+    def match_many(self, ips):
+        """Masks for many address strings in one pass (None for unparsable ones).
+
+        Addresses are parsed straight to integers and bisected over the sorted
+        interval starts without per-query ipaddress objects; IPv4 batches run
+        through map() and array so the per-address work stays in C.
+        """
+        masks = [None] * len(ips)
+        is_v6 = [':' in ip for ip in ips]
+        for family, flags, index in ((socket.AF_INET, list(map(operator.not_, is_v6)), self.v4),
+                                     (socket.AF_INET6, is_v6, self.v6)):
+            positions = list(itertools.compress(range(len(ips)), flags))
+            if not positions:
+                continue
+            texts = list(itertools.compress(ips, flags))
+            addresses = None
+            if family == socket.AF_INET:
+                try:
+                    packed = b''.join(map(functools.partial(socket.inet_pton, family), texts))
+                except OSError:
+                    pass
+                else:
+                    addresses = array.array('I')
+                    addresses.frombytes(packed)
+                    if sys.byteorder == 'little':
+                        addresses.byteswap()
+            if addresses is None:
+                addresses = [parse_address(family, text) for text in texts]
+            for position, mask in zip(positions, index.match_many(addresses)):
+                masks[position] = None if mask is None else mask ^ self.inverse_mask
+        return masks
+
+    def names(self, mask):
+        return [name for index, name in enumerate(self.categories) if mask >> index & 1]
+
+
+def load_geosite_index(dat_file):
+    """Load geosite.dat into a GeoSiteIndex"""
+    geosite_list = common_pb2.GeoSiteList()
+    with open(dat_file, 'rb') as f:
+        geosite_list.ParseFromString(f.read())
+    return GeoSiteIndex(geosite_list)
+
+
+def load_geoip_index(dat_file):
+    """Load geoip.dat into a GeoIPIndex"""
+    geoip_list = common_pb2.GeoIPList()
+    with open(dat_file, 'rb') as f:
+        geoip_list.ParseFromString(f.read())
+    return GeoIPIndex(geoip_list)
+
+
+def parse_address(family, text):
+    """Address string as an integer, or None if inet_pton rejects it"""
+    try:
+        return int.from_bytes(socket.inet_pton(family, text), 'big')
+    except OSError:
+        return None
+
+
+def looks_like_ip(query):
+    """Cheap pre-check: digits, dots and colons only, with a dot or a colon"""
+    return (':' in query or '.' in query) and not query.strip('0123456789abcdefABCDEF.:')
+
+
+def is_ip(query):
+    try:
+        ipaddress.ip_address(query)
+        return True
+    except ValueError:
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Query built v2ray .dat files offline')
+    parser.add_argument('--geosite', default='output/geosite.dat',
+                        help='Path to geosite.dat')
+    parser.add_argument('--geoip', default='output/geoip.dat',
+                        help='Path to geoip.dat')
+    parser.add_argument('queries', nargs='*',
+                        help='Domains or IPs to look up (read from stdin if omitted)')
+
+    args = parser.parse_args()
+
+    geosite_index = load_geosite_index(args.geosite) if Path(args.geosite).exists() else None
+    geoip_index = load_geoip_index(args.geoip) if Path(args.geoip).exists() else None
+    if geosite_index is None and geoip_index is None:
+        print("Error: neither geosite.dat nor geoip.dat found", file=sys.stderr)
+        return 1
+
+    queries = [query.strip() for query in (args.queries or sys.stdin)]
+    queries = [query for query in queries if query and not query.startswith('#')]
+
+    # IPs are answered in one batch; domains one by one. Output keeps input order.
+    ip_positions = [i for i, query in enumerate(queries) if looks_like_ip(query)]
+    ip_masks = geoip_index.match_many([queries[i] for i in ip_positions]) if geoip_index else []
+    masks = dict(zip(ip_positions, ip_masks))
+
+    joined = {}
+    lines = []
+    for i, query in enumerate(queries):
+        mask = masks.get(i)
+        if mask is not None:
+            index = geoip_index
+        elif is_ip(query):
+            # Rejected by inet_pton but valid for ipaddress (e.g. a scoped IPv6)
+            if geoip_index is None:
+                continue
+            index, mask = geoip_index, geoip_index.match(query)
+        else:
+            if geosite_index is None:
+                continue
+            index, mask = geosite_index, geosite_index.match(query)
+        key = (id(index), mask)
+        if key not in joined:
+            joined[key] = ','.join(index.names(mask))
+        lines.append(f"{query}\t{joined[key]}\n")
+    sys.stdout.write(''.join(lines))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
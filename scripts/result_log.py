@@ -0,0 +1,62 @@
+"""
+Streaming JSONL results for check-domains.py and check_ips_cidr.py
+One record per target is appended and flushed as soon as its verdict is
+known, so later stages can follow a long scan while it is still running
+"""
+
+import sys
+import json
+import threading
+from datetime import datetime, timezone
+
+
+class ResultLog:
+    """Thread-safe line-buffered JSONL writer.
+
+    With '-' the log takes over stdout and the script's own progress output
+    is redirected to stderr, so stdout carries nothing but JSONL.
+    """
+
+    def __init__(self, path, script):
+        self.script = script
+        self.lock = threading.Lock()
+        if path == '-':
+            self.file = sys.stdout
+            self.owned = False
+            sys.stdout = sys.stderr
+        else:
+            self.file = open(path, 'a', encoding='utf-8', buffering=1)
+            self.owned = True
+
+    def record(self, target, alive, sources=(), method=None, port=None, rtt=None, error=None):
+        """Write one verdict; rtt is in seconds and stored as milliseconds"""
+        line = json.dumps({
+            'ts': datetime.now(timezone.utc).isoformat(timespec='milliseconds'),
+            'script': self.script,
+            'target': target,
+            'alive': alive,
+            'sources': [str(source) for source in sources],
+            'method': method,
+            'port': port,
+            'rtt_ms': round(rtt * 1000, 2) if rtt is not None else None,
+            'error': error,
+        }, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+
+def open_result_log(path, script):
+    """ResultLog for --results-jsonl, or None when the option is not set"""
+    return ResultLog(path, script) if path else None
+
+
+def add_result_log_arguments(parser):
+    """Add the common --results-jsonl option"""
+    parser.add_argument('--results-jsonl', metavar='FILE.jsonl',
+                        help="Append one flushed JSON line per checked target "
+                             "('-' for stdout; progress output then goes to stderr)")
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Per-category rule-sets for sing-box and mihomo
+Writes, for every geosite/geoip category, a sorted plain-text set, a sing-box
+source rule-set (.json) and a mihomo text rule-provider, and compiles them to
+binary .srs/.mrs with the sing-box and mihomo binaries when they are on PATH
+"""
+
+import sys
+import json
+import shutil
+import argparse
+import ipaddress
+import subprocess
+from pathlib import Path
+
+# Add scripts directory to path for importing proto files
+sys.path.insert(0, str(Path(__file__).parent))
+import common_pb2
+
+SING_BOX_RULE_SET_VERSION = 2
+
+DOMAIN_FIELDS = {
+    common_pb2.Domain.Full: 'full',
+    common_pb2.Domain.RootDomain: 'domain',
+    common_pb2.Domain.Plain: 'keyword',
+    common_pb2.Domain.Regex: 'regexp',
+}
+
+
+def category_file_name(kind, entry):
+    return f"{kind}-{(entry.country_code or entry.code).lower()}"
+
+
+def split_domains(entry):
+    """Sorted, deduplicated values of a GeoSite entry per matcher type"""
+    groups = {field: set() for field in DOMAIN_FIELDS.values()}
+    for domain in entry.domain:
+        groups[DOMAIN_FIELDS[domain.type]].add(domain.value)
+    return {field: sorted(values) for field, values in groups.items()}
+
+
+def collapse_cidrs(entry):
+    """CIDRs of a GeoIP entry merged into the fewest sorted prefixes"""
+    networks = {4: [], 6: []}
+    for cidr in entry.cidr:
+        network = ipaddress.ip_network((ipaddress.ip_address(cidr.ip), cidr.prefix), strict=False)
+        networks[network.version].append(network)
+    return [str(network) for version in (4, 6)
+            for network in ipaddress.collapse_addresses(networks[version])]
+
+
+def write_lines(path, lines):
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(line + '\n')
+
+
+def compile_rule_set(command, output_path):
+    """Run a rule-set compiler; returns True when output_path was written"""
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    except OSError as e:
+        print(f"  ⚠ {command[0]}: {e}")
+        return False
+    if result.returncode != 0 or not Path(output_path).exists():
+        print(f"  ⚠ {Path(command[0]).name} failed for {Path(output_path).name}: {result.stdout.strip()[-300:]}")
+        return False
+    return True
+
+
+def write_geosite_rule_set(entry, output_dir, sing_box=None, mihomo=None):
+    name = category_file_name('geosite', entry)
+    groups = split_domains(entry)
+
+    # Plain-text set in the domain-list format of this repository
+    write_lines(output_dir / f'{name}.txt',
+                groups['domain'] + [f'{field}:{value}' for field in ('full', 'keyword', 'regexp')
+                                    for value in groups[field]])
+
+    rule = {}
+    for key, field in (('domain', 'full'), ('domain_suffix', 'domain'),
+                       ('domain_keyword', 'keyword'), ('domain_regex', 'regexp')):
+        if groups[field]:
+            rule[key] = groups[field]
+    source = {'version': SING_BOX_RULE_SET_VERSION, 'rules': [rule] if rule else []}
+    with open(output_dir / f'{name}.json', 'w', encoding='utf-8') as f:
+        json.dump(source, f, indent=1, ensure_ascii=False)
+
+    # mihomo "domain" behavior: '+.' matches the domain and its subdomains;
+    # keyword and regexp rules have no equivalent there
+    write_lines(output_dir / f'{name}.mihomo.txt',
+                [f'+.{value}' for value in groups['domain']] + groups['full'])
+
+    built = []
+    if sing_box and compile_rule_set([sing_box, 'rule-set', 'compile', '--output',
+                                      str(output_dir / f'{name}.srs'), str(output_dir / f'{name}.json')],
+                                     output_dir / f'{name}.srs'):
+        built.append('srs')
+    if mihomo and compile_rule_set([mihomo, 'convert-ruleset', 'domain', 'text',
+                                    str(output_dir / f'{name}.mihomo.txt'), str(output_dir / f'{name}.mrs')],
+                                   output_dir / f'{name}.mrs'):
+        built.append('mrs')
+
+    skipped = len(groups['keyword']) + len(groups['regexp'])
+    note = f", {skipped} keyword/regexp rules not in .mrs" if skipped and 'mrs' in built else ''
+    print(f"  ✓ {name}: {sum(len(values) for values in groups.values())} rules"
+          f"{' (' + ', '.join(built) + ')' if built else ''}{note}")
+
+
+def write_geoip_rule_set(entry, output_dir, sing_box=None, mihomo=None):
+    name = category_file_name('geoip', entry)
+    cidrs = collapse_cidrs(entry)
+
+    write_lines(output_dir / f'{name}.txt', cidrs)
+    source = {'version': SING_BOX_RULE_SET_VERSION, 'rules': [{'ip_cidr': cidrs}] if cidrs else []}
+    with open(output_dir / f'{name}.json', 'w', encoding='utf-8') as f:
+        json.dump(source, f, indent=1)
+
+    built = []
+    if sing_box and compile_rule_set([sing_box, 'rule-set', 'compile', '--output',
+                                      str(output_dir / f'{name}.srs'), str(output_dir / f'{name}.json')],
+                                     output_dir / f'{name}.srs'):
+        built.append('srs')
+    if mihomo and compile_rule_set([mihomo, 'convert-ruleset', 'ipcidr', 'text',
+                                    str(output_dir / f'{name}.txt'), str(output_dir / f'{name}.mrs')],
+                                   output_dir / f'{name}.mrs'):
+        built.append('mrs')
+
+    print(f"  ✓ {name}: {len(cidrs)} prefixes (from {len(entry.cidr)})"
+          f"{' (' + ', '.join(built) + ')' if built else ''}")
+
+
+def write_rule_sets(output_dir, geosite_entries=(), geoip_entries=()):
+    """Write rule-sets for every category of the built geosite/geoip entries"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    sing_box = shutil.which('sing-box')
+    mihomo = shutil.which('mihomo')
+
+    print(f"\n=== Writing rule-sets to {output_dir} ===")
+    if not sing_box:
+        print("  ⚠ sing-box not found on PATH, writing .json sources without .srs")
+    if not mihomo:
+        print("  ⚠ mihomo not found on PATH, writing text rule-providers without .mrs")
+
+    for entry in geosite_entries:
+        write_geosite_rule_set(entry, output_dir, sing_box, mihomo)
+    for entry in geoip_entries:
+        write_geoip_rule_set(entry, output_dir, sing_box, mihomo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write sing-box/mihomo rule-sets from .dat files')
+    parser.add_argument('--geosite', help='Path to geosite.dat')
+    parser.add_argument('--geoip', help='Path to geoip.dat')
+    parser.add_argument('--output-dir', default='output/rule-set', help='Directory for rule-sets')
+    args = parser.parse_args()
+
+    geosite_list = common_pb2.GeoSiteList()
+    if args.geosite:
+        geosite_list.ParseFromString(Path(args.geosite).read_bytes())
+    geoip_list = common_pb2.GeoIPList()
+    if args.geoip:
+        geoip_list.ParseFromString(Path(args.geoip).read_bytes())
+
+    write_rule_sets(args.output_dir, geosite_list.entry, geoip_list.entry)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
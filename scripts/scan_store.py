@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Compact bitmap store for IP scan results
+Keeps one bitmap per scanned prefix (1 bit per address) with the scan time,
+memory-mappable, with set operations and conversion to/from the text lists
+in IPсhecked/
+"""
+
+import os
+import sys
+import mmap
+import time
+import bisect
+import struct
+import argparse
+import ipaddress
+from pathlib import Path
+
+STORE_MAGIC = b'SCANBITS'
+STORE_VERSION = 1
+# magic, version, prefix count
+HEADER = struct.Struct('<8sHI')
+# address (16 bytes, IPv4 left-aligned), ip version, prefix length, scan time, bitmap offset
+INDEX_ENTRY = struct.Struct('<16sBBxxQQ')
+# Largest prefix stored as a bitmap (2**24 addresses = 2 MiB)
+MAX_HOST_BITS = 24
+
+
+def bitmap_size(network):
+    return (network.num_addresses + 7) // 8
+
+
+class ScanStore:
+    """Read-only view over a store file; bitmaps are sliced from an mmap"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(path, 'rb')
+        # mmap cannot map an empty file; a truncated one has no header either
+        if os.fstat(self._file.fileno()).st_size < HEADER.size:
+            self._file.close()
+            raise ValueError(f"{path} is not a scan store")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != STORE_MAGIC or version != STORE_VERSION:
+            raise ValueError(f"{path} is not a scan store")
+
+        self.entries = {}
+        for i in range(count):
+            packed, ip_version, prefixlen, scanned_at, offset = INDEX_ENTRY.unpack_from(
+                self._map, HEADER.size + i * INDEX_ENTRY.size)
+            address = packed[:4] if ip_version == 4 else packed
+            network = ipaddress.ip_network((address, prefixlen))
+            self.entries[network] = (scanned_at, offset)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def networks(self):
+        return list(self.entries)
+
+    def scanned_at(self, network):
+        return self.entries[network][0]
+
+    def raw(self, network):
+        """Bitmap bytes of a prefix as a zero-copy memoryview"""
+        _, offset = self.entries[network]
+        return memoryview(self._map)[offset:offset + bitmap_size(network)]
+
+    def bitmap(self, network):
+        """Bitmap of a prefix as an int: bit i is set when address network[i] answered"""
+        return int.from_bytes(self.raw(network), 'little')
+
+
+def write_store(path, bitmaps):
+    """Write {network: (scanned_at, bitmap_int)} to path atomically"""
+    networks = sorted(bitmaps, key=lambda n: (n.version, n.network_address, n.prefixlen))
+    offset = HEADER.size + len(networks) * INDEX_ENTRY.size
+    offset += -offset % 8
+
+    index = bytearray()
+    payload = bytearray()
+    for network in networks:
+        scanned_at, bits = bitmaps[network]
+        packed = network.network_address.packed.ljust(16, b'\0')
+        index += INDEX_ENTRY.pack(packed, network.version, network.prefixlen, int(scanned_at), offset + len(payload))
+        payload += bits.to_bytes(bitmap_size(network), 'little')
+        payload += b'\0' * (-len(payload) % 8)
+
+    tmp_path = Path(str(path) + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(STORE_MAGIC, STORE_VERSION, len(networks)))
+        f.write(index)
+        f.write(b'\0' * (-(HEADER.size + len(index)) % 8))
+        f.write(payload)
+    tmp_path.replace(path)
+
+
+def load_prefixes(ips_dir):
+    """Scannable prefixes from IPs/*.txt (same CIDR syntax as check_ips_cidr.py)"""
+    networks = set()
+    for filepath in sorted(Path(ips_dir).glob('*.txt')):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#')[0].strip()
+                if '/' not in line:
+                    continue
+                try:
+                    network = ipaddress.ip_network(line, strict=False)
+                except ValueError:
+                    continue
+                if network.max_prefixlen - network.prefixlen <= MAX_HOST_BITS:
+                    networks.add(network)
+    return networks
+
+
+class PrefixIndex:
+    """Sorted prefixes of one IP version; finds every prefix containing an address by bisection"""
+
+    def __init__(self, networks):
+        self.networks = sorted(networks, key=lambda n: (int(n.network_address), n.prefixlen))
+        self.starts = [int(n.network_address) for n in self.networks]
+        self.ends = [int(n.broadcast_address) for n in self.networks]
+        # Prefixes are either nested or disjoint: parents[i] is the nearest enclosing one
+        self.parents = []
+        enclosing = []
+        for i, end in enumerate(self.ends):
+            while enclosing and self.ends[enclosing[-1]] < end:
+                enclosing.pop()
+            self.parents.append(enclosing[-1] if enclosing else -1)
+            enclosing.append(i)
+
+    def containing(self, address):
+        """Indexes of the prefixes that contain address (an int), innermost first"""
+        i = bisect.bisect_right(self.starts, address) - 1
+        # Any prefix containing the address encloses the last one starting before it
+        while i >= 0 and self.ends[i] < address:
+            i = self.parents[i]
+        while i >= 0:
+            yield i
+            i = self.parents[i]
+
+
+def bitmaps_from_text(text_files, networks, scanned_at=None):
+    """Convert available_ips_from_*.txt lists into per-prefix bitmaps"""
+    by_version = {}
+    for network in networks:
+        by_version.setdefault(network.version, []).append(network)
+    indexes = {version: PrefixIndex(nets) for version, nets in by_version.items()}
+
+    # Collect bit offsets first and build each bitmap once
+    offsets = {version: {} for version in indexes}
+    newest = 0
+    for text_file in text_files:
+        newest = max(newest, os.path.getmtime(text_file))
+        with open(text_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    address = ipaddress.ip_address(line)
+                except ValueError:
+                    continue
+                index = indexes.get(address.version)
+                if index is None:
+                    continue
+                value = int(address)
+                for i in index.containing(value):
+                    offsets[address.version].setdefault(i, []).append(value - index.starts[i])
+
+    bitmaps = {network: 0 for network in networks}
+    for version, index in indexes.items():
+        for i, hits in offsets[version].items():
+            network = index.networks[i]
+            buffer = bytearray(bitmap_size(network))
+            for offset in hits:
+                buffer[offset >> 3] |= 1 << (offset & 7)
+            bitmaps[network] = int.from_bytes(buffer, 'little')
+
+    stamp = int(scanned_at if scanned_at is not None else newest or time.time())
+    return {network: (stamp, bits) for network, bits in bitmaps.items()}
+
+
+def addresses_from_bitmap(network, bits):
+    """Yield the addresses whose bits are set"""
+    base = int(network.network_address)
+    while bits:
+        low = bits & -bits
+        yield ipaddress.ip_address(base + low.bit_length() - 1)
+        bits ^= low
+
+
+def combine(store_a, store_b, operation):
+    """Apply union/difference/intersection per prefix; the newer scan time wins"""
+    result = {}
+    for network in set(store_a.networks()) | set(store_b.networks()):
+        a = store_a.bitmap(network) if network in store_a.entries else 0
+        b = store_b.bitmap(network) if network in store_b.entries else 0
+        stamp = max(store_a.entries.get(network, (0,))[0], store_b.entries.get(network, (0,))[0])
+        if operation == 'union':
+            bits = a | b
+        elif operation == 'difference':
+            bits = a & ~b
+        else:
+            bits = a & b
+        result[network] = (stamp, bits)
+    return result
+
+
+def format_time(stamp):
+    return time.strftime('%Y-%m-%d %H:%M', time.gmtime(stamp)) if stamp else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bitmap store for IP scan results')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('import', help='Build a store from IPs/*.txt and IPсhecked/*.txt')
+    build.add_argument('--ips-dir', default='IPs', help='Directory with scanned prefixes')
+    build.add_argument('--checked-dir', default='IPсhecked', help='Directory with available_ips_from_*.txt')
+    build.add_argument('--timestamp', type=int, help='Scan time (unix seconds, default: newest file mtime)')
+    build.add_argument('--output', required=True, help='Store file to write')
+
+    export = subparsers.add_parser('export', help='Write the store back as a text list of addresses')
+    export.add_argument('store')
+    export.add_argument('--output', help='Text file (default: stdout)')
+
+    stats = subparsers.add_parser('stats', help='Alive fraction per prefix')
+    stats.add_argument('store')
+    stats.add_argument('--prefix', nargs='*', help='Only these prefixes')
+
+    for name, help_text in (('union', 'A ∪ B'), ('difference', 'A \\ B (alive in A only)'),
+                            ('intersection', 'A ∩ B')):
+        op = subparsers.add_parser(name, help=f'Per-prefix {help_text}')
+        op.add_argument('store_a')
+        op.add_argument('store_b')
+        op.add_argument('--output', help='Write the result as a new store instead of printing stats')
+
+    args = parser.parse_args()
+
+    if args.command == 'import':
+        networks = load_prefixes(args.ips_dir)
+        text_files = sorted(Path(args.checked_dir).glob('*.txt'))
+        bitmaps = bitmaps_from_text(text_files, networks, args.timestamp)
+        write_store(args.output, bitmaps)
+        alive = sum(bits.bit_count() for _, bits in bitmaps.values())
+        total = sum(network.num_addresses for network in networks)
+        size = Path(args.output).stat().st_size
+        print(f"✓ Stored {len(networks)} prefixes ({alive}/{total} alive) in {args.output} ({size} bytes)")
+        return 0
+
+    if args.command == 'export':
+        with ScanStore(args.store) as store:
+            out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+            for network in sorted(store.networks(), key=lambda n: (n.version, n.network_address)):
+                for address in addresses_from_bitmap(network, store.bitmap(network)):
+                    out.write(f"{address}\n")
+            if args.output:
+                out.close()
+        return 0
+
+    if args.command == 'stats':
+        with ScanStore(args.store) as store:
+            wanted = [ipaddress.ip_network(p, strict=False) for p in args.prefix] if args.prefix else None
+            rows = wanted or sorted(store.networks(), key=lambda n: (n.version, n.network_address))
+            for network in rows:
+                if network not in store.entries:
+                    print(f"{network}\tnot in store")
+                    continue
+                alive = store.bitmap(network).bit_count()
+                print(f"{network}\t{alive}/{network.num_addresses}\t"
+                      f"{alive / network.num_addresses:.2%}\t{format_time(store.scanned_at(network))}")
+        return 0
+
+    with ScanStore(args.store_a) as store_a, ScanStore(args.store_b) as store_b:
+        result = combine(store_a, store_b, args.command)
+    if args.output:
+        write_store(args.output, result)
+        print(f"✓ Wrote {args.command} of {len(result)} prefixes to {args.output}")
+    else:
+        for network in sorted(result, key=lambda n: (n.version, n.network_address)):
+            count = result[network][1].bit_count()
+            if count:
+                print(f"{network}\t{count}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
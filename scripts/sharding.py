@@ -0,0 +1,117 @@
+"""
+Shard and merge support for check-domains.py and check_ips_cidr.py
+Targets are split by a stable hash so every process or vantage-point node
+takes one shard; shard result files are merged with a quorum rule
+"""
+
+import json
+import socket
+import hashlib
+from datetime import datetime, timezone
+
+
+def parse_shard(value):
+    """Parse 'i/N' into (i, N) with 0 <= i < N"""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise ValueError(f"shard must look like i/N, got {value!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"shard index must be in 0..{count - 1}, got {value!r}")
+    return index, count
+
+
+def parse_quorum(value):
+    """Parse a quorum rule: 'any', 'all', 'majority' or a positive number of votes"""
+    if value in ('any', 'all', 'majority'):
+        return value
+    try:
+        votes = int(value)
+    except ValueError:
+        raise ValueError(f"quorum must be any, all, majority or a number, got {value!r}")
+    if votes < 1:
+        raise ValueError(f"quorum must be at least 1 vote, got {value!r}")
+    return votes
+
+
+def shard_of(target, count):
+    """Stable shard number of a target (same on every machine and run)"""
+    digest = hashlib.blake2b(target.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count
+
+
+def select_shard(targets, shard):
+    """Keep only the targets that belong to shard (index, count); None keeps all"""
+    if shard is None:
+        return list(targets)
+    index, count = shard
+    return [target for target in targets if shard_of(target, count) == index]
+
+
+def write_shard_results(path, script, shard, vantage, results):
+    """Write one shard's verdicts: results maps target -> {'alive': bool, 'sources': [str, ...]}"""
+    document = {
+        'script': script,
+        'shard': f"{shard[0]}/{shard[1]}" if shard else None,
+        'vantage': vantage or socket.gethostname(),
+        'finished_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'results': results,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(document, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+def quorum_needed(rule, voters):
+    """Number of 'alive' votes required out of voters for the given rule"""
+    if rule == 'any':
+        return 1
+    if rule == 'all':
+        return voters
+    if rule == 'majority':
+        return voters // 2 + 1
+    return min(int(rule), voters)
+
+
+def merge_shard_results(paths, rule='majority'):
+    """
+    Merge shard files into target -> {'alive', 'sources', 'votes', 'voters'}.
+    Each vantage point casts one vote per target; a target is alive when its
+    alive votes reach the quorum rule (any, all, majority or a number).
+    Sources are the union of the files the target was found in.
+    """
+    votes = {}
+    sources = {}
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            document = json.load(f)
+        vantage = document['vantage']
+        for target, result in document['results'].items():
+            votes.setdefault(target, {})[vantage] = bool(result['alive'])
+            # Older shard files store a single 'source'
+            found_in = result.get('sources') or ([result['source']] if result.get('source') else [])
+            sources.setdefault(target, set()).update(found_in)
+
+    merged = {}
+    for target, by_vantage in votes.items():
+        alive_votes = sum(by_vantage.values())
+        voters = len(by_vantage)
+        merged[target] = {
+            'alive': alive_votes >= quorum_needed(rule, voters),
+            'sources': sorted(sources.get(target, ())),
+            'votes': alive_votes,
+            'voters': voters,
+        }
+    return merged
+
+
+def add_shard_arguments(parser):
+    """Add the common --shard/--vantage/--results-out/--merge/--quorum options"""
+    parser.add_argument('--shard', type=parse_shard, metavar='i/N',
+                        help='Probe only shard i of N (stable hash of the target); '
+                             'source files are not edited, results go to --results-out')
+    parser.add_argument('--vantage', help='Vantage point name stored in the shard file (default: hostname)')
+    parser.add_argument('--results-out', metavar='FILE.json', help='Where to write shard results')
+    parser.add_argument('--merge', nargs='+', metavar='FILE.json',
+                        help='Merge shard result files and apply the verdicts instead of probing')
+    parser.add_argument('--quorum', type=parse_quorum, default='majority',
+                        help='Merge rule across vantage points: any, all, majority or a number of votes')
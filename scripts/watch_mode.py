@@ -0,0 +1,388 @@
+"""
+Long-running --watch mode for check-domains.py and check_ips_cidr.py
+Source directories are watched with inotify (mtime polling elsewhere): targets
+from new or edited lines are probed at once, the rest are re-probed on a
+rolling schedule spread over --recheck-interval, and the current state is
+served as JSON (/status) and Prometheus text (/metrics) on a local port
+"""
+
+import os
+import json
+import heapq
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from sharding import shard_of
+
+# inotify(7) event bits
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct('iIII')
+
+POLL_INTERVAL = 1.0
+# Wait this long after the last event so a burst of editor writes is read once
+SETTLE_DELAY = 0.3
+RECENT_CHANGES = 50
+
+
+def is_temporary(name):
+    return name.startswith('.') or name.endswith(('~', '.tmp', '.swp', '.part'))
+
+
+class InotifyWatcher:
+    """Reports files changed in a set of directories, using inotify through libc"""
+
+    def __init__(self, directories):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.directories = {}
+        for directory in directories:
+            wd = self.libc.inotify_add_watch(self.fd, str(directory).encode(), WATCH_MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f'inotify_add_watch failed for {directory}')
+            self.directories[wd] = Path(directory)
+
+    def _drain(self, changed):
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return
+            offset = 0
+            while offset < len(data):
+                wd, _, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                offset += INOTIFY_EVENT.size
+                name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'replace')
+                offset += length
+                if name and wd in self.directories and not is_temporary(name):
+                    changed.add(self.directories[wd] / name)
+
+    def wait(self, timeout):
+        """Block up to timeout seconds; return the set of changed file paths"""
+        changed = set()
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        while ready:
+            self._drain(changed)
+            ready, _, _ = select.select([self.fd], [], [], SETTLE_DELAY)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Fallback for systems without inotify: compares file mtimes"""
+
+    def __init__(self, directories):
+        self.directories = [Path(directory) for directory in directories]
+        self.mtimes = self._scan()
+
+    def _scan(self):
+        mtimes = {}
+        for directory in self.directories:
+            for path in directory.iterdir():
+                if path.is_file() and not is_temporary(path.name):
+                    mtimes[path] = path.stat().st_mtime_ns
+        return mtimes
+
+    def wait(self, timeout):
+        time.sleep(min(timeout, POLL_INTERVAL))
+        mtimes = self._scan()
+        changed = {path for path in mtimes.keys() | self.mtimes.keys()
+                   if mtimes.get(path) != self.mtimes.get(path)}
+        self.mtimes = mtimes
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(directories):
+    try:
+        return InotifyWatcher(directories)
+    except (OSError, AttributeError):
+        return PollingWatcher(directories)
+
+
+class RollingScheduler:
+    """
+    Due times for periodic re-probes. Each target gets a stable slot inside the
+    interval (hash of its name), so a full cycle is spread evenly instead of
+    probing everything at once; urgent targets jump the queue.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.heap = []
+        self.due = {}
+        self.urgent = []
+
+    def add(self, target, now, urgent=False):
+        if urgent:
+            self.urgent.append(target)
+            self.due[target] = now
+            return
+        slot = shard_of(target, 1 << 20) / (1 << 20) * self.interval
+        self._push(target, now + slot)
+
+    def reschedule(self, target, now):
+        if target in self.due:
+            self._push(target, now + self.interval)
+
+    def remove(self, target):
+        self.due.pop(target, None)
+
+    def _push(self, target, when):
+        self.due[target] = when
+        heapq.heappush(self.heap, (when, target))
+
+    def pop_due(self, now, limit):
+        """Up to limit targets that should be probed now, urgent ones first"""
+        batch = []
+        while self.urgent and len(batch) < limit:
+            target = self.urgent.pop(0)
+            if target in self.due:
+                batch.append(target)
+        while self.heap and len(batch) < limit and self.heap[0][0] <= now:
+            when, target = heapq.heappop(self.heap)
+            # Skip stale heap entries left behind by reschedule/remove
+            if self.due.get(target) == when:
+                batch.append(target)
+        for target in batch:
+            self.due[target] = None
+        return batch
+
+    def next_due(self):
+        if self.urgent:
+            return 0
+        while self.heap and self.due.get(self.heap[0][1]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+        return self.heap[0][0] if self.heap else None
+
+
+class WatchStatus:
+    """Verdicts and counters shared between the watch loop and the HTTP server"""
+
+    def __init__(self, script):
+        self.script = script
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.targets = {}
+        self.recent = []
+        self.counters = {'probes': 0, 'alive': 0, 'dead': 0, 'flips': 0, 'reloads': 0}
+        self.probe_seconds = 0.0
+        self.due = 0
+
+    def set_targets(self, targets):
+        """targets maps target -> set of source files"""
+        with self.lock:
+            for target in list(self.targets):
+                if target not in targets:
+                    del self.targets[target]
+            for target, sources in targets.items():
+                entry = self.targets.setdefault(target, {'alive': None, 'note': '', 'checked_at': None})
+                entry['sources'] = sorted(str(source) for source in sources)
+            self.counters['reloads'] += 1
+
+    def record(self, target, alive, note, seconds):
+        """Store a verdict; returns True when it differs from the previous one"""
+        with self.lock:
+            self.counters['probes'] += 1
+            self.counters['alive' if alive else 'dead'] += 1
+            self.probe_seconds += seconds
+            entry = self.targets.get(target)
+            if entry is None:
+                return False
+            flipped = entry['alive'] is not None and entry['alive'] != alive
+            entry.update(alive=alive, note=note, checked_at=time.time())
+            if flipped:
+                self.counters['flips'] += 1
+                self.recent.append({'target': target, 'alive': alive, 'note': note, 'at': entry['checked_at']})
+                del self.recent[:-RECENT_CHANGES]
+            return flipped
+
+    def snapshot(self):
+        with self.lock:
+            states = [entry['alive'] for entry in self.targets.values()]
+            return {
+                'script': self.script,
+                'started_at': self.started_at,
+                'targets': len(states),
+                'alive': states.count(True),
+                'dead': states.count(False),
+                'unchecked': states.count(None),
+                'due': self.due,
+                'counters': dict(self.counters),
+                'recent_changes': list(self.recent),
+            }
+
+    def target(self, name):
+        with self.lock:
+            entry = self.targets.get(name)
+            return dict(entry, target=name) if entry else None
+
+    def metrics(self):
+        status = self.snapshot()
+        labels = f'script="{self.script}"'
+        lines = [
+            f'watch_targets{{{labels}}} {status["targets"]}',
+            f'watch_targets_alive{{{labels}}} {status["alive"]}',
+            f'watch_targets_dead{{{labels}}} {status["dead"]}',
+            f'watch_targets_unchecked{{{labels}}} {status["unchecked"]}',
+            f'watch_queue_due{{{labels}}} {status["due"]}',
+            f'watch_probes_total{{{labels}}} {status["counters"]["probes"]}',
+            f'watch_probe_failures_total{{{labels}}} {status["counters"]["dead"]}',
+            f'watch_verdict_flips_total{{{labels}}} {status["counters"]["flips"]}',
+            f'watch_reloads_total{{{labels}}} {status["counters"]["reloads"]}',
+            f'watch_probe_seconds_sum{{{labels}}} {self.probe_seconds:.3f}',
+            f'watch_uptime_seconds{{{labels}}} {time.time() - self.started_at:.0f}',
+        ]
+        return '\n'.join(lines) + '\n'
+
+
+def start_status_server(status, address):
+    """Serve /status (JSON; ?target=NAME for one target) and /metrics in a daemon thread"""
+    host, _, port = address.rpartition(':')
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.partition('?')
+            if path == '/metrics':
+                body = status.metrics().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4'
+            elif path in ('/', '/status'):
+                params = dict(part.partition('=')[::2] for part in query.split('&') if part)
+                document = status.target(params['target']) if 'target' in params else status.snapshot()
+                if document is None:
+                    self.send_error(404, 'unknown target')
+                    return
+                body = json.dumps(document, ensure_ascii=False, indent=1).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_watch(script, directories, load_file, probe, on_verdict, interval, workers, address,
+              on_idle=None):
+    """
+    Watch loop shared by both check scripts.
+
+    load_file(path) -> iterable of targets in that file (empty if removed),
+    probe(target) -> (alive, note), on_verdict(target, alive, note, sources)
+    applies the result; on_idle() runs between batches (e.g. to flush files).
+    """
+    directories = [Path(directory) for directory in directories]
+    status = WatchStatus(script)
+    scheduler = RollingScheduler(interval)
+    by_file = {}
+    sources = {}
+
+    def rebuild_sources():
+        sources.clear()
+        for path, targets in by_file.items():
+            for target in targets:
+                sources.setdefault(target, set()).add(path)
+        status.set_targets(sources)
+
+    def reload(paths, now, urgent):
+        added = 0
+        for path in paths:
+            targets = set(load_file(path)) if path.is_file() else set()
+            previous = by_file.get(path, set())
+            by_file[path] = targets
+            for target in targets - previous:
+                if target not in sources:
+                    scheduler.add(target, now, urgent)
+                    added += 1
+        rebuild_sources()
+        for target in list(scheduler.due):
+            if target not in sources:
+                scheduler.remove(target)
+        return added
+
+    start = time.time()
+    files = [path for directory in directories for path in sorted(directory.iterdir()) if path.is_file()]
+    reload(files, start, urgent=False)
+    watcher = create_watcher(directories)
+    server = start_status_server(status, address)
+    print(f"👀 Watch: {len(sources)} targets in {', '.join(map(str, directories))}, "
+          f"full cycle every {interval}s, status on http://{address}/status")
+
+    def timed_probe(target):
+        started = time.perf_counter()
+        alive, note = probe(target)
+        return target, alive, note, time.perf_counter() - started
+
+    inflight = set()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                now = time.time()
+                for target in scheduler.pop_due(now, workers - len(inflight)):
+                    inflight.add(executor.submit(timed_probe, target))
+
+                next_due = scheduler.next_due()
+                timeout = POLL_INTERVAL if next_due is None else max(0.0, min(POLL_INTERVAL, next_due - now))
+                if inflight:
+                    done, _ = wait(inflight, timeout=timeout, return_when=FIRST_COMPLETED)
+                    timeout = 0
+                    for future in done:
+                        inflight.discard(future)
+                        target, alive, note, seconds = future.result()
+                        scheduler.reschedule(target, time.time())
+                        if target not in sources:
+                            continue
+                        if status.record(target, alive, note, seconds):
+                            print(f"🔁 {target}: {'доступен' if alive else 'недоступен'}"
+                                  f"{f' ({note})' if note else ''}")
+                        on_verdict(target, alive, note, sources[target])
+
+                changed = watcher.wait(timeout)
+                if changed:
+                    added = reload(changed, time.time(), urgent=True)
+                    if added:
+                        print(f"✏️  {added} new target(s) in {', '.join(sorted(p.name for p in changed))}, "
+                              f"probing now")
+                status.due = sum(1 for when in scheduler.due.values() if when is not None and when <= time.time())
+                if on_idle:
+                    on_idle()
+    finally:
+        watcher.close()
+        server.shutdown()
+
+
+def add_watch_arguments(parser, default_interval):
+    """Add the common --watch/--recheck-interval/--status-addr options"""
+    parser.add_argument('--watch', action='store_true',
+                        help='Run continuously: probe new/edited lines at once, re-probe the rest on a schedule')
+    parser.add_argument('--recheck-interval', type=int, default=default_interval, metavar='SEC',
+                        help='Watch mode: every target is re-probed once per this many seconds')
+    parser.add_argument('--status-addr', default='127.0.0.1:8787', metavar='HOST:PORT',
+                        help='Watch mode: address of the /status and /metrics endpoint')
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Whitelist rules not already covered by an upstream category
+Subtracts upstream CIDR intervals from whitelist CIDRs and upstream domain
+suffixes from whitelist domain rules, and reports how much the two overlap
+"""
+
+import sys
+import json
+import bisect
+import argparse
+import ipaddress
+from pathlib import Path
+
+# Add scripts directory to path for importing proto files
+sys.path.insert(0, str(Path(__file__).parent))
+import common_pb2
+
+DELTA_CATEGORY = 'WHITELIST-ONLY'
+
+
+def find_entry(entries, category):
+    """Entry whose country_code or code equals category (case-insensitive), or None"""
+    category = category.lower()
+    for entry in entries:
+        if (entry.country_code or entry.code).lower() == category:
+            return entry
+    return None
+
+
+# --- CIDRs ---
+
+def cidr_interval(cidr):
+    """(version, first address, last address) of a CIDR message"""
+    bits = len(cidr.ip) * 8
+    host_mask = (1 << (bits - min(cidr.prefix, bits))) - 1
+    first = int.from_bytes(cidr.ip, 'big') & ~host_mask
+    return (4 if bits == 32 else 6), first, first | host_mask
+
+
+def interval_prefixes(first, last, bits):
+    """Fewest (address, prefix length) blocks covering [first, last]"""
+    while first <= last:
+        size = min((first & -first).bit_length() - 1 if first else bits,
+                   (last - first + 1).bit_length() - 1)
+        yield first, bits - size
+        first += 1 << size
+
+
+def merge_intervals(intervals):
+    """Sorted, non-overlapping, non-adjacent [first, last] intervals"""
+    merged = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1][1] = last
+        else:
+            merged.append([first, last])
+    return merged
+
+
+def covered_size(first, last, merged, starts):
+    """Number of addresses of [first, last] inside the merged intervals"""
+    index = max(bisect.bisect_right(starts, first) - 1, 0)
+    covered = 0
+    while index < len(merged) and merged[index][0] <= last:
+        low, high = max(first, merged[index][0]), min(last, merged[index][1])
+        if low <= high:
+            covered += high - low + 1
+        index += 1
+    return covered
+
+
+def subtract_intervals(intervals, removed):
+    """Parts of merged intervals not in merged removed intervals"""
+    result = []
+    index = 0
+    for first, last in intervals:
+        while index < len(removed) and removed[index][1] < first:
+            index += 1
+        position = index
+        while position < len(removed) and removed[position][0] <= last:
+            if removed[position][0] > first:
+                result.append((first, removed[position][0] - 1))
+            first = max(first, removed[position][1] + 1)
+            position += 1
+        if first <= last:
+            result.append((first, last))
+    return result
+
+
+def subtract_cidrs(whitelist, upstream):
+    """(CIDR strings of whitelist minus upstream, overlap report) for two GeoIP entries"""
+    upstream_intervals = {4: [], 6: []}
+    for cidr in upstream.cidr:
+        version, first, last = cidr_interval(cidr)
+        upstream_intervals[version].append((first, last))
+    upstream_merged = {version: merge_intervals(intervals) for version, intervals in upstream_intervals.items()}
+    upstream_starts = {version: [first for first, _ in merged] for version, merged in upstream_merged.items()}
+
+    report = {'prefixes': len(whitelist.cidr), 'covered': 0, 'partial': 0, 'outside': 0,
+              'addresses': {'4': 0, '6': 0}, 'covered_addresses': {'4': 0, '6': 0}}
+    whitelist_intervals = {4: [], 6: []}
+    for cidr in whitelist.cidr:
+        version, first, last = cidr_interval(cidr)
+        whitelist_intervals[version].append((first, last))
+        covered = covered_size(first, last, upstream_merged[version], upstream_starts[version])
+        size = last - first + 1
+        report['covered' if covered == size else 'partial' if covered else 'outside'] += 1
+
+    cidrs = []
+    for version, bits, address_class in ((4, 32, ipaddress.IPv4Address), (6, 128, ipaddress.IPv6Address)):
+        merged = merge_intervals(whitelist_intervals[version])
+        report['addresses'][str(version)] = sum(last - first + 1 for first, last in merged)
+        remaining = subtract_intervals(merged, upstream_merged[version])
+        report['covered_addresses'][str(version)] = (report['addresses'][str(version)]
+                                                     - sum(last - first + 1 for first, last in remaining))
+        for first, last in remaining:
+            cidrs.extend(f"{address_class(address)}/{prefix}"
+                         for address, prefix in interval_prefixes(first, last, bits))
+    report['delta_prefixes'] = len(cidrs)
+    return cidrs, report
+
+
+# --- Domains ---
+
+def under_suffix(value, suffixes, include_self=True):
+    """True if value (with include_self) or one of its parent domains is in suffixes"""
+    position = -1 if include_self else value.find('.')
+    while position >= 0 or include_self:
+        include_self = False
+        if value[position + 1:] in suffixes:
+            return True
+        position = value.find('.', position + 1)
+    return False
+
+
+def subtract_domains(whitelist, upstream):
+    """(Domain rules of whitelist not matched by upstream, overlap report) for two GeoSite entries
+
+    Whitelist domain and full rules are dropped when an upstream domain rule
+    covers them (or an upstream full rule equals a whitelist full rule), and
+    when another whitelist domain rule covers them. Keyword and regexp rules
+    cannot be compared and are kept.
+    """
+    upstream_suffixes = {d.value for d in upstream.domain if d.type == common_pb2.Domain.RootDomain}
+    upstream_fulls = {d.value for d in upstream.domain if d.type == common_pb2.Domain.Full}
+    whitelist_suffixes = {d.value for d in whitelist.domain if d.type == common_pb2.Domain.RootDomain}
+
+    report = {'rules': len(whitelist.domain), 'covered': 0, 'redundant': 0, 'uncomparable': 0}
+    kept = []
+    seen = set()
+    for domain in whitelist.domain:
+        if domain.type == common_pb2.Domain.RootDomain:
+            covered = under_suffix(domain.value, upstream_suffixes)
+            redundant = under_suffix(domain.value, whitelist_suffixes, include_self=False)
+        elif domain.type == common_pb2.Domain.Full:
+            covered = domain.value in upstream_fulls or under_suffix(domain.value, upstream_suffixes)
+            redundant = under_suffix(domain.value, whitelist_suffixes)
+        else:
+            report['uncomparable'] += 1
+            covered = redundant = False
+
+        key = (domain.type, domain.value)
+        if covered:
+            report['covered'] += 1
+        elif redundant or key in seen:
+            report['redundant'] += 1
+        else:
+            seen.add(key)
+            kept.append(domain)
+    report['delta_rules'] = len(kept)
+    return kept, report
+
+
+def print_overlap(kind, whitelist_name, upstream_name, report):
+    if kind == 'geoip':
+        print(f"  ✓ {whitelist_name} vs {upstream_name}: {report['covered']} of {report['prefixes']} prefixes "
+              f"fully covered upstream, {report['partial']} partially, {report['outside']} outside")
+        print(f"  ✓ Covered IPv4 addresses: {report['covered_addresses']['4']} of {report['addresses']['4']}; "
+              f"{DELTA_CATEGORY}: {report['delta_prefixes']} prefixes")
+    else:
+        print(f"  ✓ {whitelist_name} vs {upstream_name}: {report['covered']} of {report['rules']} rules "
+              f"covered upstream, {report['redundant']} redundant within the whitelist, "
+              f"{report['uncomparable']} keyword/regexp kept")
+        print(f"  ✓ {DELTA_CATEGORY}: {report['delta_rules']} rules")
+
+
+def write_overlap_report(path, kind, whitelist_name, upstream_name, report):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'kind': kind, 'whitelist': whitelist_name, 'upstream': upstream_name,
+                   'delta_category': DELTA_CATEGORY, **report}, f, indent=2)
+        f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report overlap between a whitelist and an upstream category')
+    parser.add_argument('kind', choices=['geosite', 'geoip'], help='Type of the .dat file')
+    parser.add_argument('dat', help='Path to geosite.dat or geoip.dat')
+    parser.add_argument('--whitelist', default='WHITELIST', help='Whitelist category')
+    parser.add_argument('--upstream', help='Upstream category (default: category-ru / ru)')
+    parser.add_argument('--output', help='Write the overlap report JSON here')
+    args = parser.parse_args()
+
+    dat_list = common_pb2.GeoSiteList() if args.kind == 'geosite' else common_pb2.GeoIPList()
+    dat_list.ParseFromString(Path(args.dat).read_bytes())
+    upstream_name = args.upstream or ('category-ru' if args.kind == 'geosite' else 'ru')
+    whitelist = find_entry(dat_list.entry, args.whitelist)
+    upstream = find_entry(dat_list.entry, upstream_name)
+    if whitelist is None or upstream is None:
+        print(f"Error: category {args.whitelist if whitelist is None else upstream_name} not found in {args.dat}")
+        return 1
+
+    subtract = subtract_domains if args.kind == 'geosite' else subtract_cidrs
+    _, report = subtract(whitelist, upstream)
+    print_overlap(args.kind, args.whitelist, upstream_name, report)
+    if args.output:
+        write_overlap_report(args.output, args.kind, args.whitelist, upstream_name, report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())